@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Pool of Playwright browser contexts for the downloader's --use-browser mode.
+
+One Chromium instance is launched with ``size`` isolated contexts, each
+holding a single page. Every context intercepts requests and only lets
+through what rendering the guide needs: documents, scripts and XHR/fetch
+from Wowhead's own hosts. Images, fonts, stylesheets, media and all
+third-party (ad and analytics) traffic are aborted.
+
+A page is captured as soon as ``ready_selector`` is present (by default the
+element ``WH.markup.printHtml`` renders the guide body or infobox into),
+instead of sleeping a fixed time after every load; ``ready_timeout_ms`` only
+bounds how long to wait for pages that never render it. Such a page (an
+interstitial or soft block) raises PageNotReady, and an HTTP error status
+raises urllib.error.HTTPError like urlopen does, so callers retry both
+instead of storing them; Playwright's own errors (navigation timeouts,
+net::ERR_*) surface as urllib.error.URLError.
+
+Playwright runs on its own event loop in a background thread, so the pool
+serves both the sequential downloader (``fetch``) and the asyncio one
+(``fetch_async``), where up to ``size`` pages render at the same time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import http.client
+import threading
+import urllib.error
+import urllib.parse
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from playwright.async_api import Error as PlaywrightError
+    from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+    from playwright.async_api import async_playwright
+    PLAYWRIGHT_AVAILABLE = True
+except ImportError:
+    async_playwright = None  # type: ignore[assignment]
+    PlaywrightError = Exception  # type: ignore[misc, assignment]
+    PlaywrightTimeoutError = TimeoutError  # type: ignore[misc, assignment]
+    PLAYWRIGHT_AVAILABLE = False
+
+DEFAULT_CONTEXTS = 4
+DEFAULT_READY_SELECTOR = "#guide-body > *, #infobox-contents-0 > *"
+NAVIGATION_TIMEOUT_MS = 60000
+
+ALLOWED_RESOURCE_TYPES = {"document", "script", "xhr", "fetch"}
+# www.wowhead.com serves the pages; wow.zamimg.com serves Wowhead's own scripts.
+ALLOWED_HOST_SUFFIXES = ("wowhead.com", "zamimg.com")
+
+
+class PageNotReady(Exception):
+    """A page that never rendered ``ready_selector`` within ``ready_timeout_ms``."""
+
+
+@dataclass
+class BrowserPage:
+    html: str
+    status: int
+    headers: Dict[str, str] = field(default_factory=dict)
+    connect_seconds: Optional[float] = None
+    ttfb_seconds: Optional[float] = None
+
+
+def document_timings(response: Any) -> Tuple[Optional[float], Optional[float]]:
+    """(connect, time to first byte) in seconds for a navigation response, from Resource Timing."""
+    if response is None:
+        return None, None
+    timing = response.request.timing
+    connect = None
+    if timing.get("connectStart", -1) >= 0 and timing.get("connectEnd", -1) >= 0:
+        connect = (timing["connectEnd"] - timing["connectStart"]) / 1000.0
+    ttfb = None
+    if timing.get("requestStart", -1) >= 0 and timing.get("responseStart", -1) >= 0:
+        ttfb = (timing["responseStart"] - timing["requestStart"]) / 1000.0
+    return connect, ttfb
+
+
+def http_error(url: str, page: BrowserPage) -> urllib.error.HTTPError:
+    """The HTTPError urlopen would have raised for ``page``'s status, headers (Retry-After) included."""
+    headers = http.client.HTTPMessage()
+    for name, value in page.headers.items():
+        headers[name] = value
+    return urllib.error.HTTPError(url, page.status, f"HTTP {page.status}", headers, None)
+
+
+def is_allowed_request(resource_type: str, url: str) -> bool:
+    if resource_type not in ALLOWED_RESOURCE_TYPES:
+        return False
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    return any(host == suffix or host.endswith("." + suffix) for suffix in ALLOWED_HOST_SUFFIXES)
+
+
+class BrowserPool:
+    """``size`` Chromium contexts with resource blocking, shared across threads and event loops."""
+
+    def __init__(
+        self,
+        size: int = DEFAULT_CONTEXTS,
+        ready_selector: str = DEFAULT_READY_SELECTOR,
+        ready_timeout_ms: int = 3000,
+        block_resources: bool = True,
+    ) -> None:
+        if not PLAYWRIGHT_AVAILABLE:
+            raise RuntimeError(
+                "--use-browser requires playwright. Install with: pip install playwright && playwright install chromium"
+            )
+        self.size = size
+        self.ready_selector = ready_selector
+        self.ready_timeout_ms = ready_timeout_ms
+        self.block_resources = block_resources
+        self.pages_loaded = 0
+        self.ready_timeouts = 0
+        self.requests_blocked = 0
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+        self._playwright: Any = None
+        self._browser: Any = None
+        # Each entry is a context and its open page, or None once that page had to
+        # be closed; the next fetch in the context opens a fresh one.
+        self._idle: Optional["asyncio.Queue[Tuple[Any, Any]]"] = None
+        self._run(self._start())
+
+    def _run(self, coro: Any) -> Any:
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    async def _route(self, route: Any) -> None:
+        request = route.request
+        if is_allowed_request(request.resource_type, request.url):
+            await route.continue_()
+            return
+        self.requests_blocked += 1
+        await route.abort()
+
+    async def _new_page(self, context: Any) -> Any:
+        page = await context.new_page()
+        page.set_default_navigation_timeout(NAVIGATION_TIMEOUT_MS)
+        return page
+
+    async def _start(self) -> None:
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._idle = asyncio.Queue()
+        for _ in range(self.size):
+            context = await self._browser.new_context()
+            if self.block_resources:
+                await context.route("**/*", self._route)
+            self._idle.put_nowait((context, await self._new_page(context)))
+
+    async def _fetch(self, url: str) -> BrowserPage:
+        assert self._idle is not None
+        context, page = await self._idle.get()
+        try:
+            if page is None:
+                page = await self._new_page(context)
+            response = await page.goto(url, wait_until="domcontentloaded")
+            status = response.status if response is not None else 200
+            # Error pages never render the guide body; do not wait for it.
+            ready = status < 400
+            if ready:
+                try:
+                    await page.wait_for_selector(self.ready_selector, state="attached", timeout=self.ready_timeout_ms)
+                except PlaywrightTimeoutError:
+                    ready = False
+                    self.ready_timeouts += 1
+            self.pages_loaded += 1
+            connect, ttfb = document_timings(response)
+            loaded = BrowserPage(
+                html=await page.content(),
+                status=status,
+                headers=dict(response.headers) if response is not None else {},
+                connect_seconds=connect,
+                ttfb_seconds=ttfb,
+            )
+        except BaseException as exc:
+            # A failed navigation can leave the page mid-load; never hand it out again.
+            broken, page = page, None
+            if broken is not None:
+                with contextlib.suppress(Exception):
+                    await broken.close()
+            if PLAYWRIGHT_AVAILABLE and isinstance(exc, PlaywrightError):
+                # Navigation timeouts and net::ERR_* failures are transport errors,
+                # retried like the ones urlopen raises.
+                raise urllib.error.URLError(f"browser: {exc}") from exc
+            raise
+        finally:
+            self._idle.put_nowait((context, page))
+        # The page itself loaded fine and stays in the pool; only its content is unusable.
+        if loaded.status >= 400:
+            raise http_error(url, loaded)
+        if not ready:
+            raise PageNotReady(f"{self.ready_selector!r} not rendered within {self.ready_timeout_ms} ms")
+        return loaded
+
+    def fetch(self, url: str) -> BrowserPage:
+        """Load ``url`` in the next free context and return the rendered page.
+
+        Raises urllib.error.HTTPError for a 4xx/5xx status, PageNotReady
+        for a page that never rendered the ready selector and
+        urllib.error.URLError when the browser could not load it at all.
+        """
+        return self._run(self._fetch(url))
+
+    async def fetch_async(self, url: str) -> BrowserPage:
+        """``fetch`` for callers running their own event loop."""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._fetch(url), self._loop))
+
+    def describe(self) -> str:
+        text = f"{self.pages_loaded} pages in {self.size} contexts, {self.requests_blocked} requests blocked"
+        if self.ready_timeouts:
+            text += f", {self.ready_timeouts} never showed the guide body"
+        return text
+
+    async def _stop(self) -> None:
+        if self._browser is not None:
+            await self._browser.close()
+        if self._playwright is not None:
+            await self._playwright.stop()
+
+    def close(self) -> None:
+        try:
+            self._run(self._stop())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
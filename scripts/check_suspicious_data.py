@@ -6,12 +6,17 @@ from __future__ import annotations
 import argparse
 import json
 import pathlib
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
-from parse_wowhead_html import build_spec_phase_paths, merge_slot_maps, parse_guide_slots
+from corpus_db import CorpusDB
+from manifest_store import load_manifest
+from parse_wowhead_html import build_spec_phase_paths, guide_slots, merge_slot_maps
 
 
 CORE_SLOTS = {1, 3, 5, 7, 10, 16}
+DEFAULT_MIN_SLOT_COUNT = 14
+DEFAULT_MAX_SLOT_DROP = 2
+DEFAULT_MAX_RANK_DROP_PCT = 0.35
 
 
 def summarize_phase(slot_map: Dict[int, List[int]]) -> Tuple[int, int, int]:
@@ -27,6 +32,7 @@ def check_spec(
     min_slot_count: int,
     max_slot_drop: int,
     max_rank_drop_pct: float,
+    corpus: Optional[CorpusDB] = None,
 ) -> List[Dict]:
     findings: List[Dict] = []
     phase_paths = build_spec_phase_paths(spec_blob)
@@ -46,8 +52,8 @@ def check_spec(
                 }
             )
             continue
-        full = downloads_root / rel
-        if not full.exists():
+        parsed = guide_slots(downloads_root, rel, corpus)
+        if parsed is None:
             findings.append(
                 {
                     "severity": "high",
@@ -58,7 +64,7 @@ def check_spec(
             )
             continue
 
-        slot_map = parse_guide_slots(full)
+        slot_map = parsed
         if phase > 1:
             slot_map = merge_slot_maps(prev_slot_map, slot_map)
         phase_maps[phase] = slot_map
@@ -148,16 +154,21 @@ def main() -> int:
     parser = argparse.ArgumentParser(description="Check generated BiScore data for suspicious patterns.")
     parser.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
     parser.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis")
-    parser.add_argument("--min-slot-count", type=int, default=14)
-    parser.add_argument("--max-slot-drop", type=int, default=2)
-    parser.add_argument("--max-rank-drop-pct", type=float, default=0.35)
+    parser.add_argument("--min-slot-count", type=int, default=DEFAULT_MIN_SLOT_COUNT)
+    parser.add_argument("--max-slot-drop", type=int, default=DEFAULT_MAX_SLOT_DROP)
+    parser.add_argument("--max-rank-drop-pct", type=float, default=DEFAULT_MAX_RANK_DROP_PCT)
     parser.add_argument("--only-class", default=None, help="Filter by class slug in spec_key, e.g. paladin")
     parser.add_argument("--json", action="store_true", help="Output JSON")
+    parser.add_argument(
+        "--corpus-db",
+        default=None,
+        help="Read the manifest and pages from this SQLite corpus (scripts/corpus_db.py) instead of --manifest/--downloads-root.",
+    )
     args = parser.parse_args()
 
-    manifest_path = pathlib.Path(args.manifest)
     downloads_root = pathlib.Path(args.downloads_root)
-    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    corpus = CorpusDB(pathlib.Path(args.corpus_db)) if args.corpus_db else None
+    manifest = corpus.manifest() if corpus is not None else load_manifest(pathlib.Path(args.manifest))
 
     out: List[Dict] = []
     for spec_blob in manifest.get("specs", []):
@@ -171,8 +182,11 @@ def main() -> int:
                 min_slot_count=args.min_slot_count,
                 max_slot_drop=args.max_slot_drop,
                 max_rank_drop_pct=args.max_rank_drop_pct,
+                corpus=corpus,
             )
         )
+    if corpus is not None:
+        corpus.close()
 
     if args.json:
         print(json.dumps(out, indent=2))
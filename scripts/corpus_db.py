@@ -0,0 +1,467 @@
+#!/usr/bin/env python3
+"""Single-file SQLite corpus: downloaded pages, their manifest and cached extractions.
+
+``corpus.sqlite`` can stand in for the downloads directory plus manifest.json.
+The downloader writes into it with ``--corpus-db`` and the parser, checker
+and extractor read from it with ``--corpus-db``:
+
+* ``bodies``: every distinct page body once, keyed by the SHA-256 of its
+  uncompressed bytes and stored gzip/zstd-compressed (corpus_store.encode_page);
+* ``paths``: the manifest ``local_path`` each body is known under, so scripts
+  keep addressing pages exactly as they do in a download tree;
+* ``pages``: one row per URL with its category, entity type/id (item=,
+  spell=, skill= pages), body, HTTP validators, fetch time and markup
+  fingerprint, indexed by category and entity;
+* ``specs`` and ``spec_pages``: the manifest's spec entries and each spec's
+  page records in manifest order, indexed by spec and category; the
+  manifest's run-level fields (and the manifest it replaced) live in ``meta``;
+* ``extractions``: results computed from a body (parsed slot maps, extracted
+  IDs) keyed by body digest and a versioned kind, so an unchanged page is
+  parsed once no matter how many runs or specs read it.
+
+Saving a manifest drops the ``paths`` and ``pages`` rows it no longer
+references (the index page excepted), then prunes bodies no ``local_path``
+points at any more (a refetched page whose ads or timestamps changed
+replaces its old body, a page that left the manifest takes its body along)
+and the extractions cached for them, so the file stays about one corpus in
+size across refreshes. SQLite reuses the freed pages; ``prune`` also runs VACUUM
+to hand the space back to the filesystem.
+
+``CorpusDB.manifest()`` returns the same dict ``load_manifest()`` does and
+``read_page()`` the same text ``read_page_text()`` does, so the tools only
+choose where pages come from. ``export`` writes a download tree plus
+manifest.json back out (e.g. for rename_downloaded_guides_for_windows.py);
+``import`` loads an existing one.
+
+Usage:
+  python3 scripts/corpus_db.py import --manifest downloads/wowhead_tbc_bis/manifest.json --db downloads/wowhead_tbc_bis/corpus.sqlite
+  python3 scripts/corpus_db.py export --db downloads/wowhead_tbc_bis/corpus.sqlite --output-dir /tmp/wowhead_tbc_bis
+  python3 scripts/corpus_db.py stats --db downloads/wowhead_tbc_bis/corpus.sqlite
+  python3 scripts/corpus_db.py prune --db downloads/wowhead_tbc_bis/corpus.sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import pathlib
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from corpus_store import (
+    atomic_write_bytes,
+    compression_for_path,
+    content_digest,
+    decode_page_bytes,
+    encode_page,
+    link_into_spec_dir,
+    read_page_bytes,
+    resolve_compression,
+)
+from manifest_store import FINGERPRINT_KEY, INDEX_KEY, MANIFEST_FILE_NAME, load_manifest, save_manifest
+
+CORPUS_DB_NAME = "corpus.sqlite"
+CORPUS_FORMAT = "biscore-corpus-db/1"
+DEFAULT_DB_COMPRESSION = "gzip"
+INDEX_PAGE_PATH = "index.html"
+
+ENTITY_PATTERN = re.compile(r"/tbc/(item|spell|skill)=(\d+)", re.I)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS bodies (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS paths (
+    local_path TEXT PRIMARY KEY,
+    digest TEXT NOT NULL REFERENCES bodies (digest)
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    category TEXT,
+    entity_type TEXT,
+    entity_id INTEGER,
+    digest TEXT NOT NULL REFERENCES bodies (digest),
+    etag TEXT,
+    last_modified TEXT,
+    content_length INTEGER,
+    fetched_at_epoch INTEGER,
+    markup_fingerprint TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_by_category ON pages (category);
+CREATE INDEX IF NOT EXISTS pages_by_entity ON pages (entity_type, entity_id);
+CREATE TABLE IF NOT EXISTS specs (
+    position INTEGER PRIMARY KEY,
+    spec_key TEXT,
+    entry TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS spec_pages (
+    spec_position INTEGER NOT NULL REFERENCES specs (position),
+    position INTEGER NOT NULL,
+    spec_key TEXT,
+    category TEXT,
+    url TEXT,
+    local_path TEXT,
+    record TEXT NOT NULL,
+    PRIMARY KEY (spec_position, position)
+);
+CREATE INDEX IF NOT EXISTS spec_pages_by_spec ON spec_pages (spec_key, category);
+CREATE INDEX IF NOT EXISTS spec_pages_by_category ON spec_pages (category);
+CREATE INDEX IF NOT EXISTS spec_pages_by_url ON spec_pages (url);
+CREATE TABLE IF NOT EXISTS extractions (
+    digest TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    result TEXT NOT NULL,
+    PRIMARY KEY (digest, kind)
+);
+"""
+
+
+def entity_of(url: str) -> Tuple[Optional[str], Optional[int]]:
+    """(entity type, id) of an item=/spell=/skill= URL, else (None, None)."""
+    m = ENTITY_PATTERN.search(url or "")
+    if not m:
+        return None, None
+    return m.group(1).lower(), int(m.group(2))
+
+
+class CorpusDB:
+    """Connection to a corpus database, safe to share between threads."""
+
+    def __init__(self, path: pathlib.Path, compression: Optional[str] = DEFAULT_DB_COMPRESSION) -> None:
+        self.path = path
+        self.compression = compression
+        self._lock = threading.RLock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.executescript(SCHEMA)
+        with self.transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+            if row is None:
+                db.execute("INSERT INTO meta (key, value) VALUES ('format', ?)", (CORPUS_FORMAT,))
+            elif row["value"] != CORPUS_FORMAT:
+                raise ValueError(f"{path} is not a {CORPUS_FORMAT} database")
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in a write transaction (re-entrant within this connection)."""
+        with self._lock:
+            if self._db.in_transaction:
+                yield self._db
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _query(self, sql: str, params: Tuple[Any, ...] = ()) -> List[sqlite3.Row]:
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # Pages
+
+    def put_page(self, local_path: str, data: bytes, record: Optional[Dict[str, Any]] = None) -> str:
+        """Store a page body under ``local_path`` and, given its manifest record, its URL row; return the digest."""
+        digest = content_digest(data)
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM bodies WHERE digest = ?", (digest,)).fetchone() is None:
+                db.execute(
+                    "INSERT INTO bodies (digest, size, body) VALUES (?, ?, ?)",
+                    (digest, len(data), encode_page(data, self.compression)),
+                )
+            db.execute("INSERT OR REPLACE INTO paths (local_path, digest) VALUES (?, ?)", (local_path, digest))
+            if record is not None and record.get("url"):
+                self._put_url(db, record, digest)
+        return digest
+
+    @staticmethod
+    def _put_url(db: sqlite3.Connection, record: Dict[str, Any], digest: str) -> None:
+        entity_type, entity_id = entity_of(record["url"])
+        db.execute(
+            "INSERT OR REPLACE INTO pages (url, category, entity_type, entity_id, digest, etag, last_modified, "
+            "content_length, fetched_at_epoch, markup_fingerprint) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                record["url"],
+                record.get("category"),
+                entity_type,
+                entity_id,
+                digest,
+                record.get("etag"),
+                record.get("last_modified"),
+                record.get("content_length"),
+                record.get("fetched_at_epoch"),
+                record.get(FINGERPRINT_KEY),
+            ),
+        )
+
+    def page_digest(self, local_path: str) -> Optional[str]:
+        rows = self._query("SELECT digest FROM paths WHERE local_path = ?", (local_path,))
+        return rows[0]["digest"] if rows else None
+
+    def has_page(self, local_path: str) -> bool:
+        return self.page_digest(local_path) is not None
+
+    def read_bytes(self, local_path: str) -> bytes:
+        rows = self._query(
+            "SELECT body FROM bodies JOIN paths USING (digest) WHERE paths.local_path = ?", (local_path,)
+        )
+        if not rows:
+            raise FileNotFoundError(f"{local_path} is not in {self.path}")
+        return decode_page_bytes(rows[0]["body"])
+
+    def read_page(self, local_path: str) -> str:
+        """Page text, as read_page_text() would return it from a download tree."""
+        return self.read_bytes(local_path).decode("utf-8", errors="replace")
+
+    def local_paths(self) -> List[str]:
+        return [row["local_path"] for row in self._query("SELECT local_path FROM paths ORDER BY local_path")]
+
+    def find_pages(
+        self,
+        spec_key: Optional[str] = None,
+        category: Optional[str] = None,
+        entity: Optional[Tuple[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Manifest page records matching every given filter, in spec and manifest order."""
+        sql = "SELECT spec_pages.record FROM spec_pages"
+        where: List[str] = []
+        params: List[Any] = []
+        if entity is not None:
+            sql += " JOIN pages USING (url)"
+            where.append("pages.entity_type = ? AND pages.entity_id = ?")
+            params.extend(entity)
+        if spec_key is not None:
+            where.append("spec_pages.spec_key = ?")
+            params.append(spec_key)
+        if category is not None:
+            where.append("spec_pages.category = ?")
+            params.append(category)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY spec_pages.spec_position, spec_pages.position"
+        return [json.loads(row["record"]) for row in self._query(sql, tuple(params))]
+
+    # Manifest
+
+    def has_manifest(self) -> bool:
+        return bool(self._query("SELECT 1 FROM meta WHERE key = 'manifest'"))
+
+    def save_manifest(self, manifest: Dict[str, Any]) -> Dict[str, int]:
+        """Replace the stored manifest (the old one stays available as previous_manifest()), then prune().
+
+        Paths and URLs the new manifest does not reference are removed first,
+        except the index page, so prune() frees their bodies. Returns prune()'s
+        counts plus the removed ``paths`` and ``pages`` rows.
+        """
+        with self.transaction() as db:
+            if self.has_manifest():
+                db.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('previous_manifest', ?)",
+                    (json.dumps(self.manifest(), ensure_ascii=False),),
+                )
+            top = {k: v for k, v in manifest.items() if k != "specs"}
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('manifest', ?)", (json.dumps(top),))
+            db.execute("DELETE FROM specs")
+            db.execute("DELETE FROM spec_pages")
+            for position, spec in enumerate(manifest.get("specs", [])):
+                entry = {k: v for k, v in spec.items() if k not in {"downloaded_pages", INDEX_KEY}}
+                db.execute(
+                    "INSERT INTO specs (position, spec_key, entry) VALUES (?, ?, ?)",
+                    (position, spec.get("spec_key"), json.dumps(entry, ensure_ascii=False)),
+                )
+                for page_position, page in enumerate(spec.get("downloaded_pages", [])):
+                    db.execute(
+                        "INSERT INTO spec_pages (spec_position, position, spec_key, category, url, local_path, record) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            position,
+                            page_position,
+                            spec.get("spec_key"),
+                            page.get("category"),
+                            page.get("url"),
+                            page.get("local_path"),
+                            json.dumps(page, ensure_ascii=False),
+                        ),
+                    )
+                    digest = self.page_digest(page.get("local_path") or "")
+                    if digest is not None and page.get("url"):
+                        self._put_url(db, page, digest)
+            paths = db.execute(
+                "DELETE FROM paths WHERE local_path != ? AND local_path NOT IN "
+                "(SELECT local_path FROM spec_pages WHERE local_path IS NOT NULL)",
+                (INDEX_PAGE_PATH,),
+            ).rowcount
+            pages = db.execute(
+                "DELETE FROM pages WHERE url NOT IN (SELECT url FROM spec_pages WHERE url IS NOT NULL)"
+            ).rowcount
+            counts = self.prune()
+        counts.update(paths=paths, pages=pages)
+        return counts
+
+    def prune(self) -> Dict[str, int]:
+        """Delete bodies no local_path points at and the extractions cached for them; return the counts."""
+        with self.transaction() as db:
+            bodies = db.execute("DELETE FROM bodies WHERE digest NOT IN (SELECT digest FROM paths)").rowcount
+            extractions = db.execute(
+                "DELETE FROM extractions WHERE digest NOT IN (SELECT digest FROM bodies)"
+            ).rowcount
+        return {"bodies": bodies, "extractions": extractions}
+
+    def vacuum(self) -> None:
+        """Rewrite the file without the space deleted rows left behind."""
+        with self._lock:
+            self._db.execute("VACUUM")
+
+    def manifest(self) -> Dict[str, Any]:
+        """The stored manifest, in the form load_manifest() returns."""
+        rows = self._query("SELECT value FROM meta WHERE key = 'manifest'")
+        top: Dict[str, Any] = json.loads(rows[0]["value"]) if rows else {}
+        pages: Dict[int, List[Dict[str, Any]]] = {}
+        for row in self._query("SELECT spec_position, record FROM spec_pages ORDER BY spec_position, position"):
+            pages.setdefault(row["spec_position"], []).append(json.loads(row["record"]))
+        specs = []
+        for row in self._query("SELECT position, entry FROM specs ORDER BY position"):
+            spec = json.loads(row["entry"])
+            spec["downloaded_pages"] = pages.get(row["position"], [])
+            specs.append(spec)
+        top["specs"] = specs
+        return top
+
+    def previous_manifest(self) -> Optional[Dict[str, Any]]:
+        """The manifest the last save_manifest() replaced, if any."""
+        rows = self._query("SELECT value FROM meta WHERE key = 'previous_manifest'")
+        return json.loads(rows[0]["value"]) if rows else None
+
+    # Extraction cache
+
+    def cached(self, digest: str, kind: str) -> Optional[Any]:
+        rows = self._query("SELECT result FROM extractions WHERE digest = ? AND kind = ?", (digest, kind))
+        return json.loads(rows[0]["result"]) if rows else None
+
+    def cache(self, digest: str, kind: str, result: Any) -> None:
+        with self.transaction() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO extractions (digest, kind, result) VALUES (?, ?, ?)",
+                (digest, kind, json.dumps(result)),
+            )
+
+    def counts(self) -> Dict[str, int]:
+        out = {}
+        for table in ("bodies", "paths", "pages", "specs", "spec_pages", "extractions"):
+            out[table] = self._query(f"SELECT COUNT(*) AS n FROM {table}")[0]["n"]  # noqa: S608
+        out["body_bytes"] = self._query("SELECT COALESCE(SUM(size), 0) AS n FROM bodies")[0]["n"]
+        out["stored_bytes"] = self._query("SELECT COALESCE(SUM(LENGTH(body)), 0) AS n FROM bodies")[0]["n"]
+        return out
+
+
+def import_tree(db: CorpusDB, manifest: Dict[str, Any], downloads_root: pathlib.Path) -> Tuple[int, int]:
+    """Load a download tree and its manifest into ``db``; return (pages stored, missing files)."""
+    stored = 0
+    missing = 0
+    with db.transaction():
+        if (downloads_root / INDEX_PAGE_PATH).is_file():
+            db.put_page(INDEX_PAGE_PATH, read_page_bytes(downloads_root / INDEX_PAGE_PATH))
+        for spec in manifest.get("specs", []):
+            for page in spec.get("downloaded_pages", []):
+                local_path = page.get("local_path")
+                if not local_path or db.has_page(local_path):
+                    continue
+                source = downloads_root / local_path
+                if not source.is_file():
+                    missing += 1
+                    continue
+                db.put_page(local_path, read_page_bytes(source), page)
+                stored += 1
+        db.save_manifest(manifest)
+    return stored, missing
+
+
+def export_tree(db: CorpusDB, output_dir: pathlib.Path) -> int:
+    """Write every stored page to ``output_dir`` at its local_path, plus manifest.json; return files written."""
+    manifest = db.manifest()
+    written = 0
+    for local_path in db.local_paths():
+        data = db.read_bytes(local_path)
+        atomic_write_bytes(output_dir / local_path, encode_page(data, compression_for_path(local_path)))
+        written += 1
+    for spec in manifest.get("specs", []):
+        for page in spec.get("downloaded_pages", []):
+            if page.get("spec_path") and page.get("local_path") and db.has_page(page["local_path"]):
+                link_into_spec_dir(output_dir, page["local_path"], page["spec_path"])
+    save_manifest(output_dir / MANIFEST_FILE_NAME, manifest)
+    return written
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manage the SQLite corpus database.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="Load a download tree and its manifest into the database.")
+    imp.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
+    imp.add_argument("--downloads-root", default=None, help="Defaults to the manifest's directory.")
+    imp.add_argument("--db", default=f"downloads/wowhead_tbc_bis/{CORPUS_DB_NAME}")
+    imp.add_argument(
+        "--compression",
+        choices=["auto", "gzip", "zstd"],
+        default=DEFAULT_DB_COMPRESSION,
+        help="Codec for stored bodies; auto picks zstd when zstandard is installed, else gzip.",
+    )
+    exp = sub.add_parser("export", help="Write the stored pages and manifest.json out as a download tree.")
+    exp.add_argument("--db", default=f"downloads/wowhead_tbc_bis/{CORPUS_DB_NAME}")
+    exp.add_argument("--output-dir", required=True)
+    stats = sub.add_parser("stats", help="Show table sizes.")
+    stats.add_argument("--db", default=f"downloads/wowhead_tbc_bis/{CORPUS_DB_NAME}")
+    prune = sub.add_parser(
+        "prune", help="Delete bodies and cached extractions no stored page refers to, then VACUUM the file."
+    )
+    prune.add_argument("--db", default=f"downloads/wowhead_tbc_bis/{CORPUS_DB_NAME}")
+    args = parser.parse_args()
+
+    db_path = pathlib.Path(args.db)
+    if args.command != "import" and not db_path.is_file():
+        raise FileNotFoundError(f"Corpus database not found: {db_path}")
+    db = CorpusDB(db_path, resolve_compression(args.compression) if args.command == "import" else None)
+    try:
+        if args.command == "import":
+            manifest_path = pathlib.Path(args.manifest)
+            downloads_root = pathlib.Path(args.downloads_root) if args.downloads_root else manifest_path.parent
+            stored, missing = import_tree(db, load_manifest(manifest_path), downloads_root)
+            print(f"Imported {stored} pages into {db_path} (missing_sources={missing})")
+        elif args.command == "export":
+            written = export_tree(db, pathlib.Path(args.output_dir))
+            print(f"Exported {written} pages and {MANIFEST_FILE_NAME} to {args.output_dir}")
+        elif args.command == "prune":
+            size_before = db_path.stat().st_size
+            pruned = db.prune()
+            db.vacuum()
+            print(
+                f"Pruned {pruned['bodies']} bodies and {pruned['extractions']} cached extractions; "
+                f"{db_path} went from {size_before / 1e6:.1f} MB to {db_path.stat().st_size / 1e6:.1f} MB"
+            )
+        else:
+            counts = db.counts()
+            print(
+                f"{counts['specs']} specs, {counts['spec_pages']} manifest pages, {counts['pages']} URLs, "
+                f"{counts['paths']} paths, {counts['bodies']} distinct bodies "
+                f"({counts['body_bytes'] / 1e6:.1f} MB, {counts['stored_bytes'] / 1e6:.1f} MB stored), "
+                f"{counts['extractions']} cached extractions"
+            )
+    finally:
+        db.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
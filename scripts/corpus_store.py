@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+"""Content-addressed storage for downloaded Wowhead pages.
+
+The same gem, enchant and shared-guide pages are linked from many specs, so a
+plain per-spec layout saves hundreds of byte-identical copies. Pages can
+instead be stored once under ``blobs/<aa>/<sha256>.html`` (relative to the
+downloads root) with manifest ``local_path`` entries pointing at the blob. An
+optional per-spec hardlink keeps the old ``<spec>/<file>.html`` paths working
+for tools and people that browse the tree by folder. A refetched page whose
+body changed gets a new blob; ``gc`` (run automatically after each
+``--blob-store`` download) deletes the blobs that neither the manifest nor
+the one it replaced (manifest.previous.json) points at, so a page a run
+failed to refetch keeps its last good copy for one more run.
+
+Pages may also be stored compressed (``.html.gz``, or ``.html.zst`` when the
+``zstandard`` package is installed). Readers should go through
+``read_page_text()`` and ``page_key()`` so they work with any layout and
+encoding (compression is detected from magic bytes, not the file name) and
+can skip duplicate content cheaply.
+
+Downloads made with ``--slim`` store a compact JSON record per page
+(``<name>.slim.json``) instead of the full HTML; ``load_slim_record()``
+recognises one and returns its fields.
+
+Usage:
+  python3 scripts/corpus_store.py migrate --hardlinks
+  python3 scripts/corpus_store.py migrate --dry-run
+  python3 scripts/corpus_store.py compress --compression auto
+  python3 scripts/corpus_store.py gc --dry-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from manifest_store import PREVIOUS_MANIFEST_NAME, load_manifest, save_manifest
+
+try:
+    import zstandard
+except ModuleNotFoundError:
+    zstandard = None  # type: ignore[assignment]
+
+BLOB_DIR_NAME = "blobs"
+BLOB_SUFFIX = ".html"
+SLIM_SUFFIX = ".slim.json"
+SLIM_FORMAT = "biscore-slim-page/1"
+XML_SUFFIX = ".xml"
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+PAGE_SUFFIXES = tuple(
+    base + compressed
+    for base in (BLOB_SUFFIX, SLIM_SUFFIX)
+    for compressed in ("", *COMPRESSION_SUFFIXES.values())
+)
+# Blobs may also hold Wowhead ?xml tooltip documents (downloader --item-xml).
+BLOB_SUFFIXES = PAGE_SUFFIXES + tuple(XML_SUFFIX + c for c in ("", *COMPRESSION_SUFFIXES.values()))
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def resolve_compression(name: Optional[str]) -> Optional[str]:
+    """Map a --compress choice to "gzip", "zstd" or None ("auto" prefers zstd)."""
+    if not name or name == "none":
+        return None
+    if name == "auto":
+        return "zstd" if zstandard is not None else "gzip"
+    if name == "zstd" and zstandard is None:
+        raise RuntimeError("zstd compression requires zstandard. Install with: pip install zstandard")
+    if name not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown compression: {name}")
+    return name
+
+
+def compression_suffix(path: "pathlib.Path | str") -> str:
+    """Return ".gz"/".zst" for compressed page paths, else ""."""
+    name = pathlib.PurePath(path).name
+    for suffix in COMPRESSION_SUFFIXES.values():
+        if name.endswith(suffix):
+            return suffix
+    return ""
+
+
+def compression_for_path(path: "pathlib.Path | str") -> Optional[str]:
+    suffix = compression_suffix(path)
+    for name, candidate in COMPRESSION_SUFFIXES.items():
+        if suffix and suffix == candidate:
+            return name
+    return None
+
+
+def base_page_suffix(path: "pathlib.Path | str") -> str:
+    """Return ".slim.json", ".xml" or ".html" for a stored file, ignoring any compression suffix."""
+    name = pathlib.PurePath(path).name
+    name = name[: len(name) - len(compression_suffix(name))]
+    for suffix in (SLIM_SUFFIX, XML_SUFFIX):
+        if name.endswith(suffix):
+            return suffix
+    return BLOB_SUFFIX
+
+
+def encode_page(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == "gzip":
+        # mtime=0 keeps output deterministic for identical pages.
+        return gzip.compress(data, compresslevel=6, mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return data
+
+
+def decode_page_bytes(data: bytes) -> bytes:
+    """Undo whatever compression ``data`` carries, detected by magic bytes."""
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError("Page is zstd-compressed; install zstandard to read it: pip install zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def read_page_bytes(path: pathlib.Path) -> bytes:
+    return decode_page_bytes(path.read_bytes())
+
+
+def iter_page_files(root: pathlib.Path) -> List[pathlib.Path]:
+    """All stored pages under ``root`` (plain or compressed), sorted."""
+    return sorted(p for p in root.rglob("*") if p.is_file() and p.name.endswith(PAGE_SUFFIXES))
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def blob_relpath(digest: str, compression: Optional[str] = None, suffix: str = BLOB_SUFFIX) -> str:
+    compressed = COMPRESSION_SUFFIXES.get(compression or "", "")
+    return f"{BLOB_DIR_NAME}/{digest[:2]}/{digest}{suffix}{compressed}"
+
+
+def blob_digest(path: "pathlib.Path | str") -> Optional[str]:
+    """Return the content hash encoded in a blob path, or None for other paths."""
+    p = pathlib.PurePath(path)
+    if len(p.parts) < 3 or p.parts[-3] != BLOB_DIR_NAME:
+        return None
+    digest, _, rest = p.name.partition(".")
+    if len(digest) != 64 or "." + rest not in BLOB_SUFFIXES:
+        return None
+    return digest
+
+
+def is_blob_path(path: "pathlib.Path | str") -> bool:
+    return blob_digest(path) is not None
+
+
+def atomic_write_bytes(target: pathlib.Path, data: bytes) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temp file first so concurrent writers of the same file never
+    # leave a truncated file behind.
+    fd, tmp_name = tempfile.mkstemp(dir=target.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(data)
+        os.replace(tmp_name, target)
+    except BaseException:
+        pathlib.Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+
+def write_blob(
+    root: pathlib.Path,
+    data: bytes,
+    compression: Optional[str] = None,
+    suffix: str = BLOB_SUFFIX,
+) -> Tuple[str, bool]:
+    """Store ``data`` under the hash of its uncompressed bytes; return (relative path, created)."""
+    rel = blob_relpath(content_digest(data), compression, suffix)
+    target = root / rel
+    if target.exists():
+        return rel, False
+    atomic_write_bytes(target, encode_page(data, compression))
+    return rel, True
+
+
+def link_into_spec_dir(root: pathlib.Path, blob_rel: str, spec_rel: str) -> None:
+    """Expose a blob at its legacy per-spec path (hardlink, or copy if unsupported)."""
+    blob_path = root / blob_rel
+    spec_path = root / spec_rel
+    spec_path.parent.mkdir(parents=True, exist_ok=True)
+    if spec_path.exists():
+        if os.path.samefile(blob_path, spec_path):
+            return
+        spec_path.unlink()
+    try:
+        os.link(blob_path, spec_path)
+    except OSError:
+        shutil.copyfile(blob_path, spec_path)
+
+
+def read_page_text(path: pathlib.Path) -> str:
+    """Read a stored page regardless of which layout or compression wrote it."""
+    return read_page_bytes(path).decode("utf-8", errors="replace")
+
+
+def load_slim_record(text: str) -> Optional[Dict[str, Any]]:
+    """Return the record if ``text`` is a slim page capture, else None (ordinary HTML)."""
+    if not text.startswith("{"):
+        return None
+    try:
+        record = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(record, dict) or record.get("format") != SLIM_FORMAT:
+        return None
+    return record
+
+
+def page_key(path: pathlib.Path) -> str:
+    """Stable content key for a stored page (hash of the uncompressed body).
+
+    Blob paths already carry their hash in the filename, so only legacy
+    per-spec files need to be read and hashed.
+    """
+    digest = blob_digest(path)
+    if digest is not None:
+        return digest
+    return content_digest(read_page_bytes(path))
+
+
+def migrate_manifest(
+    manifest: Dict,
+    downloads_root: pathlib.Path,
+    hardlinks: bool,
+    dry_run: bool,
+) -> Tuple[int, int, int]:
+    """Move every manifest page into the blob store; return (blobs, deduplicated, missing).
+
+    ``deduplicated`` counts distinct files whose content was already stored.
+    """
+    blobs = 0
+    deduplicated = 0
+    missing = 0
+    # Several manifest entries can share one file, and dry runs never create
+    # blobs, so track what this run has already placed.
+    migrated: Dict[str, str] = {}
+    seen_digests: Set[str] = set()
+    for spec in manifest.get("specs", []):
+        for page in spec.get("downloaded_pages", []):
+            local_path: Optional[str] = page.get("local_path")
+            if not local_path or is_blob_path(local_path):
+                continue
+            rel = migrated.get(local_path)
+            if rel is None:
+                source = downloads_root / local_path
+                if not source.is_file():
+                    missing += 1
+                    continue
+                data = read_page_bytes(source)
+                compression = compression_for_path(local_path)
+                suffix = base_page_suffix(local_path)
+                digest = content_digest(data)
+                rel = blob_relpath(digest, compression, suffix)
+                if digest in seen_digests or (downloads_root / rel).exists():
+                    deduplicated += 1
+                else:
+                    blobs += 1
+                seen_digests.add(digest)
+                if not dry_run:
+                    write_blob(downloads_root, data, compression, suffix)
+                    if hardlinks:
+                        link_into_spec_dir(downloads_root, rel, local_path)
+                    else:
+                        source.unlink()
+                migrated[local_path] = rel
+            page["local_path"] = rel
+            if hardlinks:
+                page["spec_path"] = local_path
+    return blobs, deduplicated, missing
+
+
+def compress_manifest(
+    manifest: Dict,
+    downloads_root: pathlib.Path,
+    compression: str,
+    dry_run: bool,
+) -> Tuple[int, int, int, int]:
+    """Rewrite manifest pages compressed; return (files, bytes_before, bytes_after, missing)."""
+    suffix = COMPRESSION_SUFFIXES[compression]
+    files = 0
+    bytes_before = 0
+    bytes_after = 0
+    missing = 0
+    rewritten: Dict[str, str] = {}
+    for spec in manifest.get("specs", []):
+        for page in spec.get("downloaded_pages", []):
+            local_path: Optional[str] = page.get("local_path")
+            if not local_path or compression_suffix(local_path):
+                continue
+            new_rel = rewritten.get(local_path)
+            if new_rel is None:
+                source = downloads_root / local_path
+                if not source.is_file():
+                    missing += 1
+                    continue
+                raw = source.read_bytes()
+                encoded = encode_page(decode_page_bytes(raw), compression)
+                new_rel = local_path + suffix
+                files += 1
+                bytes_before += len(raw)
+                bytes_after += len(encoded)
+                if not dry_run:
+                    atomic_write_bytes(downloads_root / new_rel, encoded)
+                    source.unlink()
+                rewritten[local_path] = new_rel
+            page["local_path"] = new_rel
+            spec_path = page.get("spec_path")
+            if spec_path and is_blob_path(new_rel) and not compression_suffix(spec_path):
+                if not dry_run:
+                    link_into_spec_dir(downloads_root, new_rel, spec_path + suffix)
+                    (downloads_root / spec_path).unlink(missing_ok=True)
+                page["spec_path"] = spec_path + suffix
+    return files, bytes_before, bytes_after, missing
+
+
+def collect_blob_garbage(manifests: List[Dict], downloads_root: pathlib.Path, dry_run: bool) -> Tuple[int, int]:
+    """Delete blobs no page of any of ``manifests`` points at; return (files, bytes)."""
+    referenced = {
+        page.get("local_path")
+        for manifest in manifests
+        for spec in manifest.get("specs", [])
+        for page in spec.get("downloaded_pages", [])
+    }
+    files = 0
+    freed = 0
+    for path in sorted((downloads_root / BLOB_DIR_NAME).glob("*/*")):
+        rel = path.relative_to(downloads_root).as_posix()
+        if rel in referenced or not is_blob_path(rel) or not path.is_file():
+            continue
+        files += 1
+        freed += path.stat().st_size
+        if not dry_run:
+            path.unlink()
+    return files, freed
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manage the content-addressed page store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Move manifest pages into blobs/ and point local_path at them.")
+    migrate.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
+    migrate.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis")
+    migrate.add_argument(
+        "--hardlinks",
+        action="store_true",
+        help="Keep per-spec paths as hardlinks to the blobs instead of deleting them.",
+    )
+    migrate.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+    compress = sub.add_parser("compress", help="Compress every manifest page in place and update local_path.")
+    compress.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
+    compress.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis")
+    compress.add_argument(
+        "--compression",
+        choices=["auto", "gzip", "zstd"],
+        default="auto",
+        help="Codec to use; auto picks zstd when zstandard is installed, else gzip.",
+    )
+    compress.add_argument("--dry-run", action="store_true", help="Report what would change without writing.")
+    gc = sub.add_parser(
+        "gc", help=f"Delete blobs that neither the manifest nor {PREVIOUS_MANIFEST_NAME} next to it points at."
+    )
+    gc.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
+    gc.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis")
+    gc.add_argument("--dry-run", action="store_true", help="Report what would be deleted without deleting.")
+    args = parser.parse_args()
+
+    manifest_path = pathlib.Path(args.manifest).resolve()
+    downloads_root = pathlib.Path(args.downloads_root).resolve()
+    manifest = load_manifest(manifest_path)
+    mode = "DRY RUN" if args.dry_run else "APPLIED"
+
+    if args.command == "gc":
+        manifests = [manifest]
+        if (manifest_path.parent / PREVIOUS_MANIFEST_NAME).is_file():
+            manifests.append(load_manifest(manifest_path.parent / PREVIOUS_MANIFEST_NAME))
+        files, freed = collect_blob_garbage(manifests, downloads_root, args.dry_run)
+        print(f"[{mode}] unreferenced_blobs={files} bytes={freed}")
+        return 0
+    if args.command == "compress":
+        compression = resolve_compression(args.compression)
+        assert compression is not None
+        files, before, after, missing = compress_manifest(manifest, downloads_root, compression, args.dry_run)
+        summary = (
+            f"[{mode}] compression={compression} files={files} "
+            f"bytes={before}->{after} missing_sources={missing}"
+        )
+    else:
+        blobs, deduplicated, missing = migrate_manifest(manifest, downloads_root, args.hardlinks, args.dry_run)
+        summary = f"[{mode}] blobs={blobs} deduplicated_pages={deduplicated} missing_sources={missing}"
+
+    if not args.dry_run:
+        save_manifest(manifest_path, manifest)
+    print(summary)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""SQLite work queue shared by several downloader processes.
+
+``download_tbc_bis_guides.py --work-queue crawl.sqlite`` can be started any
+number of times, on one machine or on several hosts that share the output
+directory. Every worker registers the crawl's seed URLs (duplicates are
+ignored) and then leases specs one at a time until none are left:
+
+* ``specs``: one row per seed URL with its lease (worker, expiry), the
+  download stage it is at and, once done, the spec's manifest entry. A spec
+  is leased one stage at a time (seed/phase guides, other guides, reference
+  pages), lowest stage first, so every spec's phase guides are fetched
+  before any worker spends requests on a lower-priority stage. A lease that
+  is not renewed expires and the spec goes back to whoever asks next, so a
+  crashed worker only costs the lease time.
+* ``pages``: one row per fetch_key() a worker has claimed. A page is fetched
+  by exactly one worker; everyone else waits for the claim to finish and
+  reads the stored file, and failures are shared like FetchCache failures.
+* ``rate``: the state of the adaptive request pacer, so all workers together
+  stay within one request budget.
+
+Once the last worker has written the merged manifest the crawl is over; the
+next worker to join the same database (the next refresh) clears ``specs`` and
+``pages`` and starts a new crawl instead of finding nothing left to do.
+
+Every change runs in a ``BEGIN IMMEDIATE`` transaction. The database must
+live on a filesystem with working locks (local disk or a share that supports
+POSIX locks), and hosts need roughly synchronised clocks because leases and
+request slots are wall-clock times.
+
+Usage:
+  python3 scripts/crawl_queue.py status --queue downloads/wowhead_tbc_bis/crawl.sqlite
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import json
+import pathlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional
+
+QUEUE_FORMAT = "biscore-crawl-queue/2"
+DEFAULT_LEASE_SECONDS = 300.0
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+# claim_page() outcomes besides DONE/FAILED.
+CLAIMED = "claimed"
+BUSY = "busy"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS workers (
+    number INTEGER PRIMARY KEY AUTOINCREMENT,
+    worker_id TEXT NOT NULL,
+    started_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS specs (
+    seed_url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    stage INTEGER NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    entry TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    fetch_key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    state TEXT NOT NULL,
+    worker_id TEXT,
+    lease_expires REAL,
+    local_path TEXT,
+    response TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS rate (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    interval REAL,
+    next_at REAL NOT NULL DEFAULT 0,
+    last_decrease_at REAL,
+    throttled INTEGER NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO rate (id) VALUES (1);
+"""
+
+
+@dataclass
+class SpecLease:
+    """A spec leased by lease_spec() and the stage this worker is to run (0 = seed/phase guides)."""
+
+    seed_url: str
+    stage: int
+
+
+@dataclass
+class PageClaim:
+    """Result of claim_page(): CLAIMED (fetch it), BUSY (wait), DONE or FAILED."""
+
+    state: str
+    local_path: Optional[str] = None
+    response: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+
+class CrawlQueue:
+    """One worker's connection to the shared queue database."""
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        worker_id: str,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    ) -> None:
+        self.path = path
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._lock = threading.RLock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(path), timeout=60.0, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self.worker_number = 0
+        # executescript() manages its own transaction; every statement is idempotent.
+        self._db.executescript(SCHEMA)
+        with self.transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'format'").fetchone()
+            if row is None:
+                db.execute("INSERT INTO meta (key, value) VALUES ('format', ?)", (QUEUE_FORMAT,))
+            elif row["value"] != QUEUE_FORMAT:
+                raise ValueError(f"{path} is not a {QUEUE_FORMAT} queue")
+
+    def register_worker(self) -> int:
+        """Record this worker and return its number (1, 2, ... in start order)."""
+        with self.transaction() as db:
+            cur = db.execute("INSERT INTO workers (worker_id, started_at) VALUES (?, ?)", (self.worker_id, time.time()))
+        self.worker_number = int(cur.lastrowid)
+        return self.worker_number
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in a write transaction (re-entrant within this worker)."""
+        with self._lock:
+            if self._db.in_transaction:
+                yield self._db
+                return
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    # Specs
+
+    def start_new_crawl_if_merged(self) -> bool:
+        """Clear a crawl whose manifest was already merged so the seeds can be queued again.
+
+        Returns True if the queue held such a finished crawl. Workers still
+        registered keep their numbers, and the shared request pacing carries over.
+        """
+        with self.transaction() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = 'merged_by'").fetchone() is None:
+                return False
+            db.execute("DELETE FROM specs")
+            db.execute("DELETE FROM pages")
+            db.execute("DELETE FROM meta WHERE key = 'merged_by'")
+        return True
+
+    def add_specs(self, seed_urls: List[str]) -> int:
+        """Register the crawl's seeds; return how many were new."""
+        with self.transaction() as db:
+            start = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM specs").fetchone()[0]
+            added = 0
+            for offset, seed_url in enumerate(seed_urls):
+                cur = db.execute(
+                    "INSERT OR IGNORE INTO specs (seed_url, position) VALUES (?, ?)", (seed_url, start + offset)
+                )
+                added += cur.rowcount
+        return added
+
+    def lease_spec(self) -> Optional[SpecLease]:
+        """Lease the pending spec (or one whose lease expired) at the lowest stage; None if there is none."""
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute(
+                "SELECT seed_url, stage FROM specs WHERE state = ? OR (state = ? AND lease_expires < ?) "
+                "ORDER BY stage, position LIMIT 1",
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE specs SET state = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE seed_url = ?",
+                (LEASED, self.worker_id, now + self.lease_seconds, row["seed_url"]),
+            )
+        return SpecLease(row["seed_url"], row["stage"])
+
+    def advance_spec(self, seed_url: str) -> None:
+        """Give a leased spec back with its current stage done, for whoever leases the next one."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE specs SET state = ?, stage = stage + 1, worker_id = NULL, lease_expires = NULL "
+                "WHERE seed_url = ?",
+                (PENDING, seed_url),
+            )
+
+    def finish_spec(self, seed_url: str, entry: Dict[str, Any]) -> None:
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE specs SET state = ?, lease_expires = NULL, entry = ?, error = NULL WHERE seed_url = ?",
+                (DONE, json.dumps(entry, ensure_ascii=False), seed_url),
+            )
+
+    def fail_spec(self, seed_url: str, error: str) -> None:
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE specs SET state = ?, lease_expires = NULL, error = ? WHERE seed_url = ?",
+                (FAILED, error, seed_url),
+            )
+
+    def release_spec(self, seed_url: str) -> None:
+        """Give a leased spec back at the same stage, e.g. when this worker's fetch budget ran out."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE specs SET state = ?, worker_id = NULL, lease_expires = NULL WHERE seed_url = ?",
+                (PENDING, seed_url),
+            )
+
+    def outstanding(self) -> int:
+        """Specs not yet done or failed (pending, or leased by some worker)."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM specs WHERE state IN (?, ?)", (PENDING, LEASED)
+            ).fetchone()[0]
+
+    def finished_entries(self) -> List[Dict[str, Any]]:
+        """Manifest entries of every done spec, in seed registration order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT entry FROM specs WHERE state = ? ORDER BY position", (DONE,)
+            ).fetchall()
+        return [json.loads(row["entry"]) for row in rows]
+
+    def failed_specs(self) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute("SELECT seed_url, error FROM specs WHERE state = ?", (FAILED,)).fetchall()
+        return {row["seed_url"]: row["error"] or "" for row in rows}
+
+    def claim_merge(self) -> bool:
+        """True for exactly one caller once nothing is outstanding: that worker writes the manifest."""
+        with self.transaction() as db:
+            if self.outstanding():
+                return False
+            cur = db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('merged_by', ?)", (self.worker_id,))
+            return cur.rowcount == 1
+
+    # Pages
+
+    def claim_page(self, key: str, url: str) -> PageClaim:
+        now = time.time()
+        with self.transaction() as db:
+            row = db.execute("SELECT * FROM pages WHERE fetch_key = ?", (key,)).fetchone()
+            if row is not None:
+                if row["state"] == DONE:
+                    return PageClaim(DONE, row["local_path"], json.loads(row["response"] or "{}"))
+                if row["state"] == FAILED:
+                    return PageClaim(FAILED, error=row["error"])
+                if row["lease_expires"] >= now and row["worker_id"] != self.worker_id:
+                    return PageClaim(BUSY)
+            db.execute(
+                "INSERT OR REPLACE INTO pages (fetch_key, url, state, worker_id, lease_expires) VALUES (?, ?, ?, ?, ?)",
+                (key, url, LEASED, self.worker_id, now + self.lease_seconds),
+            )
+        return PageClaim(CLAIMED)
+
+    def page_done(self, key: str, local_path: str, response: Dict[str, Any]) -> None:
+        """Publish a stored page and renew this worker's spec leases."""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE pages SET state = ?, lease_expires = NULL, local_path = ?, response = ? "
+                "WHERE fetch_key = ? AND state != ?",
+                (DONE, local_path, json.dumps(response), key, DONE),
+            )
+            db.execute(
+                "UPDATE specs SET lease_expires = ? WHERE worker_id = ? AND state = ?",
+                (now + self.lease_seconds, self.worker_id, LEASED),
+            )
+
+    def page_failed(self, key: str, error: str) -> None:
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE pages SET state = ?, lease_expires = NULL, error = ? WHERE fetch_key = ? AND worker_id = ?",
+                (FAILED, error, key, self.worker_id),
+            )
+
+    def release_page(self, key: str) -> None:
+        with self.transaction() as db:
+            db.execute(
+                "DELETE FROM pages WHERE fetch_key = ? AND worker_id = ? AND state = ?",
+                (key, self.worker_id, LEASED),
+            )
+
+    # Shared request pacing
+
+    def rate_state(self) -> Dict[str, Any]:
+        """The pacer's shared fields; call inside transaction() and write back with save_rate_state()."""
+        row = self._db.execute("SELECT interval, next_at, last_decrease_at, throttled FROM rate WHERE id = 1").fetchone()
+        return dict(row)
+
+    def save_rate_state(self, state: Dict[str, Any]) -> None:
+        self._db.execute(
+            "UPDATE rate SET interval = ?, next_at = ?, last_decrease_at = ?, throttled = ? WHERE id = 1",
+            (state["interval"], state["next_at"], state["last_decrease_at"], state["throttled"]),
+        )
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            out: Dict[str, Dict[str, int]] = {}
+            for table in ("specs", "pages"):
+                rows = self._db.execute(f"SELECT state, COUNT(*) AS n FROM {table} GROUP BY state").fetchall()  # noqa: S608
+                out[table] = {row["state"]: row["n"] for row in rows}
+            out["workers"] = {"registered": self._db.execute("SELECT COUNT(*) FROM workers").fetchone()[0]}
+        return out
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Inspect the downloader's shared SQLite work queue.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    status = sub.add_parser("status", help="Show spec/page states and failed specs.")
+    status.add_argument("--queue", default="downloads/wowhead_tbc_bis/crawl.sqlite")
+    args = parser.parse_args()
+
+    path = pathlib.Path(args.queue)
+    if not path.is_file():
+        raise FileNotFoundError(f"Queue not found: {path}")
+    queue = CrawlQueue(path, worker_id="status")
+    try:
+        for table, states in queue.counts().items():
+            detail = ", ".join(f"{state}: {n}" for state, n in sorted(states.items())) or "empty"
+            print(f"{table}: {detail}")
+        for seed_url, error in sorted(queue.failed_specs().items()):
+            print(f"  - FAILED {seed_url}: {error}")
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -3,10 +3,36 @@
 
 This script starts from the Wowhead TBC BiS index page and:
 1) Finds all pre-raid BiS guide URLs (one per spec).
-2) Processes each spec sequentially.
+2) Processes each spec sequentially (or concurrently with --async).
 3) Discovers phase guide URLs (pre-raid + phase 1-5) and gem/enchant pages.
 4) Downloads each guide HTML for offline use.
-5) Writes a manifest JSON describing everything fetched.
+5) Streams a manifest of everything fetched to manifest.jsonl as specs finish,
+   then compacts it into the indexed manifest.json.
+
+Progress is journaled to download_journal.jsonl as pages are saved; after an
+interruption, re-run with --resume to fetch only what is still missing.
+
+Pages are fetched one priority class at a time across all specs: seed and
+phase guides first, then the remaining guides, then gem/enchant reference
+pages. With --max-requests or --deadline a time-boxed refresh therefore
+always gets the pages the Lua data is built from; what the budget leaves out
+is fetched by a later --resume run.
+
+With --work-queue PATH several processes (or hosts sharing the output
+directory) split one crawl through a SQLite work queue: they lease specs,
+fetch every page once between them, pace requests as one client, and the
+last worker to finish writes the merged manifest (see scripts/crawl_queue.py).
+
+With --corpus-db PATH pages, their validators and the manifest go into one
+SQLite file instead of the directory tree (see scripts/corpus_db.py); the
+parser, checker and extractor read it with the same flag.
+
+With --stream-guides guide pages are read only until the nav JSON and the
+guide body (its printHtml script and <noscript> copy) have arrived; the
+connection is then dropped and that prefix saved, so the trailing comments,
+footer and scripts are never transferred. Gem/enchant links that only appear
+past that point (mostly in user comments) are not seen, so such a run fetches
+fewer reference pages than a full one.
 
 JavaScript note:
   Wowhead renders a lot of content with JavaScript. Raw HTML downloads do *not*
@@ -17,35 +43,104 @@ JavaScript note:
     scripts/extract_wowhead_guide_markup.py <path-to-downloaded-html-or-dir>
   For fully-rendered DOM (e.g. for screenshots or DOM-based parsing), use
   --use-browser (requires: pip install playwright && playwright install chromium).
+  Browser mode renders in a pool of --browser-contexts contexts that block
+  images, fonts, stylesheets and third-party requests, and captures each page
+  as soon as its guide body is rendered (see scripts/browser_pool.py).
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
+import datetime
+import email.utils
 import html as html_lib
+import itertools
 import json
+import math
+import os
 import pathlib
 import random
 import re
+import socket
 import threading
 import time
 import urllib.error
 import urllib.parse
 import urllib.request
-from dataclasses import dataclass, field
-from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import xml.etree.ElementTree as ET
+from dataclasses import asdict, dataclass, field, replace
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-try:
-    from playwright.sync_api import sync_playwright
-    _PLAYWRIGHT_AVAILABLE = True
-except ImportError:
-    sync_playwright = None  # type: ignore[misc, assignment]
-    _PLAYWRIGHT_AVAILABLE = False
+from corpus_db import DEFAULT_DB_COMPRESSION, INDEX_PAGE_PATH, CorpusDB
+from corpus_store import (
+    BLOB_SUFFIX,
+    COMPRESSION_SUFFIXES,
+    SLIM_FORMAT,
+    SLIM_SUFFIX,
+    XML_SUFFIX,
+    atomic_write_bytes,
+    base_page_suffix,
+    collect_blob_garbage,
+    encode_page,
+    link_into_spec_dir,
+    load_slim_record,
+    read_page_text,
+    resolve_compression,
+    write_blob,
+)
+from crawl_queue import CLAIMED, DEFAULT_LEASE_SECONDS, DONE, FAILED, CrawlQueue, PageClaim
+from browser_pool import (
+    DEFAULT_CONTEXTS,
+    DEFAULT_READY_SELECTOR,
+    PLAYWRIGHT_AVAILABLE,
+    BrowserPage,
+    BrowserPool,
+    PageNotReady,
+)
+from http_pool import (
+    ACCEPT_ENCODING,
+    DEFAULT_POOL,
+    STREAM_ACCEPT_ENCODING,
+    TRANSFER_STATS,
+    format_bytes,
+    pooled_urlopen,
+    read_body_sized,
+    read_body_until,
+)
+from lua_pipeline import LuaPipeline
+from manifest_store import (
+    MANIFEST_FILE_NAME,
+    MANIFEST_STREAM_NAME,
+    PREVIOUS_MANIFEST_NAME,
+    ManifestStream,
+    changed_since,
+    compact_manifest,
+    load_manifest,
+    read_stream,
+)
+from guide_markup import iter_print_html_calls
+from parse_wowhead_html import GUIDE_CATEGORIES, markup_fingerprint
 
 WOWHEAD_ROOT = "https://www.wowhead.com"
 DEFAULT_INDEX_URL = (
     "https://www.wowhead.com/tbc/guides/classes/best-in-slot-guides-burning-crusade-classic"
 )
+JOURNAL_FILE_NAME = "download_journal.jsonl"
+ITEM_REFERENCE_FILE_NAME = "item_reference.json"
 
 USER_AGENT = (
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) "
@@ -93,9 +188,11 @@ GUIDE_MAP_PATTERN = re.compile(
     r'"(\d+)":\{"name":"([^"]+)","category":\d+,"url":"(https://www\.wowhead\.com/tbc/guide/[^"]+)"\}'
 )
 GUIDE_REF_PATTERN = re.compile(r"\[url guide=(\d+)\]([^\[]+)\[/url\]")
-
-_REQUEST_LOCK = threading.Lock()
-_NEXT_REQUEST_AT = 0.0
+HREF_PATTERN = re.compile(r'href=["\']([^"\']+)["\']')
+NOSCRIPT_PATTERN = re.compile(r"<noscript>(.*?)</noscript>", re.S | re.I)
+DATA_CLASS_PATTERN = re.compile(r'data-class="([^"]+)"')
+DATA_SPEC_PATTERN = re.compile(r'data-spec="([^"]+)"')
+ENTITY_URL_PATTERN = re.compile(r"^https://www\.wowhead\.com/tbc/(item|spell|skill)=(\d+)", re.I)
 
 # Canonical spec IDs requested for offline BiS extraction.
 EXPECTED_SPECS: Set[str] = {
@@ -137,6 +234,15 @@ class GuideRecord:
     url: str
     local_path: str
     category: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+    fetched_at_epoch: Optional[int] = None
+    spec_path: Optional[str] = None
+    entity_key: Optional[str] = None
+    aliases: List[str] = field(default_factory=list)
+    timing: Optional[Dict[str, Any]] = None
+    markup_fingerprint: Optional[str] = None
 
 
 @dataclass
@@ -147,76 +253,720 @@ class SpecResult:
     covered_specs: List[str] = field(default_factory=list)
     guides: List[GuideRecord] = field(default_factory=list)
     warnings: List[str] = field(default_factory=list)
+    unchanged_pages: int = 0
+    deferred_pages: int = 0
+
 
+@dataclass
+class RequestTiming:
+    """Telemetry for one network fetch, covering all of its attempts.
 
-def wait_for_request_slot(min_delay: float, max_delay: float) -> None:
-    global _NEXT_REQUEST_AT
+    ``queue_wait`` is time spent waiting for request slots, ``connect`` and
+    ``ttfb`` (request sent to first response byte) describe the final
+    attempt, and ``total`` runs from the first slot request to the body being
+    read, so it includes retries and backoff. ``truncated`` marks a guide
+    read only up to its payload (--stream-guides). Pages shared between specs
+    carry the same ``request_id``.
+    """
 
-    # Global pacing across all worker threads to avoid bursty traffic.
-    delay = random.uniform(min_delay, max_delay)
-    with _REQUEST_LOCK:
-        now = time.monotonic()
-        if now < _NEXT_REQUEST_AT:
-            time.sleep(_NEXT_REQUEST_AT - now)
-            now = time.monotonic()
-        _NEXT_REQUEST_AT = now + delay
+    request_id: int = 0
+    status: Optional[int] = None
+    retries: int = 0
+    throttled: int = 0
+    queue_wait: float = 0.0
+    connect: Optional[float] = None
+    ttfb: Optional[float] = None
+    total: float = 0.0
+    bytes: int = 0
+    truncated: bool = False
 
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: round(v, 4) if isinstance(v, float) else v for k, v in asdict(self).items()}
 
-def fetch_url(
+
+_REQUEST_IDS = itertools.count(1)
+
+
+@dataclass
+class PageResponse:
+    """Body plus the HTTP validators needed for conditional re-download."""
+
+    text: Optional[str]
+    not_modified: bool = False
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+    fetched_at_epoch: int = 0
+    timing: Optional[RequestTiming] = None
+    # Where the body is already saved (a page another --work-queue worker
+    # published); PageStore.store() does not write that file again.
+    stored_path: Optional[str] = None
+
+
+class AdaptiveRateLimiter:
+    """Global AIMD request pacer shared by every worker thread and asyncio task.
+
+    Requests start ``interval`` seconds apart (with a little jitter). Each
+    healthy response adds ``increase_per_success`` requests/second to the rate
+    until the spacing reaches --min-delay; a 429/403/5xx divides the rate by
+    ``1 / decrease_factor``, at most once per round of in-flight requests so a
+    burst of rejections does not collapse it. A Retry-After header holds every
+    caller back until it expires. The first request uses --max-delay.
+    """
+
+    def __init__(
+        self,
+        increase_per_success: float = 0.05,
+        decrease_factor: float = 0.5,
+        min_backoff_interval: float = 1.0,
+        max_interval: float = 60.0,
+        max_retry_after: float = 300.0,
+        jitter: float = 0.15,
+    ) -> None:
+        self.increase_per_success = increase_per_success
+        self.decrease_factor = decrease_factor
+        self.min_backoff_interval = min_backoff_interval
+        self.max_interval = max_interval
+        self.max_retry_after = max_retry_after
+        self.jitter = jitter
+        self.throttled = 0
+        # Monotonic in one process; SharedRateLimiter switches to wall-clock time.
+        self.clock: Callable[[], float] = time.monotonic
+        self._lock = threading.Lock()
+        self._interval: Optional[float] = None
+        self._min_interval = 0.0
+        self._next_at = 0.0
+        self._last_decrease_at = float("-inf")
+
+    def reserve(self, min_delay: float, max_delay: float) -> Tuple[float, float]:
+        """Claim the next request slot; return (slot start, now) on ``clock``."""
+        with self._lock:
+            if self._interval is None:
+                self._interval = max_delay
+            self._min_interval = min_delay
+            interval = max(self._interval, min_delay)
+            now = self.clock()
+            slot = max(now, self._next_at)
+            self._next_at = slot + interval * random.uniform(1.0 - self.jitter, 1.0 + self.jitter)
+        return slot, now
+
+    def record_success(self) -> None:
+        with self._lock:
+            if not self._interval:
+                return
+            rate = 1.0 / self._interval + self.increase_per_success
+            self._interval = max(self._min_interval, 1.0 / rate)
+
+    def record_throttle(self, sent_at: float, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            now = self.clock()
+            self.throttled += 1
+            # Requests sent before the last cut were paced at the old rate;
+            # their rejections are not new information.
+            if sent_at >= self._last_decrease_at:
+                current = max(self._interval or 0.0, self._min_interval)
+                slower = max(current / self.decrease_factor, self.min_backoff_interval)
+                self._interval = min(slower, self.max_interval)
+                self._last_decrease_at = now
+            if retry_after is not None:
+                resume_at = now + min(retry_after, self.max_retry_after)
+                self._next_at = max(self._next_at, resume_at)
+
+    @property
+    def requests_per_second(self) -> Optional[float]:
+        """Current target rate, or None when pacing is disabled (zero delay)."""
+        interval = self._interval
+        if not interval:
+            return None
+        return 1.0 / interval
+
+    def describe(self) -> str:
+        rate = self.requests_per_second
+        text = "unpaced" if rate is None else f"{rate:.2f} req/s"
+        if self.throttled:
+            text += f", throttled {self.throttled}x"
+        return text
+
+
+RATE_LIMITER = AdaptiveRateLimiter()
+
+
+class SharedRateLimiter(AdaptiveRateLimiter):
+    """AdaptiveRateLimiter whose state lives in a CrawlQueue, so all workers share one request budget.
+
+    Every call loads the shared pacing state, applies the usual step and
+    writes it back in one database transaction. Slots are wall-clock times so
+    they compare across processes and hosts.
+    """
+
+    def __init__(self, queue: CrawlQueue) -> None:
+        super().__init__()
+        self.queue = queue
+        self.clock = time.time
+
+    def _shared(self, step: Callable[..., Any], *args: Any) -> Any:
+        with self.queue.transaction():
+            state = self.queue.rate_state()
+            self._interval = state["interval"]
+            self._next_at = state["next_at"]
+            last_decrease = state["last_decrease_at"]
+            self._last_decrease_at = float("-inf") if last_decrease is None else last_decrease
+            self.throttled = state["throttled"]
+            result = step(*args)
+            self.queue.save_rate_state(
+                {
+                    "interval": self._interval,
+                    "next_at": self._next_at,
+                    "last_decrease_at": None if self._last_decrease_at == float("-inf") else self._last_decrease_at,
+                    "throttled": self.throttled,
+                }
+            )
+        return result
+
+    def reserve(self, min_delay: float, max_delay: float) -> Tuple[float, float]:
+        return self._shared(super().reserve, min_delay, max_delay)
+
+    def record_success(self) -> None:
+        self._shared(super().record_success)
+
+    def record_throttle(self, sent_at: float, retry_after: Optional[float] = None) -> None:
+        self._shared(super().record_throttle, sent_at, retry_after)
+
+
+def wait_for_request_slot(min_delay: float, max_delay: float) -> float:
+    """Block until the global pacer allows another request; return its slot time."""
+    slot, now = RATE_LIMITER.reserve(min_delay, max_delay)
+    if slot > now:
+        time.sleep(slot - now)
+    return slot
+
+
+async def async_wait_for_request_slot(min_delay: float, max_delay: float) -> float:
+    """Async counterpart of wait_for_request_slot sharing the same global pacer.
+
+    Each caller reserves the next free slot under the lock and then sleeps
+    outside it, so concurrent tasks queue up one request per delay without
+    blocking the event loop.
+    """
+    slot, now = RATE_LIMITER.reserve(min_delay, max_delay)
+    if slot > now:
+        await asyncio.sleep(slot - now)
+    return slot
+
+
+REQUEST_HEADERS = {
+    "User-Agent": USER_AGENT,
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "Cache-Control": "no-cache",
+    "Pragma": "no-cache",
+    "Referer": "https://www.wowhead.com/",
+}
+
+
+def conditional_headers(validators: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    headers: Dict[str, str] = {}
+    if not validators:
+        return headers
+    if validators.get("etag"):
+        headers["If-None-Match"] = str(validators["etag"])
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = str(validators["last_modified"])
+    return headers
+
+
+# Set by --replay: send requests to a local http_cassette.py server instead of Wowhead.
+REPLAY_BASE_URL: Optional[str] = None
+
+
+def request_url(url: str) -> str:
+    """Where to actually send a request for ``url`` (the replay server under --replay)."""
+    if REPLAY_BASE_URL is None or not url.startswith(WOWHEAD_ROOT + "/"):
+        return url
+    return REPLAY_BASE_URL.rstrip("/") + url[len(WOWHEAD_ROOT):]
+
+
+# Set by --stream-guides: read guide pages only up to guide_payload_end().
+STREAM_GUIDES = False
+
+GUIDE_NAV_START = b'<script type="application/json" id="data.wowhead-guid'
+GUIDE_BODY_TARGET_PATTERN = re.compile(rb'"\s*,\s*"guide-body"')
+
+
+class GuidePayloadScanner:
+    """guide_payload_end() for a body that grows chunk by chunk, as read_body_until() passes it.
+
+    Each marker guide_payload_end() looks for is the first one after an earlier
+    marker, so once found it stays put as the body grows. The scanner keeps the
+    markers it has found and resumes every unfinished search just before the new
+    data, so a streamed page is scanned once rather than once per chunk.
+    """
+
+    def __init__(self) -> None:
+        self._found: Dict[str, int] = {}
+        self._resume: Dict[str, int] = {}
+
+    def _find(self, key: str, body: bytes, marker: bytes, lower: int) -> int:
+        if key in self._found:
+            return self._found[key]
+        pos = body.find(marker, max(lower, self._resume.get(key, lower)))
+        if pos < 0:
+            # A match can still start in the last len(marker) - 1 bytes.
+            self._resume[key] = max(lower, len(body) - len(marker) + 1)
+            return -1
+        self._found[key] = pos
+        return pos
+
+    def _target_end(self, body: bytes) -> int:
+        if "target" in self._found:
+            return self._found["target"]
+        match = GUIDE_BODY_TARGET_PATTERN.search(body, self._resume.get("target", 0))
+        if match is None:
+            # A partial match holds at most two quotes, so it starts at or after
+            # the second-to-last one.
+            last = body.rfind(b'"')
+            before = body.rfind(b'"', 0, last) if last > 0 else -1
+            self._resume["target"] = before if before >= 0 else last if last >= 0 else len(body)
+            return -1
+        self._found["target"] = match.end()
+        return match.end()
+
+    def end(self, body: bytes) -> Optional[int]:
+        """guide_payload_end(body); ``body`` must extend the body passed to the previous call."""
+        nav = self._find("nav", body, GUIDE_NAV_START, 0)
+        nav_end = self._find("nav_end", body, b"</script>", nav) if nav >= 0 else -1
+        target_end = self._target_end(body)
+        script_end = self._find("script_end", body, b"</script>", target_end) if target_end >= 0 else -1
+        if nav_end < 0 or script_end < 0:
+            return None
+        end = script_end + len(b"</script>")
+        noscript = self._find("noscript", body, b"<noscript>", end)
+        next_script = self._find("next_script", body, b"<script", end)
+        if noscript < 0 and next_script < 0:
+            return None
+        if noscript >= 0 and (next_script < 0 or noscript < next_script):
+            noscript_end = self._find("noscript_end", body, b"</noscript>", noscript)
+            if noscript_end < 0:
+                return None
+            end = noscript_end + len(b"</noscript>")
+        return max(nav_end + len(b"</script>"), end)
+
+
+def guide_payload_end(body: bytes) -> Optional[int]:
+    """Length of the page prefix holding everything the scripts read from a guide, or None until it has arrived.
+
+    That is the nav JSON and the WH.markup.printHtml(..., "guide-body") script
+    followed by its <noscript> rendering, whose links extract_reference_links()
+    follows. The rest of the page is footer markup, comments and scripts.
+    """
+    return GuidePayloadScanner().end(body)
+
+
+def streams_guide(url: str, category: Optional[str]) -> bool:
+    """Whether a fetch of ``url`` as ``category`` stops at guide_payload_end() (--stream-guides)."""
+    return STREAM_GUIDES and category not in {None, "gem_enchant_reference"} and not is_item_xml_url(url)
+
+
+def read_url(
     url: str,
-    retries: int = 5,
-    timeout: int = 30,
-    min_delay: float = 1.0,
-    max_delay: float = 2.5,
-) -> str:
+    timeout: int,
+    validators: Optional[Dict[str, Any]] = None,
+    stream: bool = False,
+) -> PageResponse:
+    """GET ``url``; with ``stream`` read the body only up to guide_payload_end() and drop the connection."""
+    headers = dict(REQUEST_HEADERS)
+    headers.update(conditional_headers(validators))
+    if stream:
+        headers["Accept-Encoding"] = STREAM_ACCEPT_ENCODING
+    req = urllib.request.Request(request_url(url), headers=headers)
+    try:
+        with pooled_urlopen(req, timeout=timeout) as response:
+            truncated = False
+            if stream:
+                body, wire_bytes, truncated = read_body_until(response, GuidePayloadScanner().end)
+            else:
+                body, wire_bytes = read_body_sized(response)
+            # The validators describe the whole page; a 304 against them would
+            # keep the truncated copy, so a truncated page is always refetched.
+            return PageResponse(
+                text=body.decode("utf-8", "ignore"),
+                etag=None if truncated else response.headers.get("ETag"),
+                last_modified=None if truncated else response.headers.get("Last-Modified"),
+                content_length=len(body),
+                fetched_at_epoch=int(time.time()),
+                timing=RequestTiming(
+                    status=response.status,
+                    connect=getattr(response, "connect_seconds", None),
+                    ttfb=getattr(response, "ttfb_seconds", None),
+                    bytes=wire_bytes,
+                    truncated=truncated,
+                ),
+            )
+    except urllib.error.HTTPError as exc:
+        if exc.code != 304 or not validators:
+            raise
+        # Unchanged since the last run: keep the stored copy and its validators.
+        return PageResponse(
+            text=None,
+            not_modified=True,
+            etag=exc.headers.get("ETag") or validators.get("etag"),
+            last_modified=exc.headers.get("Last-Modified") or validators.get("last_modified"),
+            content_length=validators.get("content_length"),
+            fetched_at_epoch=int(time.time()),
+            timing=RequestTiming(status=304),
+        )
+
+
+# Substrings every genuine page of a kind contains. Soft blocks, captchas and
+# interstitials come back as 200s without them.
+GUIDE_PAGE_MARKERS = ("WH.markup.printHtml(", 'id="data.wowhead-guid')
+ENTITY_PAGE_MARKERS = {"item": "g_items[{id}]", "spell": "g_spells[{id}]"}
+ITEM_XML_MARKER = "<wowhead>"
+
+
+class InvalidPage(Exception):
+    """A 200 response that is not the requested page (soft block or interstitial)."""
+
+
+def page_problem(url: str, category: str, text: str) -> Optional[str]:
+    """Why ``text`` is not a usable ``category`` page for ``url``, or None if it looks right."""
+    if is_item_xml_url(url):
+        return None if ITEM_XML_MARKER in text else f"no {ITEM_XML_MARKER} document"
+    if category != "gem_enchant_reference":
+        missing = [marker for marker in GUIDE_PAGE_MARKERS if marker not in text]
+        return f"guide page without {' or '.join(missing)}" if missing else None
+    entity = canonical_entity(url)
+    template = ENTITY_PAGE_MARKERS.get(entity[0], "") if entity is not None else ""
+    # skill= pages carry no per-entity global; the printHtml body is the best marker.
+    marker = template.format(id=entity[1]) if template else GUIDE_PAGE_MARKERS[0]
+    return None if marker in text else f"page without {marker}"
+
+
+def check_page(url: str, category: Optional[str], response: PageResponse) -> None:
+    """Raise InvalidPage if a fetched body lacks its category's markers; 304s and uncategorised fetches pass."""
+    if category is None or response.text is None:
+        return
+    problem = page_problem(url, category, response.text)
+    if problem is not None:
+        raise InvalidPage(f"{problem} (status {response.timing.status if response.timing else '?'})")
+
+
+def is_throttled(exc: Exception) -> bool:
+    """403/429, 5xx and soft-block pages mean the server wants us to slow down."""
+    # A browser page that never rendered the guide body is an interstitial too.
+    if isinstance(exc, (InvalidPage, PageNotReady)):
+        return True
+    return isinstance(exc, urllib.error.HTTPError) and (exc.code in {403, 429} or exc.code >= 500)
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Parse the Retry-After header of an HTTP error; see parse_retry_after()."""
+    if not isinstance(exc, urllib.error.HTTPError) or exc.headers is None:
+        return None
+    return parse_retry_after(exc.headers.get("Retry-After"))
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After value (delta seconds or HTTP date), or None if absent or unparsable."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+def record_request_outcome(sent_at: float, exc: Optional[Exception] = None) -> None:
+    if exc is None:
+        RATE_LIMITER.record_success()
+    elif is_throttled(exc):
+        RATE_LIMITER.record_throttle(sent_at, retry_after_seconds(exc))
+
+
+def retry_backoff_seconds(exc: Exception, attempt: int) -> float:
+    # Throttling is handled by RATE_LIMITER (slower pacing, Retry-After); only
+    # transport errors and other failures get a local backoff.
+    if is_throttled(exc):
+        return 0.0
+    return 2.0 * attempt
+
+
+def finish_timing(
+    response: PageResponse,
+    started: float,
+    attempt: int,
+    queue_wait: float,
+    throttled: int,
+) -> PageResponse:
+    """Complete the response's RequestTiming once a fetch has succeeded."""
+    timing = response.timing or RequestTiming()
+    timing.request_id = next(_REQUEST_IDS)
+    timing.retries = attempt - 1
+    timing.throttled = throttled
+    timing.queue_wait = queue_wait
+    timing.total = time.monotonic() - started
+    response.timing = timing
+    return response
+
+
+# Failures worth another attempt: transport errors (including the browser
+# pool's), error statuses, soft blocks and pages that never rendered.
+RETRYABLE_ERRORS = (urllib.error.URLError, TimeoutError, InvalidPage, PageNotReady)
+
+
+def fetch_with_retries(
+    url: str,
+    attempt_fetch: Callable[[], PageResponse],
+    retries: int,
+    min_delay: float,
+    max_delay: float,
+    category: Optional[str],
+) -> PageResponse:
+    """Call ``attempt_fetch`` with pacing and retries; with ``category`` the body must pass check_page()."""
     last_exc: Optional[Exception] = None
+    started = time.monotonic()
+    queue_wait = 0.0
+    throttled = 0
     for attempt in range(1, retries + 1):
-        wait_for_request_slot(min_delay=min_delay, max_delay=max_delay)
-        req = urllib.request.Request(
-            url,
-            headers={
-                "User-Agent": USER_AGENT,
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.9",
-                "Cache-Control": "no-cache",
-                "Pragma": "no-cache",
-                "Referer": "https://www.wowhead.com/",
-            },
-        )
+        waited_from = time.monotonic()
+        sent_at = wait_for_request_slot(min_delay=min_delay, max_delay=max_delay)
+        queue_wait += time.monotonic() - waited_from
         try:
-            with urllib.request.urlopen(req, timeout=timeout) as response:
-                return response.read().decode("utf-8", "ignore")
-        except urllib.error.HTTPError as exc:
+            response = attempt_fetch()
+            check_page(url, category, response)
+        except RETRYABLE_ERRORS as exc:
             last_exc = exc
-            # Treat 403/429 as rate limiting and back off longer.
-            if exc.code in {403, 429} and attempt < retries:
-                time.sleep(8.0 * attempt)
-                continue
+            if is_throttled(exc):
+                throttled += 1
+            record_request_outcome(sent_at, exc)
             if attempt < retries:
-                time.sleep(2.0 * attempt)
-            else:
-                break
-        except (urllib.error.URLError, TimeoutError) as exc:
+                time.sleep(retry_backoff_seconds(exc, attempt))
+            continue
+        record_request_outcome(sent_at)
+        return finish_timing(response, started, attempt, queue_wait, throttled)
+    raise RuntimeError(f"Failed to fetch {url}: {last_exc}")
+
+
+async def fetch_with_retries_async(
+    url: str,
+    attempt_fetch: Callable[[], Awaitable[PageResponse]],
+    retries: int,
+    min_delay: float,
+    max_delay: float,
+    category: Optional[str],
+) -> PageResponse:
+    """fetch_with_retries for coroutines: the same policy, waiting without blocking the event loop."""
+    last_exc: Optional[Exception] = None
+    started = time.monotonic()
+    queue_wait = 0.0
+    throttled = 0
+    for attempt in range(1, retries + 1):
+        waited_from = time.monotonic()
+        sent_at = await async_wait_for_request_slot(min_delay=min_delay, max_delay=max_delay)
+        queue_wait += time.monotonic() - waited_from
+        try:
+            response = await attempt_fetch()
+            check_page(url, category, response)
+        except RETRYABLE_ERRORS as exc:
             last_exc = exc
+            if is_throttled(exc):
+                throttled += 1
+            record_request_outcome(sent_at, exc)
             if attempt < retries:
-                time.sleep(2.0 * attempt)
-            else:
-                break
+                await asyncio.sleep(retry_backoff_seconds(exc, attempt))
+            continue
+        record_request_outcome(sent_at)
+        return finish_timing(response, started, attempt, queue_wait, throttled)
     raise RuntimeError(f"Failed to fetch {url}: {last_exc}")
 
 
-def fetch_via_browser(
+def fetch_page(
+    url: str,
+    retries: int = 5,
+    timeout: int = 30,
+    min_delay: float = 1.0,
+    max_delay: float = 2.5,
+    validators: Optional[Dict[str, Any]] = None,
+    category: Optional[str] = None,
+) -> PageResponse:
+    """Fetch with pacing and retries; with ``category`` the body must pass check_page() or it is retried."""
+    stream = streams_guide(url, category)
+    return fetch_with_retries(
+        url, lambda: read_url(url, timeout, validators, stream=stream), retries, min_delay, max_delay, category
+    )
+
+
+def fetch_url(
     url: str,
-    page: Any,
-    wait_after_load_ms: int = 3000,
+    retries: int = 5,
+    timeout: int = 30,
     min_delay: float = 1.0,
     max_delay: float = 2.5,
 ) -> str:
-    """Fetch URL using a Playwright page (full JS render); return HTML."""
-    wait_for_request_slot(min_delay=min_delay, max_delay=max_delay)
-    page.goto(url, wait_until="domcontentloaded", timeout=60000)
-    page.wait_for_timeout(wait_after_load_ms)
-    return page.content()
+    response = fetch_page(
+        url, retries=retries, timeout=timeout, min_delay=min_delay, max_delay=max_delay
+    )
+    return response.text or ""
+
+
+async def fetch_page_async(
+    url: str,
+    retries: int = 5,
+    timeout: int = 30,
+    min_delay: float = 1.0,
+    max_delay: float = 2.5,
+    validators: Optional[Dict[str, Any]] = None,
+    category: Optional[str] = None,
+) -> PageResponse:
+    """Same retry/pacing policy and page check as fetch_page; the blocking read runs in a worker thread."""
+    stream = streams_guide(url, category)
+    return await fetch_with_retries_async(
+        url,
+        lambda: asyncio.to_thread(read_url, url, timeout, validators, stream),
+        retries,
+        min_delay,
+        max_delay,
+        category,
+    )
+
+
+def browser_response(page: BrowserPage) -> PageResponse:
+    timing = RequestTiming(
+        status=page.status,
+        connect=page.connect_seconds,
+        ttfb=page.ttfb_seconds,
+        bytes=len(page.html.encode("utf-8")),
+    )
+    return PageResponse(
+        text=page.html,
+        content_length=timing.bytes,
+        fetched_at_epoch=int(time.time()),
+        timing=timing,
+    )
+
+
+def fetch_via_browser(
+    url: str,
+    pool: BrowserPool,
+    retries: int = 5,
+    min_delay: float = 1.0,
+    max_delay: float = 2.5,
+    category: Optional[str] = None,
+) -> PageResponse:
+    """Fetch URL in a pooled Playwright context (full JS render), with fetch_page's retries and page check."""
+    return fetch_with_retries(
+        url, lambda: browser_response(pool.fetch(url)), retries, min_delay, max_delay, category
+    )
+
+
+async def fetch_via_browser_async(
+    url: str,
+    pool: BrowserPool,
+    retries: int = 5,
+    min_delay: float = 1.0,
+    max_delay: float = 2.5,
+    category: Optional[str] = None,
+) -> PageResponse:
+    """Async counterpart of fetch_via_browser; up to pool.size pages render at once."""
+
+    async def render() -> PageResponse:
+        return browser_response(await pool.fetch_async(url))
+
+    return await fetch_with_retries_async(url, render, retries, min_delay, max_delay, category)
+
+
+def canonical_entity(url: str) -> Optional[Tuple[str, int]]:
+    """Return (entity_type, id) for Wowhead item/spell/skill URLs, else None.
+
+    Wowhead ignores the trailing slug, so tbc/spell=27981/sunfire and
+    tbc/spell=27981/enchant-weapon-sunfire are the same page.
+    """
+    m = ENTITY_URL_PATTERN.match(url)
+    if not m:
+        return None
+    return m.group(1).lower(), int(m.group(2))
+
+
+def entity_key_for_url(url: str) -> Optional[str]:
+    entity = canonical_entity(url)
+    if entity is None:
+        return None
+    return f"{entity[0]}={entity[1]}"
+
+
+def fetch_key(url: str) -> str:
+    """Key used to decide whether two URLs name the same page (entity key, else URL)."""
+    key = entity_key_for_url(url)
+    if key is None:
+        return url
+    # The ?xml tooltip document is a different resource from the HTML page.
+    return key + "?xml" if is_item_xml_url(url) else key
+
+
+def item_xml_url(item_id: int) -> str:
+    return f"{WOWHEAD_ROOT}/tbc/item={item_id}?xml"
+
+
+def is_item_xml_url(url: str) -> bool:
+    return urllib.parse.urlsplit(url).query == "xml"
+
+
+def reference_fetch_url(url: str, item_xml: bool) -> str:
+    """URL to download for a referenced page: the ?xml document for items when item_xml is set."""
+    entity = canonical_entity(url)
+    if item_xml and entity is not None and entity[0] == "item":
+        return item_xml_url(entity[1])
+    return url
+
+
+def parse_item_xml(xml_text: str) -> Optional[Dict[str, Any]]:
+    """Structured fields from a Wowhead item ?xml document, or None for errors/unknown items."""
+    try:
+        root = ET.fromstring(xml_text)
+    except ET.ParseError:
+        return None
+    item = root.find("item")
+    if item is None or not (item.get("id") or "").isdigit():
+        return None
+
+    def text(tag: str) -> Optional[str]:
+        node = item.find(tag)
+        return node.text.strip() if node is not None and node.text else None
+
+    def numeric_id(tag: str) -> Optional[int]:
+        node = item.find(tag)
+        value = node.get("id") if node is not None else None
+        return int(value) if value and value.isdigit() else None
+
+    def json_object(tag: str) -> Dict[str, Any]:
+        # <json>/<jsonEquip> hold an object body without the surrounding braces.
+        body = text(tag)
+        if not body:
+            return {}
+        try:
+            return json.loads("{" + body + "}")
+        except json.JSONDecodeError:
+            return {}
+
+    level = text("level")
+    return {
+        "id": int(item.get("id") or 0),
+        "name": text("name"),
+        "level": int(level) if level and level.isdigit() else None,
+        "quality": numeric_id("quality"),
+        "class": numeric_id("class"),
+        "subclass": numeric_id("subclass"),
+        "icon": text("icon"),
+        "json": json_object("json"),
+        "jsonEquip": json_object("jsonEquip"),
+    }
 
 
 def sanitize_slug(value: str) -> str:
@@ -360,8 +1110,8 @@ def discover_spec_key(seed_url: str, seed_html: str) -> str:
         if spec_name in {"dps", "tank", "healer"}:
             return f"{class_name}-{spec_name}-shared"
 
-    class_match = re.search(r'data-class="([^"]+)"', seed_html)
-    spec_match = re.search(r'data-spec="([^"]+)"', seed_html)
+    class_match = DATA_CLASS_PATTERN.search(seed_html)
+    spec_match = DATA_SPEC_PATTERN.search(seed_html)
     if class_match and spec_match:
         class_name = sanitize_slug(class_match.group(1))
         spec_name = sanitize_slug(spec_match.group(1))
@@ -384,8 +1134,8 @@ def infer_layout_and_coverage(seed_url: str, seed_html: str, spec_key: str) -> T
     spec_name = sanitize_slug(url_spec) if url_spec else None
 
     if not class_name or not spec_name:
-        class_match = re.search(r'data-class="([^"]+)"', seed_html)
-        spec_match = re.search(r'data-spec="([^"]+)"', seed_html)
+        class_match = DATA_CLASS_PATTERN.search(seed_html)
+        spec_match = DATA_SPEC_PATTERN.search(seed_html)
         if class_match:
             class_name = sanitize_slug(class_match.group(1))
         if spec_match:
@@ -458,9 +1208,492 @@ def infer_layout_and_coverage(seed_url: str, seed_html: str, spec_key: str) -> T
     return ("single_spec", [spec_key.replace("-", "_")])
 
 
-def write_file(path: pathlib.Path, content: str) -> None:
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(content, encoding="utf-8")
+def write_file(path: pathlib.Path, content: str, compression: Optional[str] = None) -> None:
+    # Replace rather than truncate: the path may be a --hardlinks link to a blob
+    # (whose other names must keep the old body), or a page another worker reads.
+    atomic_write_bytes(path, encode_page(content.encode("utf-8"), compression))
+
+
+def load_previous_manifest(manifest_path: pathlib.Path, corpus: Optional[CorpusDB] = None) -> Optional[Dict[str, Any]]:
+    """The manifest the previous run left (in ``corpus`` when given), or None."""
+    if corpus is not None:
+        return corpus.manifest() if corpus.has_manifest() else None
+    if not manifest_path.is_file():
+        return None
+    try:
+        return load_manifest(manifest_path)
+    except json.JSONDecodeError:
+        return None
+
+
+def load_previous_pages(
+    manifest: Optional[Dict[str, Any]],
+    output_root: pathlib.Path,
+    corpus: Optional[CorpusDB] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """Map fetch_key(url) -> previous manifest entry for pages that can be revalidated.
+
+    Only entries that carry an ETag or Last-Modified validator and whose file
+    is still on disk (or, with ``corpus``, in the database) are returned;
+    anything else must be fetched in full.
+    """
+    if manifest is None:
+        return {}
+    out: Dict[str, Dict[str, Any]] = {}
+    for spec in manifest.get("specs", []):
+        for page in spec.get("downloaded_pages", []):
+            url = page.get("url")
+            local_path = page.get("local_path")
+            if not url or not local_path or fetch_key(url) in out:
+                continue
+            if not (page.get("etag") or page.get("last_modified")):
+                continue
+            if not (corpus.has_page(local_path) if corpus is not None else (output_root / local_path).is_file()):
+                continue
+            out[fetch_key(url)] = page
+    return out
+
+
+@dataclass
+class PageStore:
+    """Where fetched pages are written, plus what the previous run left there.
+
+    With ``use_blobs`` each body is stored once under blobs/ keyed by its
+    SHA-256 and the record's local_path points at the blob; ``hardlinks``
+    additionally exposes it at the legacy <spec>/<file>.html path. With
+    ``compression`` ("gzip"/"zstd") files get a .gz/.zst suffix. With
+    ``slim`` only a slim_page_record() is kept, as <file>.slim.json; reading
+    it back yields render_slim_page() output. With ``corpus`` pages are put
+    into that database under their plain local_path instead (it compresses
+    and deduplicates bodies itself). ``on_saved`` is called with each record
+    once its page is stored.
+    """
+
+    root: pathlib.Path
+    previous_pages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    use_blobs: bool = False
+    hardlinks: bool = False
+    compression: Optional[str] = None
+    slim: bool = False
+    corpus: Optional[CorpusDB] = None
+    on_saved: Optional[Callable[[GuideRecord], None]] = None
+
+    def validators(self, url: str) -> Optional[Dict[str, Any]]:
+        previous = self.previous_pages.get(fetch_key(url))
+        # A slim record cannot stand in for a full page, so refetch it in full.
+        if previous and not self.slim and base_page_suffix(previous["local_path"]) == SLIM_SUFFIX:
+            return None
+        return previous
+
+    def read_path(self, rel: str) -> str:
+        text = self.corpus.read_page(rel) if self.corpus is not None else read_page_text(self.root / rel)
+        record = load_slim_record(text)
+        return render_slim_page(record) if record is not None else text
+
+    def fill_unchanged_text(self, url: str, response: PageResponse) -> PageResponse:
+        """Load the stored body for a 304 response so callers always get page text."""
+        previous = self.validators(url)
+        if response.not_modified and previous:
+            response.text = self.read_path(previous["local_path"])
+        return response
+
+    def read(self, rec: GuideRecord) -> str:
+        return self.read_path(rec.local_path)
+
+    def storage_options(self) -> Dict[str, Any]:
+        """The options that decide how (and where) a record's page is stored."""
+        return {
+            "blob_store": self.use_blobs,
+            "hardlinks": self.hardlinks,
+            "compression": self.compression,
+            "slim": self.slim,
+            "corpus_db": self.corpus is not None,
+        }
+
+    def has_page(self, rec: GuideRecord) -> bool:
+        """Whether the page ``rec`` points at (and its hardlinked copy, if any) is still stored."""
+        if self.corpus is not None:
+            return self.corpus.has_page(rec.local_path)
+        paths = [rec.local_path] + ([rec.spec_path] if rec.spec_path else [])
+        return all((self.root / rel).is_file() for rel in paths)
+
+    def store(self, rec: GuideRecord, response: PageResponse) -> None:
+        """Persist a fetched page and copy its validators onto the record."""
+        rec.etag = response.etag
+        rec.last_modified = response.last_modified
+        rec.content_length = response.content_length
+        rec.fetched_at_epoch = response.fetched_at_epoch
+        rec.timing = response.timing.to_dict() if response.timing else None
+        text = response.text or ""
+        if rec.category != "gem_enchant_reference":
+            rec.markup_fingerprint = markup_fingerprint(text)
+        if self.slim and rec.local_path.endswith(BLOB_SUFFIX):
+            rec.local_path = slim_relpath(rec.local_path)
+            text = json.dumps(slim_page_record(rec.url, text), ensure_ascii=False, separators=(",", ":"))
+        if self.corpus is not None:
+            self.corpus.put_page(rec.local_path, text.encode("utf-8"), asdict(rec))
+            if self.on_saved is not None:
+                self.on_saved(rec)
+            return
+        rec.local_path += COMPRESSION_SUFFIXES.get(self.compression or "", "")
+        if self.use_blobs:
+            spec_rel = rec.local_path
+            rec.local_path, _ = write_blob(
+                self.root, text.encode("utf-8"), self.compression, base_page_suffix(spec_rel)
+            )
+            if self.hardlinks:
+                link_into_spec_dir(self.root, rec.local_path, spec_rel)
+                rec.spec_path = spec_rel
+        else:
+            previous = self.validators(rec.url)
+            unchanged = response.not_modified and previous and previous.get("local_path") == rec.local_path
+            if not unchanged and response.stored_path != rec.local_path:
+                write_file(self.root / rec.local_path, text, self.compression)
+        if self.on_saved is not None:
+            self.on_saved(rec)
+
+
+class FetchCache:
+    """Run-wide URL -> response cache shared by every spec and both fetch passes.
+
+    Entries are keyed by fetch_key(), so each distinct URL (or item/spell/skill
+    entity, whatever slug links to it) hits the network at most once per run;
+    later specs that reference the same page reuse it (and still get their own
+    manifest entry). Once a page is saved, stored() swaps the cached body for
+    the file it went to, and reuses read it back through ``read_stored``
+    (PageStore.read_path), so the run does not hold every page in memory.
+    Failures are cached too, so a dead URL is not retried once per spec; a
+    fetch the budget refused is not a failure and is neither cached nor
+    counted in ``fetched``. Async callers share the in-flight task, so two
+    specs asking for the same page concurrently still trigger a single
+    request.
+    """
+
+    def __init__(self, read_stored: Callable[[str], str]) -> None:
+        self.read_stored = read_stored
+        self._results: Dict[str, Union[PageResponse, Exception]] = {}
+        self._tasks: Dict[str, "asyncio.Future[PageResponse]"] = {}
+        self.reused = 0
+
+    @property
+    def fetched(self) -> int:
+        return len(self._results) + len(self._tasks)
+
+    def get(self, url: str, fetch: Callable[[str], PageResponse]) -> PageResponse:
+        key = fetch_key(url)
+        if key in self._results:
+            self.reused += 1
+            outcome = self._results[key]
+        else:
+            try:
+                outcome = fetch(url)
+            except BudgetExhausted:
+                raise
+            except Exception as exc:  # noqa: BLE001
+                outcome = exc
+            self._results[key] = outcome
+        if isinstance(outcome, Exception):
+            raise outcome
+        return self._with_text(outcome)
+
+    async def get_async(
+        self, url: str, fetch: Callable[[str], Awaitable[PageResponse]]
+    ) -> PageResponse:
+        key = fetch_key(url)
+        stored = self._results.get(key)
+        if isinstance(stored, PageResponse):
+            self.reused += 1
+            # Reading a stored page back decodes it (gzip/zstd/blob/corpus); keep that off the loop.
+            return await asyncio.to_thread(self._with_text, stored)
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetch(url))
+            self._tasks[key] = task
+        else:
+            self.reused += 1
+        try:
+            return await task
+        except BudgetExhausted:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+            raise
+
+    def stored(self, url: str, local_path: str) -> None:
+        """Keep only where a fetched page was saved; later reuses read the body from there."""
+        key = fetch_key(url)
+        response = self._results.get(key)
+        task = self._tasks.get(key)
+        if task is not None and task.done() and not task.cancelled() and task.exception() is None:
+            response = task.result()
+        if isinstance(response, PageResponse) and response.text is not None:
+            self._results[key] = replace(response, text=None, stored_path=local_path)
+            self._tasks.pop(key, None)
+
+    def _with_text(self, response: PageResponse) -> PageResponse:
+        if response.text is None and response.stored_path is not None:
+            return replace(response, text=self.read_stored(response.stored_path))
+        return response
+
+
+# Fetch priority classes, most valuable first. Phase guides are the only pages
+# the Lua data is built from; reference pages only add offline context.
+PRIORITY_PHASE = 0
+PRIORITY_GUIDE = 1
+PRIORITY_REFERENCE = 2
+PRIORITY_LABELS = ("seed/phase guides", "other guides", "reference pages")
+
+
+def fetch_priority(category: str) -> int:
+    if category.startswith("phase_"):
+        return PRIORITY_PHASE
+    if category == "gem_enchant_reference":
+        return PRIORITY_REFERENCE
+    return PRIORITY_GUIDE
+
+
+class BudgetExhausted(RuntimeError):
+    """Raised instead of fetching once the run's request or time budget is spent."""
+
+
+class FetchBudget:
+    """Run-wide cap on network page fetches and wall-clock time.
+
+    Every network fetch asks admit() first. Because specs are processed one
+    priority class at a time (see process_specs), the budget is spent on
+    phase guides before any lower class is fetched; whatever is refused is
+    left for a later ``--resume`` run. Cache hits and pages restored from the
+    journal cost nothing.
+    """
+
+    def __init__(self, max_requests: Optional[int] = None, deadline: Optional[float] = None) -> None:
+        self.max_requests = max_requests
+        self.deadline = deadline
+        self.started = time.monotonic()
+        self.admitted = [0] * len(PRIORITY_LABELS)
+        self.deferred = [0] * len(PRIORITY_LABELS)
+        self.exhausted_by: Optional[str] = None
+
+    @property
+    def limited(self) -> bool:
+        return self.max_requests is not None or self.deadline is not None
+
+    def admit(self, priority: int) -> None:
+        if self.exhausted_by is None:
+            if self.max_requests is not None and sum(self.admitted) >= self.max_requests:
+                self.exhausted_by = f"--max-requests {self.max_requests}"
+            elif self.deadline is not None and time.monotonic() - self.started >= self.deadline:
+                self.exhausted_by = f"--deadline {self.deadline:g}s"
+        if self.exhausted_by is not None:
+            self.deferred[priority] += 1
+            raise BudgetExhausted(f"fetch budget spent ({self.exhausted_by})")
+        self.admitted[priority] += 1
+
+    def describe(self) -> str:
+        parts = [
+            f"{label}: {done} fetched" + (f", {left} deferred" if left else "")
+            for label, done, left in zip(PRIORITY_LABELS, self.admitted, self.deferred)
+        ]
+        text = "; ".join(parts)
+        if self.exhausted_by is not None:
+            text += f" (budget {self.exhausted_by} spent after {time.monotonic() - self.started:.1f}s)"
+        return text
+
+
+# How often a worker re-checks a page or spec another worker is busy with.
+QUEUE_POLL_SECONDS = 0.5
+# Request ids are numbered per worker from worker_number * this, so they stay
+# unique when the workers' specs are merged into one manifest.
+REQUEST_ID_STRIDE = 1_000_000
+
+
+class SharedFetchCache(FetchCache):
+    """FetchCache for a --work-queue worker: each page is fetched by one worker only.
+
+    Before fetching, the page is claimed in the queue. If another worker
+    already stored it, its file is read from the shared output directory; if
+    another worker is fetching it right now, this one waits for the result.
+    PageStore.on_saved must call publish() so waiting workers see the page.
+    """
+
+    def __init__(self, queue: CrawlQueue, store: PageStore) -> None:
+        super().__init__(store.read_path)
+        self.queue = queue
+        self.store = store
+        self.shared = 0
+
+    def get(self, url: str, fetch: Callable[[str], PageResponse]) -> PageResponse:
+        return super().get(url, lambda u: self._claim_and_fetch(u, fetch))
+
+    def _claim_and_fetch(self, url: str, fetch: Callable[[str], PageResponse]) -> PageResponse:
+        key = fetch_key(url)
+        claim = self.queue.claim_page(key, url)
+        while claim.state not in {CLAIMED, DONE, FAILED}:
+            time.sleep(QUEUE_POLL_SECONDS)
+            claim = self.queue.claim_page(key, url)
+        if claim.state == DONE:
+            self.shared += 1
+            return self._stored_response(claim)
+        if claim.state == FAILED:
+            raise RuntimeError(claim.error)
+        try:
+            return fetch(url)
+        except BudgetExhausted:
+            self.queue.release_page(key)
+            raise
+        except Exception as exc:
+            self.queue.page_failed(key, str(exc))
+            raise
+
+    def _stored_response(self, claim: PageClaim) -> PageResponse:
+        fields = claim.response or {}
+        timing = fields.get("timing")
+        return PageResponse(
+            text=self.store.read_path(claim.local_path or ""),
+            etag=fields.get("etag"),
+            last_modified=fields.get("last_modified"),
+            content_length=fields.get("content_length"),
+            fetched_at_epoch=fields.get("fetched_at_epoch") or 0,
+            timing=RequestTiming(**timing) if timing else None,
+            stored_path=claim.local_path,
+        )
+
+    def publish(self, rec: GuideRecord) -> None:
+        self.queue.page_done(
+            fetch_key(rec.url),
+            rec.local_path,
+            {
+                "etag": rec.etag,
+                "last_modified": rec.last_modified,
+                "content_length": rec.content_length,
+                "fetched_at_epoch": rec.fetched_at_epoch,
+                "timing": rec.timing,
+            },
+        )
+
+
+class DownloadJournal:
+    """Append-only JSONL log of finished pages so an interrupted run can resume.
+
+    Every stored page, failed URL and finished spec is written as one line and
+    flushed immediately, after a "run" line holding the store's
+    PageStore.storage_options(). With ``resume=True`` the existing journal is
+    replayed first: finished specs are rebuilt without any requests and
+    partially done specs only fetch the pages that are still missing. Pages
+    journaled under other storage options, or whose stored copy is gone
+    (``has_page`` is false), are dropped and fetched again, and so is the rest
+    of their spec's finished state.
+    """
+
+    def __init__(
+        self,
+        path: pathlib.Path,
+        resume: bool = False,
+        storage: Optional[Dict[str, Any]] = None,
+        has_page: Optional[Callable[[GuideRecord], bool]] = None,
+    ) -> None:
+        self.path = path
+        self.storage = storage or {}
+        self._lock = threading.Lock()
+        self._specs: Dict[str, Dict[str, Any]] = {}
+        self._pages: Dict[str, Dict[str, GuideRecord]] = {}
+        self._finished: Dict[str, List[str]] = {}
+        self._dropped: Dict[str, Set[str]] = {}
+        if resume and path.is_file():
+            self._load(has_page)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = path.open("a" if resume else "w", encoding="utf-8")
+        self._append({"type": "run", "storage": self.storage})
+
+    def _load(self, has_page: Optional[Callable[[GuideRecord], bool]]) -> None:
+        known_fields = set(GuideRecord.__dataclass_fields__)
+        # Journals written before the "run" line existed say nothing about
+        # their storage options; their pages are fetched again.
+        same_storage = False
+        with self.path.open(encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a torn final line; everything before it is valid.
+                    continue
+                seed_url = entry.get("seed_url")
+                kind = entry.get("type")
+                if kind == "run":
+                    same_storage = entry.get("storage") == self.storage
+                elif kind == "spec":
+                    self._specs[seed_url] = entry
+                elif kind == "page":
+                    fields = {k: v for k, v in entry["record"].items() if k in known_fields}
+                    rec = GuideRecord(**fields)
+                    pages = self._pages.setdefault(seed_url, {})
+                    dropped = self._dropped.setdefault(seed_url, set())
+                    # A later run may have stored the page again; the last line wins.
+                    if same_storage and (has_page is None or has_page(rec)):
+                        pages[rec.url] = rec
+                        dropped.discard(rec.url)
+                    else:
+                        pages.pop(rec.url, None)
+                        dropped.add(rec.url)
+                elif kind == "spec_done":
+                    self._finished[seed_url] = list(entry.get("warnings", []))
+
+    @property
+    def resumed_page_count(self) -> int:
+        return sum(len(pages) for pages in self._pages.values())
+
+    @property
+    def finished_spec_count(self) -> int:
+        return sum(1 for seed_url in self._finished if not self._dropped.get(seed_url))
+
+    @property
+    def dropped_pages(self) -> int:
+        return sum(len(urls) for urls in self._dropped.values())
+
+    def completed_pages(self, seed_url: str) -> Dict[str, GuideRecord]:
+        """URL -> record for pages of this spec that a previous run already stored."""
+        return dict(self._pages.get(seed_url, {}))
+
+    def finished_result(self, seed_url: str) -> Optional[SpecResult]:
+        """Rebuild a spec the journal marks as finished, or None if it needs work."""
+        if seed_url not in self._finished or seed_url not in self._specs or self._dropped.get(seed_url):
+            return None
+        header = self._specs[seed_url]
+        return SpecResult(
+            spec_key=header["spec_key"],
+            seed_url=seed_url,
+            layout=header["layout"],
+            covered_specs=list(header["covered_specs"]),
+            guides=list(self._pages.get(seed_url, {}).values()),
+            warnings=self._finished[seed_url],
+        )
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._fh.write(json.dumps(entry) + "\n")
+            self._fh.flush()
+
+    def spec_started(self, result: SpecResult) -> None:
+        self._append(
+            {
+                "type": "spec",
+                "seed_url": result.seed_url,
+                "spec_key": result.spec_key,
+                "layout": result.layout,
+                "covered_specs": result.covered_specs,
+            }
+        )
+
+    def page_done(self, result: SpecResult, rec: GuideRecord) -> None:
+        self._append({"type": "page", "seed_url": result.seed_url, "record": asdict(rec)})
+
+    def page_failed(self, result: SpecResult, url: str, error: Exception) -> None:
+        self._append({"type": "failure", "seed_url": result.seed_url, "url": url, "error": str(error)})
+
+    def spec_finished(self, result: SpecResult) -> None:
+        self._append({"type": "spec_done", "seed_url": result.seed_url, "warnings": result.warnings})
+
+    def close(self) -> None:
+        self._fh.close()
 
 
 def unique_records(records: Iterable[GuideRecord]) -> List[GuideRecord]:
@@ -474,21 +1707,8 @@ def unique_records(records: Iterable[GuideRecord]) -> List[GuideRecord]:
     return out
 
 
-def process_spec(
-    seed_url: str,
-    output_root: pathlib.Path,
-    min_delay: float,
-    max_delay: float,
-    browser_page: Optional[Any] = None,
-    browser_wait_ms: int = 3000,
-) -> SpecResult:
-    if browser_page is not None:
-        seed_html = fetch_via_browser(
-            seed_url, browser_page, wait_after_load_ms=browser_wait_ms,
-            min_delay=min_delay, max_delay=max_delay,
-        )
-    else:
-        seed_html = fetch_url(seed_url, min_delay=min_delay, max_delay=max_delay)
+def plan_spec(seed_url: str, seed_html: str) -> Tuple[SpecResult, List[GuideRecord]]:
+    """Build the SpecResult shell and the ordered list of guide pages to fetch."""
     spec_key = discover_spec_key(seed_url, seed_html)
     result = SpecResult(spec_key=spec_key, seed_url=seed_url)
     layout, covered_specs = infer_layout_and_coverage(seed_url, seed_html, spec_key)
@@ -566,72 +1786,769 @@ def process_spec(
                     )
                 )
 
-    planned = unique_records(planned)
+    return result, unique_records(planned)
 
-    for rec in planned:
-        try:
-            if rec.url == seed_url:
-                page_html = seed_html
-            elif browser_page is not None:
-                page_html = fetch_via_browser(
-                    rec.url, browser_page, wait_after_load_ms=browser_wait_ms,
-                    min_delay=min_delay, max_delay=max_delay,
-                )
-            else:
-                page_html = fetch_url(rec.url, min_delay=min_delay, max_delay=max_delay)
-            full_local_path = output_root / rec.local_path
-            write_file(full_local_path, page_html)
-            result.guides.append(rec)
-        except Exception as exc:  # noqa: BLE001
-            result.warnings.append(f"Failed to download {rec.url}: {exc}")
 
-    # Fetch gem/enchant referenced pages from all downloaded guides for richer offline context.
-    extra_links: Set[str] = set()
-    for rec in list(result.guides):
-        full_path = output_root / rec.local_path
-        page_html = full_path.read_text(encoding="utf-8")
-        hrefs = re.findall(r'href=["\']([^"\']+)["\']', page_html)
-        is_enchants_page = rec.category == "enchants_gems"
-        for raw_href in hrefs:
-            href = html_lib.unescape(raw_href).replace("\\/", "/")
-            lowered = href.lower()
-            absolute = urllib.parse.urljoin(WOWHEAD_ROOT, href)
-            if not absolute.startswith(WOWHEAD_ROOT + "/tbc/"):
+def extract_reference_links(page_html: str, category: str) -> Set[str]:
+    """Return gem/enchant-related Wowhead URLs linked from one downloaded guide."""
+    links: Set[str] = set()
+    hrefs = HREF_PATTERN.findall(page_html)
+    is_enchants_page = category == "enchants_gems"
+    for raw_href in hrefs:
+        href = html_lib.unescape(raw_href).replace("\\/", "/")
+        lowered = href.lower()
+        absolute = urllib.parse.urljoin(WOWHEAD_ROOT, href)
+        if not absolute.startswith(WOWHEAD_ROOT + "/tbc/"):
+            continue
+        # Enchants/Gems pages mostly link directly to item/spell/skill URLs,
+        # which often do not contain "gem" or "enchant" in the URL itself.
+        if is_enchants_page:
+            if not re.search(r"/tbc/(item=|spell=|skill=|guide/)", absolute):
                 continue
-            # Enchants/Gems pages mostly link directly to item/spell/skill URLs,
-            # which often do not contain "gem" or "enchant" in the URL itself.
-            if is_enchants_page:
-                if not re.search(r"/tbc/(item=|spell=|skill=|guide/)", absolute):
-                    continue
-            else:
-                if "gem" not in lowered and "enchant" not in lowered:
-                    continue
-            extra_links.add(absolute)
+        else:
+            if "gem" not in lowered and "enchant" not in lowered:
+                continue
+        links.add(absolute)
+    return links
+
+
+def stored_reference_links(store: PageStore, guides: List[GuideRecord]) -> Set[str]:
+    """extract_reference_links() over the stored copies of ``guides``."""
+    links: Set[str] = set()
+    for rec in guides:
+        links |= extract_reference_links(store.read(rec), rec.category)
+    return links
+
+
+def resolve_href(raw_href: str) -> str:
+    href = html_lib.unescape(raw_href).replace("\\/", "/")
+    return urllib.parse.urljoin(WOWHEAD_ROOT, href)
+
+
+def slim_page_record(url: str, page_html: str) -> Dict[str, Any]:
+    """Keep only the parts of a page that the downloader, parser and extractor read.
+
+    That is every literal WH.markup.printHtml(...) argument (with its target
+    element), the guide nav JSON, the guide map, the guide URLs in page order,
+    the data-class/data-spec attributes, /tbc/ links, and the <noscript>
+    fallback when the page has no guide-body markup.
+    """
+    calls = [asdict(call) for call in iter_print_html_calls(page_html)]
+    noscript = None
+    if not any(call["target"] == "guide-body" for call in calls):
+        m = NOSCRIPT_PATTERN.search(page_html)
+        noscript = m.group(1) if m else None
+    nav = GUIDE_NAV_ID_PATTERN.search(page_html)
+    data_class = DATA_CLASS_PATTERN.search(page_html)
+    data_spec = DATA_SPEC_PATTERN.search(page_html)
+    text = page_html.replace("\\/", "/")
+    links = [
+        href for href in HREF_PATTERN.findall(page_html)
+        if resolve_href(href).startswith(WOWHEAD_ROOT + "/tbc/")
+    ]
+    return {
+        "format": SLIM_FORMAT,
+        "url": url,
+        "data_class": data_class.group(1) if data_class else None,
+        "data_spec": data_spec.group(1) if data_spec else None,
+        "nav": [nav.group(1), nav.group(2)] if nav else None,
+        "guide_map": {guide_id: [name, guide_url] for guide_id, name, guide_url in GUIDE_MAP_PATTERN.findall(text)},
+        "guide_urls": list(dict.fromkeys(GUIDE_URL_PATTERN.findall(text))),
+        "links": list(dict.fromkeys(links)),
+        "print_html": calls,
+        "noscript": noscript,
+    }
 
-    for url in sorted(extra_links):
-        if any(g.url == url for g in result.guides):
-            continue
-        try:
-            if browser_page is not None:
-                html = fetch_via_browser(
-                    url, browser_page, wait_after_load_ms=browser_wait_ms,
-                    min_delay=min_delay, max_delay=max_delay,
-                )
-            else:
-                html = fetch_url(url, min_delay=min_delay, max_delay=max_delay)
-            rec = GuideRecord(
-                label="Referenced Gem/Enchant Page",
+
+def render_slim_page(record: Dict[str, Any]) -> str:
+    """Rebuild a minimal page from a slim record that the downloader's own regexes read like the original.
+
+    Guide URLs come first so the fallback discovery in plan_spec sees them in
+    their original order; slim_page_record(render_slim_page(r)) == r.
+    """
+    parts = ["\n".join(record.get("guide_urls") or [])]
+    parts.extend(f'<a href="{href}"></a>' for href in record.get("links") or [])
+    if record.get("data_class"):
+        parts.append(f'<div data-class="{record["data_class"]}"></div>')
+    if record.get("data_spec"):
+        parts.append(f'<div data-spec="{record["data_spec"]}"></div>')
+    if record.get("nav"):
+        nav_id, nav_json = record["nav"]
+        parts.append(f'<script type="application/json" id="{nav_id}">{nav_json}</script>')
+    guide_map = record.get("guide_map") or {}
+    if guide_map:
+        entries = ",".join(
+            f'"{guide_id}":{{"name":"{name}","category":0,"url":"{guide_url}"}}'
+            for guide_id, (name, guide_url) in guide_map.items()
+        )
+        parts.append(f"<script>var guides = {{{entries}}};</script>")
+    for call in record.get("print_html") or []:
+        if call.get("target") is not None:
+            parts.append(f'<script>WH.markup.printHtml("{call["markup_js"]}", "{call["target"]}");</script>')
+        elif call.get("single_argument"):
+            parts.append(f'<script>WH.markup.printHtml("{call["markup_js"]}");</script>')
+        else:
+            parts.append(f'<script>WH.markup.printHtml("{call["markup_js"]}", null);</script>')
+    if record.get("noscript") is not None:
+        parts.append(f"<noscript>{record['noscript']}</noscript>")
+    return "\n".join(parts)
+
+
+def slim_relpath(local_path: str) -> str:
+    """Swap a page path's .html suffix for .slim.json (keeping any compression suffix)."""
+    if local_path.endswith(BLOB_SUFFIX):
+        return local_path[: -len(BLOB_SUFFIX)] + SLIM_SUFFIX
+    return local_path
+
+
+def plan_references(
+    spec_key: str,
+    links: Iterable[str],
+    downloaded: Iterable[GuideRecord],
+    item_xml: bool = False,
+) -> List[GuideRecord]:
+    """One record per distinct referenced page, with slug variants kept as aliases.
+
+    Links are grouped by fetch_key(); the lexicographically first URL of each
+    group is fetched and the rest are recorded on the record's ``aliases``.
+    With ``item_xml`` item= links are fetched as the item's ?xml document
+    instead, and every linked page URL becomes an alias. Pages already
+    downloaded for this spec are skipped.
+    """
+    done = {fetch_key(rec.url) for rec in downloaded}
+    groups: Dict[str, List[str]] = {}
+    for url in sorted(links):
+        key = fetch_key(reference_fetch_url(url, item_xml))
+        if key not in done:
+            groups.setdefault(key, []).append(url)
+    records: List[GuideRecord] = []
+    for urls in groups.values():
+        url = reference_fetch_url(urls[0], item_xml)
+        if url != urls[0]:
+            filename = safe_filename_for_url(url)[: -len(BLOB_SUFFIX)] + XML_SUFFIX
+            label, aliases = "Referenced Gem/Enchant Item (XML)", urls
+        else:
+            filename = safe_filename_for_url(url)
+            label, aliases = "Referenced Gem/Enchant Page", urls[1:]
+        records.append(
+            GuideRecord(
+                label=label,
                 guide_id=None,
                 url=url,
-                local_path=str(pathlib.Path(spec_key) / safe_filename_for_url(url)),
+                local_path=str(pathlib.Path(spec_key) / filename),
                 category="gem_enchant_reference",
+                entity_key=entity_key_for_url(url),
+                aliases=aliases,
+            )
+        )
+    return records
+
+
+def build_item_reference_db(results: List[SpecResult], store: PageStore) -> Dict[str, Any]:
+    """Collect parsed ?xml item documents from every spec into one id -> fields mapping."""
+    items: Dict[str, Dict[str, Any]] = {}
+    for res in results:
+        for rec in res.guides:
+            entity = canonical_entity(rec.url)
+            if not is_item_xml_url(rec.url) or entity is None or str(entity[1]) in items:
+                continue
+            try:
+                parsed = parse_item_xml(store.read(rec))
+            except OSError:
+                continue
+            if parsed is not None:
+                items[str(entity[1])] = parsed
+    return {
+        "generated_at_epoch": int(time.time()),
+        "source": "https://www.wowhead.com/tbc/item=<id>?xml",
+        "items": dict(sorted(items.items(), key=lambda kv: int(kv[0]))),
+    }
+
+
+def spec_stages(
+    seed_url: str,
+    store: PageStore,
+    min_delay: float,
+    max_delay: float,
+    budget: FetchBudget,
+    browser_pool: Optional[BrowserPool] = None,
+    fetch_cache: Optional[FetchCache] = None,
+    journal: Optional[DownloadJournal] = None,
+    item_xml: bool = False,
+) -> Iterator[Optional[SpecResult]]:
+    """Download one spec a priority class at a time.
+
+    Fetches the seed and phase guides, yields None, fetches the other guides,
+    yields None, fetches the referenced pages and finally yields the
+    SpecResult. process_specs() advances every spec through a stage before
+    starting the next one. Pages refused by ``budget`` are counted in
+    ``deferred_pages`` and the spec is left unfinished in the journal.
+    """
+    fetch_cache = fetch_cache or FetchCache(store.read_path)
+    if journal is not None:
+        finished = journal.finished_result(seed_url)
+        if finished is not None:
+            yield finished
+            return
+    resumed = journal.completed_pages(seed_url) if journal is not None else {}
+
+    def fetch_network(url: str, category: str) -> PageResponse:
+        budget.admit(fetch_priority(category))
+        # ?xml documents need no rendering; fetch them directly even in browser mode.
+        if browser_pool is not None and not is_item_xml_url(url):
+            return fetch_via_browser(
+                url, browser_pool, min_delay=min_delay, max_delay=max_delay, category=category
             )
-            write_file(output_root / rec.local_path, html)
+        response = fetch_page(
+            url, min_delay=min_delay, max_delay=max_delay, validators=store.validators(url), category=category
+        )
+        return store.fill_unchanged_text(url, response)
+
+    def fetch(url: str, category: str) -> PageResponse:
+        return fetch_cache.get(url, lambda u: fetch_network(u, category))
+
+    def download(rec: GuideRecord, response: PageResponse) -> str:
+        store.store(rec, response)
+        fetch_cache.stored(rec.url, rec.local_path)
+        if response.not_modified:
+            result.unchanged_pages += 1
+        result.guides.append(rec)
+        if journal is not None:
+            journal.page_done(result, rec)
+        return response.text or ""
+
+    def failed(url: str, exc: Exception, message: str) -> None:
+        if isinstance(exc, BudgetExhausted):
+            result.deferred_pages += 1
+            return
+        result.warnings.append(message)
+        if journal is not None:
+            journal.page_failed(result, url, exc)
+
+    def download_all(records: List[GuideRecord], what: str) -> None:
+        for rec in records:
+            if rec.url in resumed:
+                result.guides.append(resumed[rec.url])
+                continue
+            try:
+                if rec.url == seed_url and seed_response is not None:
+                    download(rec, seed_response)
+                else:
+                    download(rec, fetch(rec.url, rec.category))
+            except Exception as exc:  # noqa: BLE001
+                failed(rec.url, exc, f"Failed to download {what}{rec.url}: {exc}")
+
+    seed_response: Optional[PageResponse] = None
+    if seed_url in resumed:
+        seed_html = store.read(resumed[seed_url])
+    else:
+        seed_response = fetch(seed_url, "phase_pre_raid")
+        seed_html = seed_response.text or ""
+    result, planned = plan_spec(seed_url, seed_html)
+    if journal is not None:
+        journal.spec_started(result)
+
+    download_all([rec for rec in planned if fetch_priority(rec.category) == PRIORITY_PHASE], "")
+    # Other specs' stages run before this one resumes; do not hold the seed page meanwhile.
+    seed_response = None
+    seed_html = ""
+    yield None
+    download_all([rec for rec in planned if fetch_priority(rec.category) != PRIORITY_PHASE], "")
+    yield None
+
+    # Fetch gem/enchant referenced pages from all downloaded guides for richer offline context.
+    extra_links = stored_reference_links(store, list(result.guides))
+    download_all(plan_references(result.spec_key, extra_links, result.guides, item_xml=item_xml), "referenced page ")
+
+    finish_spec(result, journal)
+    yield result
+
+
+async def spec_stages_async(
+    seed_url: str,
+    store: PageStore,
+    min_delay: float,
+    max_delay: float,
+    in_flight: asyncio.Semaphore,
+    budget: FetchBudget,
+    fetch_cache: Optional[FetchCache] = None,
+    journal: Optional[DownloadJournal] = None,
+    item_xml: bool = False,
+    browser_pool: Optional[BrowserPool] = None,
+) -> AsyncIterator[Optional[SpecResult]]:
+    """Asyncio variant of spec_stages: each stage's pages are fetched concurrently.
+
+    Pacing still goes through the global request slot, so concurrency only
+    overlaps network latency, parsing and disk writes; it never raises the
+    request rate above the configured delay budget.
+    """
+    fetch_cache = fetch_cache or FetchCache(store.read_path)
+    if journal is not None:
+        finished = journal.finished_result(seed_url)
+        if finished is not None:
+            yield finished
+            return
+    resumed = journal.completed_pages(seed_url) if journal is not None else {}
+
+    async def fetch_network(url: str, category: str) -> PageResponse:
+        async with in_flight:
+            budget.admit(fetch_priority(category))
+            if browser_pool is not None and not is_item_xml_url(url):
+                return await fetch_via_browser_async(
+                    url, browser_pool, min_delay=min_delay, max_delay=max_delay, category=category
+                )
+            response = await fetch_page_async(
+                url, min_delay=min_delay, max_delay=max_delay, validators=store.validators(url), category=category
+            )
+        return await asyncio.to_thread(store.fill_unchanged_text, url, response)
+
+    async def fetch(url: str, category: str) -> PageResponse:
+        return await fetch_cache.get_async(url, lambda u: fetch_network(u, category))
+
+    async def download(rec: GuideRecord, response: Optional[PageResponse] = None) -> str:
+        if rec.url in resumed:
+            return await asyncio.to_thread(store.read, rec)
+        response = response or await fetch(rec.url, rec.category)
+        await asyncio.to_thread(store.store, rec, response)
+        fetch_cache.stored(rec.url, rec.local_path)
+        if response.not_modified:
+            result.unchanged_pages += 1
+        if journal is not None:
+            journal.page_done(result, rec)
+        return response.text or ""
+
+    def failed(url: str, exc: BaseException, message: str) -> None:
+        if isinstance(exc, BudgetExhausted):
+            result.deferred_pages += 1
+            return
+        result.warnings.append(message)
+        if journal is not None and isinstance(exc, Exception):
+            journal.page_failed(result, url, exc)
+
+    async def download_all(records: List[GuideRecord], what: str) -> None:
+        outcomes = await asyncio.gather(
+            *(download(rec, seed_response if rec.url == seed_url else None) for rec in records),
+            return_exceptions=True,
+        )
+        for rec, outcome in zip(records, outcomes):
+            if isinstance(outcome, BaseException):
+                failed(rec.url, outcome, f"Failed to download {what}{rec.url}: {outcome}")
+                continue
             result.guides.append(rec)
+
+    seed_response: Optional[PageResponse] = None
+    if seed_url in resumed:
+        seed_html = await asyncio.to_thread(store.read, resumed[seed_url])
+    else:
+        seed_response = await fetch(seed_url, "phase_pre_raid")
+        seed_html = seed_response.text or ""
+    result, planned = plan_spec(seed_url, seed_html)
+    planned = [resumed.get(rec.url, rec) for rec in planned]
+    if journal is not None:
+        journal.spec_started(result)
+
+    await download_all([rec for rec in planned if fetch_priority(rec.category) == PRIORITY_PHASE], "")
+    # Other specs' stages run before this one resumes; do not hold the seed page meanwhile.
+    seed_response = None
+    seed_html = ""
+    yield None
+    await download_all([rec for rec in planned if fetch_priority(rec.category) != PRIORITY_PHASE], "")
+    yield None
+
+    # Decoding ~40 stored guides would stall every other spec's fetches on the loop.
+    extra_links = await asyncio.to_thread(stored_reference_links, store, list(result.guides))
+    references = [
+        resumed.get(rec.url, rec)
+        for rec in plan_references(result.spec_key, extra_links, result.guides, item_xml=item_xml)
+    ]
+    await download_all(references, "referenced page ")
+
+    finish_spec(result, journal)
+    yield result
+
+
+def finish_spec(result: SpecResult, journal: Optional[DownloadJournal]) -> None:
+    """Mark a spec done in the journal, unless the budget left pages for a later run."""
+    if result.deferred_pages:
+        result.warnings.append(
+            f"Deferred {result.deferred_pages} pages past the fetch budget; rerun with --resume to fetch them"
+        )
+    elif journal is not None:
+        journal.spec_finished(result)
+
+
+def report_spec_result(res: SpecResult) -> None:
+    print(
+        f"  - {res.spec_key}: downloaded {len(res.guides)} pages"
+        + (f" ({res.unchanged_pages} unchanged)" if res.unchanged_pages else "")
+        + (f", {res.deferred_pages} deferred" if res.deferred_pages else "")
+        + (f", warnings={len(res.warnings)}" if res.warnings else "")
+        + f" [{RATE_LIMITER.describe()}]"
+    )
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of ``values`` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(len(ordered) * pct / 100))
+    return ordered[rank - 1]
+
+
+def summarize_request_timings(results: List[SpecResult]) -> Dict[str, Dict[str, Any]]:
+    """Per-category request telemetry; a page shared by several specs counts once, under its first category."""
+    by_category: Dict[str, List[Dict[str, Any]]] = {}
+    seen: Set[int] = set()
+    for res in sorted(results, key=lambda r: r.spec_key):
+        for rec in sorted(res.guides, key=lambda g: (g.category, g.url)):
+            timing = rec.timing
+            if not timing or timing.get("request_id") in seen:
+                continue
+            seen.add(timing["request_id"])
+            by_category.setdefault(rec.category, []).append(timing)
+
+    summary: Dict[str, Dict[str, Any]] = {}
+    for category, timings in sorted(by_category.items()):
+        totals = [t["total"] for t in timings]
+        ttfbs = [t["ttfb"] for t in timings if t.get("ttfb") is not None]
+        statuses: Dict[str, int] = {}
+        for t in timings:
+            statuses[str(t.get("status"))] = statuses.get(str(t.get("status")), 0) + 1
+        summary[category] = {
+            "requests": len(timings),
+            "bytes": sum(t.get("bytes") or 0 for t in timings),
+            "retries": sum(t.get("retries") or 0 for t in timings),
+            "truncated": sum(1 for t in timings if t.get("truncated")),
+            "throttled": sum(t.get("throttled") or 0 for t in timings),
+            "statuses": statuses,
+            "queue_wait_seconds": round(sum(t.get("queue_wait") or 0.0 for t in timings), 3),
+            "total_seconds": round(sum(totals), 3),
+            "total_p50": percentile(totals, 50),
+            "total_p95": percentile(totals, 95),
+            "total_p99": percentile(totals, 99),
+            "ttfb_p50": percentile(ttfbs, 50),
+            "ttfb_p95": percentile(ttfbs, 95),
+            "ttfb_p99": percentile(ttfbs, 99),
+        }
+    return summary
+
+
+def report_request_telemetry(summary: Dict[str, Dict[str, Any]]) -> None:
+    def fmt(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.3f}"
+
+    print("Request telemetry (seconds; p50/p95/p99):")
+    for category, stats in summary.items():
+        line = (
+            f"  - {category}: {stats['requests']} requests, {format_bytes(stats['bytes'])}, "
+            f"total {fmt(stats['total_p50'])}/{fmt(stats['total_p95'])}/{fmt(stats['total_p99'])}, "
+            f"ttfb {fmt(stats['ttfb_p50'])}/{fmt(stats['ttfb_p95'])}/{fmt(stats['ttfb_p99'])}, "
+            f"queue wait {stats['queue_wait_seconds']:.1f}s"
+        )
+        if stats["retries"]:
+            line += f", {stats['retries']} retries ({stats['throttled']} throttled)"
+        if stats.get("truncated"):
+            line += f", {stats['truncated']} read up to the guide payload"
+        print(line)
+
+
+def process_specs(
+    seed_urls: List[str],
+    store: PageStore,
+    min_delay: float,
+    max_delay: float,
+    budget: FetchBudget,
+    fetch_cache: FetchCache,
+    journal: Optional[DownloadJournal] = None,
+    item_xml: bool = False,
+    on_spec_finished: Optional[Callable[[str, Optional[SpecResult]], None]] = None,
+    browser_pool: Optional[BrowserPool] = None,
+    previous_specs: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[SpecResult]:
+    """Run every spec's seed/phase stage, then every spec's guide stage, then the references.
+
+    ``previous_specs`` maps seed URL -> the previous manifest's entry; a spec
+    the fetch budget cuts short keeps the pages it did not get to from there
+    (see keep_previous_pages).
+    """
+    previous_specs = previous_specs or {}
+    active = {
+        seed_url: spec_stages(
+            seed_url, store, min_delay, max_delay, budget,
+            browser_pool=browser_pool, fetch_cache=fetch_cache, journal=journal, item_xml=item_xml,
+        )
+        for seed_url in seed_urls
+    }
+    finished: Dict[str, SpecResult] = {}
+    while active:
+        for seed_url, stages in list(active.items()):
+            try:
+                res = next(stages)
+            except Exception as exc:  # noqa: BLE001
+                del active[seed_url]
+                res = spec_failed(seed_url, exc, on_spec_finished, previous_specs.get(seed_url))
+                if res is not None:
+                    finished[seed_url] = res
+                continue
+            if res is not None:
+                del active[seed_url]
+                finished[seed_url] = keep_previous_pages(res, previous_specs.get(seed_url))
+                spec_done(res, on_spec_finished)
+    return [finished[url] for url in seed_urls if url in finished]
+
+
+async def process_specs_async(
+    seed_urls: List[str],
+    store: PageStore,
+    min_delay: float,
+    max_delay: float,
+    concurrency: int,
+    budget: FetchBudget,
+    fetch_cache: FetchCache,
+    journal: Optional[DownloadJournal] = None,
+    item_xml: bool = False,
+    on_spec_finished: Optional[Callable[[str, Optional[SpecResult]], None]] = None,
+    browser_pool: Optional[BrowserPool] = None,
+    previous_specs: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> List[SpecResult]:
+    """process_specs with each stage of all specs running concurrently."""
+    previous_specs = previous_specs or {}
+    in_flight = asyncio.Semaphore(concurrency)
+    active = {
+        seed_url: spec_stages_async(
+            seed_url, store, min_delay, max_delay, in_flight, budget,
+            fetch_cache=fetch_cache, journal=journal, item_xml=item_xml, browser_pool=browser_pool,
+        )
+        for seed_url in seed_urls
+    }
+    finished: Dict[str, SpecResult] = {}
+
+    async def advance(seed_url: str, stages: AsyncIterator[Optional[SpecResult]]) -> None:
+        try:
+            res = await stages.__anext__()
+        except Exception as exc:  # noqa: BLE001
+            del active[seed_url]
+            res = spec_failed(seed_url, exc, on_spec_finished, previous_specs.get(seed_url))
+            if res is not None:
+                finished[seed_url] = res
+            return
+        if res is not None:
+            del active[seed_url]
+            finished[seed_url] = keep_previous_pages(res, previous_specs.get(seed_url))
+            spec_done(res, on_spec_finished)
+
+    while active:
+        await asyncio.gather(*(advance(url, stages) for url, stages in list(active.items())))
+    return [finished[url] for url in seed_urls if url in finished]
+
+
+def process_queue(
+    queue: CrawlQueue,
+    store: PageStore,
+    min_delay: float,
+    max_delay: float,
+    budget: FetchBudget,
+    fetch_cache: SharedFetchCache,
+    item_xml: bool = False,
+    browser_pool: Optional[BrowserPool] = None,
+) -> List[SpecResult]:
+    """Lease spec stages from a shared work queue and run them until every spec is done.
+
+    The queue hands out every spec's seed/phase stage before any spec's guide
+    stage, and those before any reference stage, so a fetch budget is spent
+    in the same priority order as process_specs(). Running stage N replays
+    the earlier stages first; their pages are already in the queue and cost
+    no requests. While other workers still hold leases this worker waits, so
+    it can take over specs whose lease expires. A stage the fetch budget cuts
+    short goes back to the queue (its finished pages are reused by whoever
+    leases it next) and this worker stops.
+    """
+    results: List[SpecResult] = []
+    while budget.exhausted_by is None:
+        lease = queue.lease_spec()
+        if lease is None:
+            if not queue.outstanding():
+                break
+            time.sleep(QUEUE_POLL_SECONDS)
+            continue
+        seed_url = lease.seed_url
+        stages = spec_stages(
+            seed_url, store, min_delay, max_delay, budget,
+            browser_pool=browser_pool, fetch_cache=fetch_cache, item_xml=item_xml,
+        )
+        try:
+            for _ in range(lease.stage + 1):
+                res = next(stages)
+        except BudgetExhausted as exc:
+            queue.release_spec(seed_url)
+            spec_failed(seed_url, exc, None)
+            continue
         except Exception as exc:  # noqa: BLE001
-            result.warnings.append(f"Failed to download referenced page {url}: {exc}")
+            queue.fail_spec(seed_url, str(exc))
+            spec_failed(seed_url, exc, None)
+            continue
+        # The budget only runs out by refusing a fetch, so it refused one of this stage's pages.
+        deferred = budget.exhausted_by is not None
+        if res is None:
+            if deferred:
+                queue.release_spec(seed_url)
+                print(f"  - DEFERRED {seed_url}: {PRIORITY_LABELS[lease.stage]} past the fetch budget")
+            else:
+                queue.advance_spec(seed_url)
+            continue
+        if deferred:
+            queue.release_spec(seed_url)
+        else:
+            queue.finish_spec(seed_url, spec_manifest_entry(res))
+        results.append(res)
+        spec_done(res, None)
+    return results
+
+
+def spec_done(res: SpecResult, on_spec_finished: Optional[Callable[[str, Optional[SpecResult]], None]]) -> None:
+    report_spec_result(res)
+    if on_spec_finished is not None:
+        on_spec_finished(res.seed_url, res)
+
+
+def spec_failed(
+    seed_url: str,
+    exc: Exception,
+    on_spec_finished: Optional[Callable[[str, Optional[SpecResult]], None]],
+    previous: Optional[Dict[str, Any]] = None,
+) -> Optional[SpecResult]:
+    """Report a spec that produced no result.
+
+    When the previous manifest has the spec (``previous``, passed for
+    budget-limited runs), that entry is carried over unchanged (its files are
+    still on disk) and returned as the spec's result; if the fetch budget
+    refused its seed guide, every page counts as deferred.
+    """
+    status = "DEFERRED" if isinstance(exc, BudgetExhausted) else "FAILED"
+    print(f"  - {status} {seed_url}: {exc}")
+    if previous is not None:
+        res = carried_over_result(previous, exc)
+        spec_done(res, on_spec_finished)
+        return res
+    if on_spec_finished is not None:
+        on_spec_finished(seed_url, None)
+    return None
+
+
+def carried_over_result(previous: Dict[str, Any], exc: Exception) -> SpecResult:
+    """The previous manifest's entry for a spec this run could not download, as its result."""
+    res = spec_result_from_entry(previous)
+    if isinstance(exc, BudgetExhausted):
+        res.warnings = [
+            f"Deferred {len(res.guides)} pages past the fetch budget; kept the previous run's copies, "
+            "rerun with --resume to fetch them"
+        ]
+        res.deferred_pages = len(res.guides)
+    else:
+        res.warnings = [f"Failed to download the spec ({exc}); kept the previous run's copies of {len(res.guides)} pages"]
+    return res
+
+
+def keep_previous_pages(res: SpecResult, previous: Optional[Dict[str, Any]]) -> SpecResult:
+    """Add the previous manifest's pages a spec cut short by the fetch budget did not get to.
+
+    Deferred pages were neither fetched nor overwritten, so the previous run's
+    files are still in place; without them the spec's manifest entry would
+    shrink until a --resume run completes it.
+    """
+    if not res.deferred_pages or previous is None:
+        return res
+    fetched = {g.url for g in res.guides}
+    kept = [g for g in spec_result_from_entry(previous).guides if g.url not in fetched]
+    if kept:
+        res.guides.extend(kept)
+        res.warnings.append(f"Kept the previous run's copies of {len(kept)} pages in place of deferred ones")
+    return res
+
+
+def lost_specs(seed_urls: List[str], previous: Optional[Dict[str, Any]]) -> List[str]:
+    """Seed URLs of the previous manifest's specs that are not among ``seed_urls``.
+
+    Every spec this run processes ends up in its manifest (failed ones carry
+    over their previous entry), so these are the specs the manifest would lose.
+    """
+    if previous is None:
+        return []
+    wanted = set(seed_urls)
+    return sorted(spec["seed_url"] for spec in previous.get("specs", []) if spec["seed_url"] not in wanted)
+
+
+def spec_manifest_entry(r: SpecResult) -> Dict[str, Any]:
+    return {
+        "spec_key": r.spec_key,
+        "seed_url": r.seed_url,
+        "layout": r.layout,
+        "covered_specs": r.covered_specs,
+        "downloaded_pages": [
+            {
+                "label": g.label,
+                "guide_id": g.guide_id,
+                "category": g.category,
+                "url": g.url,
+                "local_path": g.local_path,
+                "etag": g.etag,
+                "last_modified": g.last_modified,
+                "content_length": g.content_length,
+                "fetched_at_epoch": g.fetched_at_epoch,
+                "spec_path": g.spec_path,
+                "entity_key": g.entity_key,
+                "aliases": g.aliases,
+                "timing": g.timing,
+                "markup_fingerprint": g.markup_fingerprint,
+            }
+            for g in sorted(r.guides, key=lambda x: (x.category, x.url))
+        ],
+        "warnings": r.warnings,
+    }
+
+
+def spec_result_from_entry(entry: Dict[str, Any]) -> SpecResult:
+    """Rebuild a SpecResult from its manifest entry (the inverse of spec_manifest_entry)."""
+    known_fields = set(GuideRecord.__dataclass_fields__)
+    return SpecResult(
+        spec_key=entry["spec_key"],
+        seed_url=entry["seed_url"],
+        layout=entry.get("layout", "single_spec"),
+        covered_specs=list(entry.get("covered_specs", [])),
+        guides=[
+            GuideRecord(**{k: v for k, v in page.items() if k in known_fields})
+            for page in entry.get("downloaded_pages", [])
+        ],
+        warnings=list(entry.get("warnings", [])),
+    )
+
+
+def manifest_summary(results: List[SpecResult], deferred_pages: Optional[int] = None) -> Dict[str, Any]:
+    """Run-level manifest fields; the spec entries themselves are streamed as specs finish.
+
+    ``deferred_pages`` is the fetch budget's count of refused fetches. It also
+    covers specs that left no result because their seed guide was refused;
+    without it the specs' own counts are summed.
+    """
+    covered_specs: Set[str] = set()
+    for r in results:
+        covered_specs.update(r.covered_specs)
+    missing_specs = sorted(EXPECTED_SPECS - covered_specs)
+    extra_specs = sorted(covered_specs - EXPECTED_SPECS)
 
-    return result
+    return {
+        "generated_at_epoch": int(time.time()),
+        "spec_count": len(results),
+        "expected_specs": sorted(EXPECTED_SPECS),
+        "covered_specs": sorted(covered_specs),
+        "missing_specs": missing_specs,
+        "extra_specs": extra_specs,
+        "request_telemetry": summarize_request_timings(results),
+        "deferred_pages": (
+            deferred_pages if deferred_pages is not None else sum(r.deferred_pages for r in results)
+        ),
+    }
 
 
 def main() -> int:
@@ -658,45 +2575,204 @@ def main() -> int:
     parser.add_argument(
         "--min-delay",
         type=float,
-        default=1.0,
-        help="Minimum seconds between any two outbound requests (global).",
+        default=0.25,
+        help="Fastest pacing allowed: minimum seconds between any two outbound requests (global). The adaptive limiter speeds up towards this while responses are healthy.",
     )
     parser.add_argument(
         "--max-delay",
         type=float,
         default=2.5,
-        help="Maximum seconds between any two outbound requests (global jitter).",
+        help="Starting seconds between outbound requests; 429/403/5xx responses slow the pace down again.",
     )
     parser.add_argument(
         "--use-browser",
         action="store_true",
-        help="Use Playwright/Chromium to load each page (full JS render). Requires: pip install playwright && playwright install chromium. Runs sequentially.",
+        help="Use Playwright/Chromium to load each page (full JS render). Requires: pip install playwright && playwright install chromium. Combine with --async to render pages in several browser contexts at once.",
+    )
+    parser.add_argument(
+        "--browser-contexts",
+        type=int,
+        default=DEFAULT_CONTEXTS,
+        help="Number of browser contexts (one page each) in the --use-browser pool.",
+    )
+    parser.add_argument(
+        "--browser-ready-selector",
+        default=DEFAULT_READY_SELECTOR,
+        help="CSS selector that marks a --use-browser page as rendered; the page is captured as soon as it appears. The default matches the guide body or infobox filled in by WH.markup.printHtml.",
     )
     parser.add_argument(
         "--browser-wait-ms",
         type=int,
         default=3000,
-        help="Milliseconds to wait after page load when using --use-browser.",
+        help="Maximum milliseconds to wait for --browser-ready-selector after the document loads before treating the page as a soft block and fetching it again.",
+    )
+    parser.add_argument(
+        "--browser-load-all",
+        action="store_true",
+        help="With --use-browser, load every resource (images, fonts, stylesheets, third-party scripts) instead of only Wowhead documents, scripts and XHR.",
+    )
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="Process specs and their pages concurrently with asyncio. Requests still share the global --min-delay/--max-delay pacing.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Maximum in-flight requests when using --async.",
+    )
+    parser.add_argument(
+        "--force-refresh",
+        action="store_true",
+        help="Ignore ETag/Last-Modified validators from the previous manifest and re-download every page.",
+    )
+    parser.add_argument(
+        "--blob-store",
+        action="store_true",
+        help="Store each distinct page body once under blobs/ (content-addressed) and point manifest local_path at it.",
+    )
+    parser.add_argument(
+        "--hardlinks",
+        action="store_true",
+        help="With --blob-store, also hardlink each page into its per-spec folder for compatibility.",
+    )
+    parser.add_argument(
+        "--compress",
+        choices=["none", "auto", "gzip", "zstd"],
+        default="none",
+        help="Store pages compressed (.html.gz / .html.zst). auto picks zstd when zstandard is installed, else gzip. All BiScore scripts read either form.",
+    )
+    parser.add_argument(
+        "--corpus-db",
+        default=None,
+        metavar="PATH",
+        help="Store pages, their validators and the manifest in one SQLite corpus at PATH (e.g. downloads/wowhead_tbc_bis/corpus.sqlite; see scripts/corpus_db.py) instead of per-spec files and manifest.json. Bodies are deduplicated and compressed with --compress (gzip unless given). Read it back with --corpus-db on the parser, checker and extractor.",
+    )
+    parser.add_argument(
+        "--slim",
+        action="store_true",
+        help="Store a compact JSON record per page (guide markup, nav blob, guide map, links) as <file>.slim.json instead of the full HTML. The parser, checker and extractor read either form.",
+    )
+    parser.add_argument(
+        "--stream-guides",
+        action="store_true",
+        help="Read guide pages only until the nav JSON and the guide-body markup with its <noscript> copy have arrived, then close the connection and save that prefix (the trailing comments, footer and scripts are never downloaded). Gem/enchant links that only appear after the guide body (mostly in user comments) are therefore not followed, so fewer reference pages are fetched than in a full run. The reference pages themselves are still read in full.",
+    )
+    parser.add_argument(
+        "--item-xml",
+        action="store_true",
+        help=f"Fetch item= gem/enchant references from Wowhead's compact ?xml tooltip endpoint instead of full HTML pages, and collect their data (including jsonEquip) in {ITEM_REFERENCE_FILE_NAME}.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Continue an interrupted run from {JOURNAL_FILE_NAME}, fetching only pages it has not recorded.",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Stop after N network page fetches. Specs are fetched one priority class at a time (seed/phase guides, then other guides, then gem/enchant references), so the budget goes to phase guides first; the rest is left for a --resume run.",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Start no new page fetch after SECONDS of run time; like --max-requests, lower-priority pages are the ones left for a --resume run.",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="URL",
+        help="Send every request to a local cassette server (scripts/http_cassette.py serve, e.g. http://127.0.0.1:8765) instead of wowhead.com, for offline benchmarks. Saved pages and the manifest keep the real Wowhead URLs.",
+    )
+    parser.add_argument(
+        "--work-queue",
+        default=None,
+        metavar="PATH",
+        help="Share the crawl with other downloader processes or hosts through a SQLite work queue at PATH (e.g. downloads/wowhead_tbc_bis/crawl.sqlite; see scripts/crawl_queue.py). Start the same command as often as wanted: workers lease specs, fetch each page once between them and share one request rate, and the last one to finish writes the merged manifest. Once that manifest is written, the next worker to join starts a new crawl in the same queue.",
+    )
+    parser.add_argument(
+        "--worker-id",
+        default=None,
+        help="Name of this --work-queue worker in the queue (default: <hostname>-<pid>).",
+    )
+    parser.add_argument(
+        "--lease-seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="How long a --work-queue lease on a spec or page lasts without progress before another worker may take it over.",
+    )
+    parser.add_argument(
+        "--emit-lua",
+        default=None,
+        metavar="DIR",
+        help="Parse phase guides as they are saved and write each class's Lua data file to DIR as soon as its last spec finishes (same output as running parse_wowhead_html.py afterwards), then run the suspicious-data checks.",
+    )
+    parser.add_argument(
+        "--weights",
+        default="state_weights_per_spec.json",
+        help="Stat weight json used with --emit-lua.",
     )
     args = parser.parse_args()
     if args.min_delay < 0 or args.max_delay < 0:
         raise ValueError("--min-delay and --max-delay must be >= 0")
     if args.min_delay > args.max_delay:
         raise ValueError("--min-delay cannot be greater than --max-delay")
-
-    if args.use_browser and not _PLAYWRIGHT_AVAILABLE:
+    if args.concurrency < 1:
+        raise ValueError("--concurrency must be >= 1")
+    if args.browser_contexts < 1:
+        raise ValueError("--browser-contexts must be >= 1")
+    if args.replay and args.use_browser:
+        raise ValueError("--replay cannot be combined with --use-browser")
+    if args.stream_guides and args.use_browser:
+        raise ValueError("--stream-guides cannot be combined with --use-browser")
+    if args.hardlinks and not args.blob_store:
+        raise ValueError("--hardlinks requires --blob-store")
+    if args.corpus_db and (args.blob_store or args.work_queue):
+        raise ValueError("--corpus-db cannot be combined with --blob-store, --hardlinks or --work-queue")
+    if args.work_queue and (args.use_async or args.resume or args.emit_lua):
+        raise ValueError(
+            "--work-queue cannot be combined with --async, --resume or --emit-lua "
+            "(start more workers instead; the queue itself keeps progress)"
+        )
+    if args.lease_seconds <= 0:
+        raise ValueError("--lease-seconds must be > 0")
+    if args.max_requests is not None and args.max_requests < 0:
+        raise ValueError("--max-requests must be >= 0")
+    if args.deadline is not None and args.deadline < 0:
+        raise ValueError("--deadline must be >= 0")
+    budget = FetchBudget(max_requests=args.max_requests, deadline=args.deadline)
+    weights_raw: Dict[str, Dict[str, float]] = {}
+    if args.emit_lua:
+        weights_raw = json.loads(pathlib.Path(args.weights).read_text(encoding="utf-8"))
+    compression = resolve_compression(args.compress)
+    global REPLAY_BASE_URL, RATE_LIMITER, STREAM_GUIDES, _REQUEST_IDS
+    REPLAY_BASE_URL = args.replay
+    STREAM_GUIDES = args.stream_guides
+
+    if args.use_browser and not PLAYWRIGHT_AVAILABLE:
         raise RuntimeError("--use-browser requires playwright. Install with: pip install playwright && playwright install chromium")
 
     output_dir = pathlib.Path(args.output_dir).resolve()
     output_dir.mkdir(parents=True, exist_ok=True)
+    corpus: Optional[CorpusDB] = None
+    if args.corpus_db:
+        corpus = CorpusDB(pathlib.Path(args.corpus_db).resolve(), compression or DEFAULT_DB_COMPRESSION)
 
-    browser_page: Optional[Any] = None
-    playwright_context: Any = None
+    browser_pool: Optional[BrowserPool] = None
     if args.use_browser:
-        playwright_context = sync_playwright().start()
-        browser = playwright_context.chromium.launch(headless=True)
-        browser_page = browser.new_page()
-        print("[0/4] Using Playwright (Chromium) for full JS-rendered HTML")
+        browser_pool = BrowserPool(
+            size=args.browser_contexts,
+            ready_selector=args.browser_ready_selector,
+            ready_timeout_ms=args.browser_wait_ms,
+            block_resources=not args.browser_load_all,
+        )
+        print(f"[0/4] Using Playwright (Chromium) for full JS-rendered HTML ({args.browser_contexts} contexts)")
 
     if args.index_file is not None:
         index_path = args.index_file.resolve()
@@ -706,12 +2782,10 @@ def main() -> int:
         index_html = index_path.read_text(encoding="utf-8", errors="replace")
     else:
         print(f"[1/4] Fetching index: {args.index_url}")
-        if browser_page is not None:
+        if browser_pool is not None:
             index_html = fetch_via_browser(
-                args.index_url, browser_page,
-                wait_after_load_ms=args.browser_wait_ms,
-                min_delay=args.min_delay, max_delay=args.max_delay,
-            )
+                args.index_url, browser_pool, min_delay=args.min_delay, max_delay=args.max_delay
+            ).text or ""
         else:
             index_html = fetch_url(
                 args.index_url, min_delay=args.min_delay, max_delay=args.max_delay
@@ -728,87 +2802,265 @@ def main() -> int:
         )
     print(f"Found {len(pre_raid_urls)} specialization seed guides")
 
-    print("[2/4] Saving index page")
-    write_file(output_dir / "index.html", index_html)
+    previous_run = load_previous_manifest(output_dir / MANIFEST_FILE_NAME, corpus)
+    # Decided before anything is written, so a refused run leaves the output untouched.
+    lost = lost_specs(pre_raid_urls, previous_run) if budget.limited else []
+    if lost:
+        print(
+            f"A budget-limited run would drop {len(lost)} specs the previous manifest has "
+            f"({', '.join(lost[:3])}{', ...' if len(lost) > 3 else ''}) because the index no longer "
+            "links them; nothing was written. Rerun without --max-requests/--deadline to refresh the spec list."
+        )
+        if browser_pool is not None:
+            browser_pool.close()
+        if corpus is not None:
+            corpus.close()
+        return 1
 
-    print("[3/4] Processing specs sequentially")
-    results: List[SpecResult] = []
-    for seed_url in pre_raid_urls:
-        try:
-            if browser_page is not None:
-                res = process_spec(
-                    seed_url, output_dir, args.min_delay, args.max_delay,
-                    browser_page=browser_page,
-                    browser_wait_ms=args.browser_wait_ms,
-                )
-            else:
-                res = process_spec(
-                    seed_url, output_dir, args.min_delay, args.max_delay,
-                )
-            results.append(res)
+    print("[2/4] Saving index page")
+    if corpus is not None:
+        corpus.put_page(INDEX_PAGE_PATH, index_html.encode("utf-8"))
+    else:
+        write_file(output_dir / INDEX_PAGE_PATH, index_html)
+
+    previous_pages: Dict[str, Dict[str, Any]] = {}
+    if not args.force_refresh and not args.use_browser:
+        previous_pages = load_previous_pages(previous_run, output_dir, corpus)
+        if previous_pages:
+            print(f"Revalidating {len(previous_pages)} pages from the previous manifest")
+    store = PageStore(
+        root=output_dir,
+        previous_pages=previous_pages,
+        use_blobs=args.blob_store,
+        hardlinks=args.hardlinks,
+        compression=compression,
+        slim=args.slim,
+        corpus=corpus,
+    )
+    queue: Optional[CrawlQueue] = None
+    journal: Optional[DownloadJournal] = None
+    if args.work_queue:
+        queue = CrawlQueue(
+            pathlib.Path(args.work_queue).resolve(),
+            args.worker_id or f"{socket.gethostname()}-{os.getpid()}",
+            lease_seconds=args.lease_seconds,
+        )
+        worker_number = queue.register_worker()
+        if queue.start_new_crawl_if_merged():
+            print(f"Work queue {queue.path} holds a finished crawl; starting a new one")
+        added = queue.add_specs(pre_raid_urls)
+        print(f"Joined work queue {queue.path} as worker {worker_number} ({queue.worker_id}); {added} new specs queued")
+        RATE_LIMITER = SharedRateLimiter(queue)
+        _REQUEST_IDS = itertools.count(worker_number * REQUEST_ID_STRIDE + 1)
+    else:
+        journal = DownloadJournal(
+            output_dir / JOURNAL_FILE_NAME,
+            resume=args.resume,
+            storage=store.storage_options(),
+            has_page=store.has_page,
+        )
+        if journal.finished_spec_count or journal.resumed_page_count:
             print(
-                f"  - {res.spec_key}: downloaded {len(res.guides)} pages"
-                + (f", warnings={len(res.warnings)}" if res.warnings else "")
+                f"Resuming from journal: {journal.finished_spec_count} specs finished, "
+                f"{journal.resumed_page_count} pages already saved"
             )
-        except Exception as exc:  # noqa: BLE001
-            print(f"  - FAILED {seed_url}: {exc}")
-    if browser_page is not None and playwright_context is not None:
-        try:
-            browser_page.close()
-        except Exception:  # noqa: S110
-            pass
+        if journal.dropped_pages:
+            print(
+                f"Refetching {journal.dropped_pages} journaled pages that are missing "
+                "or were saved with other storage options"
+            )
+
+    pipeline: Optional[LuaPipeline] = None
+    if args.emit_lua:
+        pipeline = LuaPipeline(
+            downloads_root=output_dir,
+            output_dir=pathlib.Path(args.emit_lua),
+            weights_raw=weights_raw,
+            class_of_seed={
+                url: sanitize_slug(parse_class_and_spec_from_seed_url(url)[0] or "") for url in pre_raid_urls
+            },
+            corpus=corpus,
+        )
+        store.on_saved = lambda rec: pipeline.page_saved(rec.category, rec.local_path)
+    # Specs a budget-limited run cuts short keep the previous manifest's pages (even with --force-refresh).
+    previous_specs: Dict[str, Dict[str, Any]] = {}
+    if budget.limited and previous_run is not None:
+        previous_specs = {spec["seed_url"]: spec for spec in previous_run.get("specs", [])}
+    # Workers sharing a queue write the manifest once, from the queue, at the end.
+    manifest_stream = ManifestStream(output_dir / MANIFEST_STREAM_NAME, args.index_url) if queue is None else None
+
+    def spec_finished(seed_url: str, res: Optional[SpecResult]) -> None:
+        entry = spec_manifest_entry(res) if res is not None else None
+        if entry is not None and manifest_stream is not None:
+            manifest_stream.add_spec(entry)
+        if pipeline is not None:
+            pipeline.spec_finished(seed_url, entry)
+
+    fetch_cache: FetchCache
+    if queue is not None:
+        fetch_cache = SharedFetchCache(queue, store)
+        store.on_saved = fetch_cache.publish
+        print(f"[3/4] Processing specs leased from the work queue (worker {queue.worker_number})")
+        results = process_queue(
+            queue, store, args.min_delay, args.max_delay, budget, fetch_cache,
+            item_xml=args.item_xml, browser_pool=browser_pool,
+        )
+    elif args.use_async:
+        fetch_cache = FetchCache(store.read_path)
+        print(f"[3/4] Processing specs concurrently (asyncio, {args.concurrency} requests in flight)")
+        results = asyncio.run(
+            process_specs_async(
+                pre_raid_urls, store, args.min_delay, args.max_delay, args.concurrency, budget,
+                fetch_cache, journal=journal, item_xml=args.item_xml, on_spec_finished=spec_finished,
+                browser_pool=browser_pool, previous_specs=previous_specs,
+            )
+        )
+    else:
+        fetch_cache = FetchCache(store.read_path)
+        print("[3/4] Processing specs sequentially")
+        results = process_specs(
+            pre_raid_urls, store, args.min_delay, args.max_delay, budget,
+            fetch_cache, journal=journal, item_xml=args.item_xml, on_spec_finished=spec_finished,
+            browser_pool=browser_pool, previous_specs=previous_specs,
+        )
+    if browser_pool is not None:
         try:
-            browser_page.context.browser.close()
+            browser_pool.close()
         except Exception:  # noqa: S110
             pass
-        playwright_context.stop()
+    if journal is not None:
+        journal.close()
+    DEFAULT_POOL.close()
+    if pipeline is not None:
+        pipeline.close()
+    worker_fetches = f"Fetched {fetch_cache.fetched} distinct URLs; reused {fetch_cache.reused} across specs"
+    if isinstance(fetch_cache, SharedFetchCache):
+        worker_fetches += f", {fetch_cache.shared} of them stored by other workers"
+
+    if queue is not None:
+        if not queue.claim_merge():
+            outstanding = queue.outstanding()
+            queue.close()
+            print(f"Worker finished {len(results)} specs. {worker_fetches}")
+            if outstanding:
+                print(f"{outstanding} specs are still with other workers; the last one to finish writes the manifest.")
+            else:
+                print("Another worker already wrote the merged manifest.")
+            return 0
+        entries = queue.finished_entries()
+        results = [spec_result_from_entry(entry) for entry in entries]
+        for seed_url, error in sorted(queue.failed_specs().items()):
+            res = spec_failed(seed_url, RuntimeError(error), None, previous_specs.get(seed_url))
+            if res is not None:
+                entries.append(spec_manifest_entry(res))
+                results.append(res)
+        queue.close()
+        print(f"Merging {len(entries)} specs from the work queue")
+        manifest_stream = ManifestStream(output_dir / MANIFEST_STREAM_NAME, args.index_url)
+        for entry in entries:
+            manifest_stream.add_spec(entry)
 
     print("[4/4] Writing manifest")
-    covered_specs: Set[str] = set()
-    for r in results:
-        covered_specs.update(r.covered_specs)
-    missing_specs = sorted(EXPECTED_SPECS - covered_specs)
-    extra_specs = sorted(covered_specs - EXPECTED_SPECS)
-
-    manifest = {
-        "generated_at_epoch": int(time.time()),
-        "index_url": args.index_url,
-        "spec_count": len(results),
-        "expected_specs": sorted(EXPECTED_SPECS),
-        "covered_specs": sorted(covered_specs),
-        "missing_specs": missing_specs,
-        "extra_specs": extra_specs,
-        "specs": [
-            {
-                "spec_key": r.spec_key,
-                "seed_url": r.seed_url,
-                "layout": r.layout,
-                "covered_specs": r.covered_specs,
-                "downloaded_pages": [
-                    {
-                        "label": g.label,
-                        "guide_id": g.guide_id,
-                        "category": g.category,
-                        "url": g.url,
-                        "local_path": g.local_path,
-                    }
-                    for g in sorted(r.guides, key=lambda x: (x.category, x.url))
-                ],
-                "warnings": r.warnings,
-            }
-            for r in sorted(results, key=lambda x: x.spec_key)
-        ],
-    }
-    write_file(output_dir / "manifest.json", json.dumps(manifest, indent=2))
-
-    total_files = sum(len(r.guides) for r in results) + 2  # +index +manifest
-    print(f"Done. Wrote {total_files} files to: {output_dir}")
+    # A merged queue manifest only holds finished specs; this worker's own refusals
+    # were handed back to the queue and fetched by someone else.
+    summary = manifest_summary(results, sum(budget.deferred) if queue is None else None)
+    if args.item_xml:
+        item_db = build_item_reference_db(results, store)
+        write_file(output_dir / ITEM_REFERENCE_FILE_NAME, json.dumps(item_db, indent=2))
+        summary["item_reference_db"] = ITEM_REFERENCE_FILE_NAME
+        print(f"Wrote {len(item_db['items'])} item references to {ITEM_REFERENCE_FILE_NAME}")
+    assert manifest_stream is not None
+    manifest_stream.finish(summary)
+    manifest_stream.close()
+    manifest = compact_manifest(read_stream(manifest_stream.path))
+    missing_specs = manifest["missing_specs"]
+    extra_specs = manifest["extra_specs"]
+    previous_manifest: Optional[Dict[str, Any]] = None
+    unchanged = sum(r.unchanged_pages for r in results)
+    if corpus is not None:
+        # The database keeps the manifest it replaces (corpus_db.py previous_manifest()).
+        previous_manifest = corpus.manifest() if corpus.has_manifest() else None
+        pruned = corpus.save_manifest(manifest)
+        counts = corpus.counts()
+        corpus.close()
+        print(
+            f"Done. Stored {sum(len(r.guides) for r in results) - unchanged} pages in {corpus.path} "
+            f"({counts['bodies']} distinct bodies, {format_bytes(counts['stored_bytes'])} stored; "
+            f"pruned {pruned['bodies']} superseded bodies"
+            + (f" and {pruned['paths']} pages the manifest no longer lists)" if pruned["paths"] else ")")
+        )
+    else:
+        manifest_path = output_dir / MANIFEST_FILE_NAME
+        # Write the new manifest in full before the old one is moved aside, so a
+        # failed write never leaves the tree without a manifest.json.
+        staged_path = manifest_path.with_name(MANIFEST_FILE_NAME + ".new")
+        write_file(staged_path, json.dumps(manifest, indent=2))
+        if manifest_path.exists():
+            # Kept so parse_wowhead_html.py --previous-manifest can skip classes whose guides did not change.
+            manifest_path.replace(output_dir / PREVIOUS_MANIFEST_NAME)
+            # Parsed (or found unreadable) at startup already; None if it was corrupt.
+            previous_manifest = previous_run
+        staged_path.replace(manifest_path)
+        if args.blob_store:
+            # Blobs the replaced manifest still names survive one more run, so a page
+            # this run failed to refetch keeps its last good copy.
+            kept_manifests = [manifest] + ([previous_manifest] if previous_manifest is not None else [])
+            removed, freed = collect_blob_garbage(kept_manifests, output_dir, dry_run=False)
+            if removed:
+                print(f"Removed {removed} blobs neither manifest points at any more ({format_bytes(freed)})")
+        total_files = sum(len(r.guides) for r in results) - unchanged + 3  # +index +manifest.json/.jsonl
+        print(f"Done. Wrote {total_files} files to: {output_dir}")
+    if unchanged:
+        print(f"Skipped {unchanged} unchanged pages (HTTP 304)")
+    if previous_manifest is not None:
+        changed = changed_since(manifest, previous_manifest, GUIDE_CATEGORIES)
+        spec_keys = {spec["spec_key"] for spec in manifest["specs"]}
+        since = "the previous run" if corpus is not None else PREVIOUS_MANIFEST_NAME
+        print(
+            f"Guide markup changed for {len(changed)} of {len(spec_keys)} specs since "
+            f"{since}" + (f": {', '.join(changed)}" if 0 < len(changed) <= 10 else "")
+        )
+    print(worker_fetches)
+    print(f"Request pacing at finish: {RATE_LIMITER.describe()}")
+    if budget.limited:
+        print(f"Fetch budget: {budget.describe()}")
+    if manifest["deferred_pages"]:
+        print(f"Deferred {manifest['deferred_pages']} pages; rerun with --resume to fetch them")
+    if manifest["request_telemetry"]:
+        report_request_telemetry(manifest["request_telemetry"])
+    truncated = sum(stats.get("truncated", 0) for stats in manifest["request_telemetry"].values())
+    if truncated:
+        print(
+            f"Note: {truncated} guides were read only up to the guide payload (--stream-guides); "
+            "gem/enchant links further down were not followed, so reference pages may be missing "
+            "compared with a full download"
+        )
+    if TRANSFER_STATS.responses:
+        print(f"Transfer: {TRANSFER_STATS.describe()}")
+    if browser_pool is not None:
+        print(f"Browser: {browser_pool.describe()}")
+    if DEFAULT_POOL.connections_opened:
+        print(
+            f"HTTP connections: opened {DEFAULT_POOL.connections_opened}, "
+            f"reused {DEFAULT_POOL.connections_reused} (keep-alive)"
+        )
     if missing_specs:
         print(f"Coverage warning: missing {len(missing_specs)} specs: {', '.join(missing_specs)}")
     else:
         print("Coverage check: all expected specs represented")
     if extra_specs:
         print(f"Coverage note: found {len(extra_specs)} unexpected specs: {', '.join(extra_specs)}")
+    if pipeline is not None:
+        print(
+            f"Lua pipeline: parsed {pipeline.parsed_pages} guides, wrote {len(pipeline.written_files)} class files "
+            f"to {pathlib.Path(args.emit_lua).resolve()}"
+        )
+        for error in pipeline.errors:
+            print(f"  - pipeline error: {error}")
+        if pipeline.findings:
+            print(f"Suspicious spec entries: {len(pipeline.findings)} (run check_suspicious_data.py for details)")
+        else:
+            print("No suspicious entries found.")
     return 0
 
 
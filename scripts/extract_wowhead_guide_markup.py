@@ -7,9 +7,17 @@ empty in the raw HTML. The actual guide content (including all [item=id] and
 WH.markup.printHtml("..."). This script extracts that markup from already-
 downloaded HTML so you can get full BiS item data without running a browser.
 
+Pages saved with the downloader's --slim option are JSON records that already
+hold the printHtml argument; they are read directly.
+
+With --corpus-db the pages come from a SQLite corpus (scripts/corpus_db.py);
+the optional path then selects local_paths under that prefix, and each
+distinct body's result is cached in the database for later runs.
+
 Usage:
   python3 extract_wowhead_guide_markup.py downloads/wowhead_tbc_bis/druid-balance
   python3 extract_wowhead_guide_markup.py --items-only path/to/guide.html
+  python3 extract_wowhead_guide_markup.py --corpus-db downloads/wowhead_tbc_bis/corpus.sqlite druid-balance
 """
 
 from __future__ import annotations
@@ -19,49 +27,44 @@ import json
 import pathlib
 import re
 import sys
-from typing import List, Set, Tuple
-
-# Match WH.markup.printHtml(" ... "); the string can be huge and contain \", \\n, etc.
-# We look for printHtml( then consume a double-quoted string with allowed escapes.
-PRINT_HTML_RE = re.compile(
-    r"WH\.markup\.printHtml\s*\(\s*\"((?:[^\"\\]|\\.)*)\"\s*\)",
-    re.S,
-)
-# Fallback: sometimes the string is built from concatenation; grab first big quoted part.
-PRINT_HTML_FALLBACK_RE = re.compile(
-    r"WH\.markup\.printHtml\s*\(\s*\"((?:[^\"\\]|\\.){100,}?)\"",
-    re.S,
-)
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from corpus_db import CorpusDB
+from corpus_store import PAGE_SUFFIXES, iter_page_files, load_slim_record, page_key, read_page_text
+from guide_markup import PrintHtmlCall, iter_print_html_calls
+
+# extractions kind for cached process_text() results (bump when the output changes).
+IDS_CACHE_KIND = "guide_ids/2"
+MARKUP_ONLY_KEYS = ("markup_length", "markup_preview")
+
+# A call whose markup string is shorter than this is never taken as the guide
+# body when no call has the markup as its only argument.
+MIN_FALLBACK_PAYLOAD = 100
 
 ITEM_TAG_RE = re.compile(r"\[item=(\d+)\]")
 SPELL_TAG_RE = re.compile(r"\[spell=(\d+)\]")
 ENCHANT_TAG_RE = re.compile(r"\[enchant=(\d+)\]")
 
 
+def choose_payload_call(calls: Iterable[PrintHtmlCall]) -> Optional[PrintHtmlCall]:
+    """The first call with the markup as its only argument, else the first with a long markup string."""
+    calls = list(calls)
+    chosen = next((c for c in calls if c.single_argument), None)
+    if chosen is None:
+        chosen = next((c for c in calls if len(c.markup_js) >= MIN_FALLBACK_PAYLOAD), None)
+    return chosen
+
+
 def extract_print_html_payload(html: str) -> str | None:
     """Extract the string argument to WH.markup.printHtml("...") from guide HTML."""
-    m = PRINT_HTML_RE.search(html)
-    if m:
-        raw = m.group(1)
-        # Unescape JS string: \\ -> \, \" -> ", \n -> newline, etc.
-        return (
-            raw.replace("\\n", "\n")
-            .replace("\\r", "\r")
-            .replace("\\t", "\t")
-            .replace('\\"', '"')
-            .replace("\\\\", "\\")
-        )
-    m = PRINT_HTML_FALLBACK_RE.search(html)
-    if m:
-        raw = m.group(1)
-        return (
-            raw.replace("\\n", "\n")
-            .replace("\\r", "\r")
-            .replace("\\t", "\t")
-            .replace('\\"', '"')
-            .replace("\\\\", "\\")
-        )
-    return None
+    chosen = choose_payload_call(iter_print_html_calls(html))
+    return chosen.markup if chosen is not None else None
+
+
+def extract_slim_payload(record: dict) -> str | None:
+    """Same choice as extract_print_html_payload, made from a --slim page record."""
+    chosen = choose_payload_call(PrintHtmlCall(**call) for call in record.get("print_html") or [])
+    return chosen.markup if chosen is not None else None
 
 
 def extract_ids_from_markup(markup: str) -> Tuple[List[int], List[int], List[int]]:
@@ -77,14 +80,19 @@ def process_file(
     items_only: bool,
 ) -> dict:
     """Process one HTML file; return dict with markup and/or extracted IDs."""
-    text = path.read_text(encoding="utf-8", errors="replace")
-    payload = extract_print_html_payload(text)
+    return process_text(read_page_text(path), str(path), items_only)
+
+
+def process_text(text: str, label: str, items_only: bool) -> dict:
+    """process_file() for page text already in hand; ``label`` becomes the result's path."""
+    record = load_slim_record(text)
+    payload = extract_slim_payload(record) if record is not None else extract_print_html_payload(text)
     if not payload:
-        return {"path": str(path), "markup_found": False}
+        return {"path": label, "markup_found": False}
 
     item_ids, spell_ids, enchant_ids = extract_ids_from_markup(payload)
     out: dict = {
-        "path": str(path),
+        "path": label,
         "markup_found": True,
         "item_ids": list(dict.fromkeys(item_ids)),
         "spell_ids": list(dict.fromkeys(spell_ids)),
@@ -96,6 +104,31 @@ def process_file(
     return out
 
 
+def process_corpus(db: CorpusDB, prefix: str, items_only: bool) -> List[dict]:
+    """Results for every page in the corpus whose local_path starts with ``prefix``."""
+    prefix = prefix.strip("/")
+    results = []
+    for local_path in db.local_paths():
+        if prefix and local_path != prefix and not local_path.startswith(prefix + "/"):
+            continue
+        if not local_path.lower().endswith(PAGE_SUFFIXES):
+            continue
+        try:
+            digest = db.page_digest(local_path)
+            result = db.cached(digest, IDS_CACHE_KIND)
+            if result is None:
+                result = process_text(db.read_page(local_path), local_path, items_only=False)
+                db.cache(digest, IDS_CACHE_KIND, result)
+            result = dict(result, path=local_path)
+            if items_only:
+                for key in MARKUP_ONLY_KEYS:
+                    result.pop(key, None)
+            results.append(result)
+        except Exception as e:
+            results.append({"path": local_path, "error": str(e)})
+    return results
+
+
 def main() -> int:
     parser = argparse.ArgumentParser(
         description="Extract guide body markup and item/spell IDs from Wowhead guide HTML."
@@ -103,7 +136,9 @@ def main() -> int:
     parser.add_argument(
         "path",
         type=pathlib.Path,
-        help="Path to a single .html file or a directory of HTML files.",
+        nargs="?",
+        help="Path to a single .html / .slim.json (optionally .gz/.zst) file or a directory of them. "
+        "With --corpus-db: a local_path prefix inside the corpus (default: every page).",
     )
     parser.add_argument(
         "--items-only",
@@ -115,28 +150,58 @@ def main() -> int:
         action="store_true",
         help="Output one JSON object per file (or one combined list) to stdout.",
     )
+    parser.add_argument(
+        "--corpus-db",
+        type=pathlib.Path,
+        default=None,
+        help="Read pages from this SQLite corpus (scripts/corpus_db.py) instead of the filesystem.",
+    )
     args = parser.parse_args()
 
-    path = args.path.resolve()
-    if not path.exists():
-        print(f"Error: path does not exist: {path}", file=sys.stderr)
-        return 1
-
-    if path.is_file():
-        files = [path] if path.suffix.lower() == ".html" else []
-    else:
-        files = sorted(path.rglob("*.html"))
-
-    if not files:
-        print("No HTML files found.", file=sys.stderr)
-        return 1
-
-    results = []
-    for f in files:
+    if args.corpus_db is not None:
+        if not args.corpus_db.exists():
+            print(f"Error: corpus database does not exist: {args.corpus_db}", file=sys.stderr)
+            return 1
+        db = CorpusDB(args.corpus_db)
         try:
-            results.append(process_file(f, args.items_only))
-        except Exception as e:
-            results.append({"path": str(f), "error": str(e)})
+            results = process_corpus(db, str(args.path or ""), args.items_only)
+        finally:
+            db.close()
+        if not results:
+            print("No HTML files found.", file=sys.stderr)
+            return 1
+    else:
+        if args.path is None:
+            parser.error("path is required without --corpus-db")
+        path = args.path.resolve()
+        if not path.exists():
+            print(f"Error: path does not exist: {path}", file=sys.stderr)
+            return 1
+
+        if path.is_file():
+            files = [path] if path.name.lower().endswith(PAGE_SUFFIXES) else []
+        else:
+            files = iter_page_files(path)
+
+        if not files:
+            print("No HTML files found.", file=sys.stderr)
+            return 1
+
+        results = []
+        # The same page is often saved in several spec folders (or hardlinked from
+        # the blob store); extract each distinct body once and reuse the result.
+        by_content: Dict[str, dict] = {}
+        for f in files:
+            try:
+                key = page_key(f)
+                if key in by_content:
+                    results.append(dict(by_content[key], path=str(f)))
+                    continue
+                result = process_file(f, args.items_only)
+                by_content[key] = result
+                results.append(result)
+            except Exception as e:
+                results.append({"path": str(f), "error": str(e)})
 
     if args.json:
         print(json.dumps(results if len(results) != 1 else results[0], indent=2))
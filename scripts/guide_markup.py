@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""Locate, decode and parse Wowhead guide markup.
+
+Guide pages embed their body as a JS string literal passed to
+``WH.markup.printHtml("...", "guide-body", ...)``. ``iter_print_html_calls()``
+finds those calls with plain substring searches and walks each literal once
+to its closing quote, and ``decode_js_string()`` decodes a literal in one
+pass, so locating the markup stays linear in the page size. The parser,
+extractor and downloader all use them.
+
+``parse_markup()`` then scans a guide body once and returns a ``MarkupTree``:
+sections (a heading and the text up to the next heading), the tables in each
+section, their rows and cells, and the item references (``[item=<id>]`` tags
+and ``/tbc/item=<id>`` links) under each of those. The parser's slot logic
+and any other tool then walk that tree instead of re-running regexes over
+slices of the same 100+ KB string.
+
+The tree follows the pairing the guide parser has always used: every opening
+tag is closed by the next closing tag of its kind (``[h3]`` by the next
+``[/h2]``..``[/h6]``), tables only count inside their own section, rows are
+the table's ``<tr>`` elements or, when it has none, its ``[tr]`` tags, and
+cells likewise. ``html=True`` reads the ``<noscript>`` HTML copy of a guide
+(``<h2>``/``<table>``) instead of the markup (``[h2]``/``[table]``).
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Sequence
+
+PRINT_HTML_ANCHOR = "WH.markup.printHtml"
+# What may follow the anchor up to the opening quote, and what follows the
+# closing quote: a string second argument (the target element) or ")".
+_CALL_OPEN_PATTERN = re.compile(r'\s*\(\s*"')
+_CALL_REST_PATTERN = re.compile(r'\s*(?:,\s*"([^"]*)"|(\)))?')
+# Escapes JSON does not share with JS, plus the ones it does (kept as they are)
+# so that a match never starts inside another escape.
+_JS_ESCAPE_PATTERN = re.compile(r"\\(?:u([0-9a-fA-F]{4})|u\{([0-9a-fA-F]+)\}|x([0-9a-fA-F]{2})|(\r\n|[\s\S]))")
+_JS_ONLY_ESCAPES = {"v": "\v", "0": "\0", "u": "u"}
+_JSON_ESCAPE_CHARS = frozenset('"\\/bfnrt')
+_LINE_TERMINATORS = frozenset(("\n", "\r", "\r\n", "\u2028", "\u2029"))
+
+
+@dataclass
+class PrintHtmlCall:
+    """One ``WH.markup.printHtml("...")`` call whose first argument is a string literal."""
+
+    markup_js: str  # the literal's source text, escapes not yet decoded
+    target: Optional[str]  # a string second argument: the element rendered into
+    single_argument: bool  # the call closes right after the markup string
+
+    @property
+    def markup(self) -> str:
+        return decode_js_string(self.markup_js)
+
+
+def string_literal_end(text: str, start: int) -> int:
+    """Index of the quote closing the double-quoted JS literal whose body starts at ``start``, or -1.
+
+    A quote ends the literal when an even number of backslashes precede it;
+    every character is looked at at most twice.
+    """
+    pos = start
+    while True:
+        quote = text.find('"', pos)
+        if quote == -1:
+            return -1
+        backslash = quote
+        while backslash > start and text[backslash - 1] == "\\":
+            backslash -= 1
+        if (quote - backslash) % 2 == 0:
+            return quote
+        pos = quote + 1
+
+
+def iter_print_html_calls(page: str) -> Iterator[PrintHtmlCall]:
+    """Every printHtml call with a literal first argument, in page order."""
+    pos = page.find(PRINT_HTML_ANCHOR)
+    while pos != -1:
+        opening = _CALL_OPEN_PATTERN.match(page, pos + len(PRINT_HTML_ANCHOR))
+        if opening is None:
+            pos = page.find(PRINT_HTML_ANCHOR, pos + 1)
+            continue
+        end = string_literal_end(page, opening.end())
+        if end == -1:
+            # Quotes after this point are escaped for any later literal too.
+            return
+        rest = _CALL_REST_PATTERN.match(page, end + 1)
+        yield PrintHtmlCall(page[opening.end():end], rest.group(1), rest.group(2) is not None)
+        pos = page.find(PRINT_HTML_ANCHOR, rest.end())
+
+
+def guide_body_call(page: str) -> Optional[PrintHtmlCall]:
+    """The call that renders the guide body, if the page has one."""
+    return next((call for call in iter_print_html_calls(page) if call.target == "guide-body"), None)
+
+
+def _json_escape(m: re.Match[str]) -> str:
+    code = m.group(2) or m.group(3)
+    if code is not None:
+        return json.dumps(chr(int(code, 16)))[1:-1]
+    char = m.group(4)
+    if char is None or char in _JSON_ESCAPE_CHARS:
+        return m.group(0)
+    if char in _LINE_TERMINATORS:
+        return ""
+    return json.dumps(_JS_ONLY_ESCAPES.get(char, char))[1:-1]
+
+
+def decode_js_string(literal: str) -> str:
+    """Value of a double-quoted JS string literal, given its body.
+
+    The common escapes are JSON's, so the literal is decoded by the json
+    scanner in one pass; the few JS-only ones (``\\'``, ``\\x41``,
+    ``\\u{...}``, ``\\v``, ``\\0``, line continuations) are rewritten first
+    when present.
+    """
+    if "\\" not in literal:
+        return literal
+    try:
+        return json.loads(f'"{literal}"', strict=False)
+    except ValueError:
+        return json.loads(f'"{_JS_ESCAPE_PATTERN.sub(_json_escape, literal)}"', strict=False)
+
+
+# Tokens are grouped by their leading character ("[", "<" or "/") so the scan
+# stays on the regex engine's fast path; every branch is a named group and
+# Match.lastgroup is the token kind. Row and cell tags are recognised in both
+# syntaxes, as the guide parser has always done.
+_BB_STRUCTURE = (
+    r"(?P<heading_open>h[2-6][^\]]*)|(?P<heading_close>/h[2-6])"
+    r"|(?P<table_open>table[^\]]*)|(?P<table_close>/table)"
+)
+_HTML_STRUCTURE = (
+    r"(?P<heading_open>h[2-6][^>]*)|(?P<heading_close>/h[2-6])"
+    r"|(?P<table_open>table[^>]*)|(?P<table_close>/table)"
+)
+_BB_CELLS = (
+    r"(?P<bb_tr_open>tr)|(?P<bb_tr_close>/tr)|(?P<bb_td_open>td[^\]]*)|(?P<bb_td_close>/td)"
+    r"|(?P<item>item=\s*(?P<item_id>\d+)\s*)"
+)
+_HTML_CELLS = r"(?P<tr_open>tr[^>]*)|(?P<tr_close>/tr)|(?P<td_open>td[^>]*)|(?P<td_close>/td)"
+_LINK = r"/(?P<link>tbc/item=(?P<link_id>\d+))"
+MARKUP_TOKEN_PATTERN = re.compile(
+    rf"\[(?:{_BB_STRUCTURE}|{_BB_CELLS})\]|<(?:{_HTML_CELLS})>|{_LINK}",
+    re.I,
+)
+HTML_TOKEN_PATTERN = re.compile(
+    rf"<(?:{_HTML_STRUCTURE}|{_HTML_CELLS})>|\[(?:{_BB_CELLS})\]|{_LINK}",
+    re.I,
+)
+
+
+@dataclass
+class ItemRef:
+    item_id: int
+    link: bool  # a /tbc/item=<id> URL rather than an [item=<id>] tag
+    exact: bool  # a tag written exactly as [item=<id>], without spaces
+
+
+@dataclass
+class MarkupCell:
+    items: List[ItemRef] = field(default_factory=list)
+
+
+@dataclass
+class MarkupRow:
+    cells: List[MarkupCell] = field(default_factory=list)
+
+
+@dataclass
+class MarkupTable:
+    rows: List[MarkupRow] = field(default_factory=list)
+    items: List[ItemRef] = field(default_factory=list)
+
+
+@dataclass
+class MarkupSection:
+    """A heading and everything up to the next heading (``source[start:end]``)."""
+
+    heading: str
+    start: int
+    end: int
+    tables: List[MarkupTable] = field(default_factory=list)
+    items: List[ItemRef] = field(default_factory=list)
+
+
+@dataclass
+class MarkupTree:
+    source: str
+    html: bool
+    sections: List[MarkupSection] = field(default_factory=list)
+
+    def section_text(self, section: MarkupSection) -> str:
+        return self.source[section.start:section.end]
+
+
+@dataclass
+class _OpenRow:
+    """A row whose closing tag has not been seen yet, with its cells in both syntaxes."""
+
+    cells: List[MarkupCell] = field(default_factory=list)
+    bb_cells: List[MarkupCell] = field(default_factory=list)
+    cell: Optional[MarkupCell] = None
+    bb_cell: Optional[MarkupCell] = None
+
+    def close(self) -> MarkupRow:
+        return MarkupRow(self.cells or self.bb_cells)
+
+
+def _item_ref(m: re.Match[str]) -> ItemRef:
+    item_id = m.group("item_id")
+    if item_id is not None:
+        return ItemRef(int(item_id), link=False, exact=m.end() - m.start() == len(item_id) + 7)
+    return ItemRef(int(m.group("link_id")), link=True, exact=False)
+
+
+def parse_markup(text: str, html: bool = False) -> MarkupTree:
+    """Build the section/table/row/cell tree of a guide body in one scan.
+
+    The sweep keeps at most one open table, one open <tr> and one open [tr]
+    row, and one open cell of each syntax per row. A heading that is never
+    closed is plain text; a table, row or cell still open when its section,
+    table or row ends is dropped.
+    """
+    pattern = HTML_TOKEN_PATTERN if html else MARKUP_TOKEN_PATTERN
+    tree = MarkupTree(source=text, html=html)
+    section: Optional[MarkupSection] = None
+    table: Optional[MarkupTable] = None
+    rows: List[MarkupRow] = []
+    bb_rows: List[MarkupRow] = []
+    row: Optional[_OpenRow] = None
+    bb_row: Optional[_OpenRow] = None
+    matches = pattern.finditer(text)
+    headings = True
+    while True:
+        for m in matches:
+            kind = m.lastgroup
+            # Most frequent kinds first: guide tables are [tr]/[td] markup. No
+            # table is open outside a section, so those need no section check.
+            if kind == "bb_td_open":
+                if table is not None:
+                    if bb_row is not None and bb_row.bb_cell is None:
+                        bb_row.bb_cell = MarkupCell()
+                    if row is not None and row.bb_cell is None:
+                        row.bb_cell = MarkupCell()
+            elif kind == "bb_td_close":
+                if table is not None:
+                    if bb_row is not None and bb_row.bb_cell is not None:
+                        bb_row.bb_cells.append(bb_row.bb_cell)
+                        bb_row.bb_cell = None
+                    if row is not None and row.bb_cell is not None:
+                        row.bb_cells.append(row.bb_cell)
+                        row.bb_cell = None
+            elif kind == "bb_tr_open":
+                if table is not None and bb_row is None:
+                    bb_row = _OpenRow()
+            elif kind == "bb_tr_close":
+                if table is not None and bb_row is not None:
+                    bb_rows.append(bb_row.close())
+                    bb_row = None
+            elif kind == "item" or kind == "link":
+                if section is None:
+                    continue
+                ref = _item_ref(m)
+                section.items.append(ref)
+                if table is not None:
+                    table.items.append(ref)
+                    for open_row in (bb_row, row):
+                        if open_row is not None:
+                            if open_row.cell is not None:
+                                open_row.cell.items.append(ref)
+                            if open_row.bb_cell is not None:
+                                open_row.bb_cell.items.append(ref)
+            elif kind == "table_open":
+                if section is not None and table is None:
+                    table = MarkupTable()
+                    rows, bb_rows = [], []
+                    row = bb_row = None
+            elif kind == "table_close":
+                if table is not None:
+                    table.rows = rows or bb_rows
+                    section.tables.append(table)
+                    table = None
+            elif kind == "heading_open":
+                if not headings:
+                    continue
+                for close in matches:
+                    if close.lastgroup == "heading_close":
+                        break
+                else:
+                    # Never closed, so not a heading: what follows it still belongs to this section.
+                    matches = pattern.finditer(text, m.end())
+                    headings = False
+                    break
+                if section is not None:
+                    section.end = m.start()
+                section = MarkupSection(
+                    heading=text[m.end():close.start()], start=close.end(), end=len(text)
+                )
+                tree.sections.append(section)
+                table = None
+            elif table is None:
+                continue
+            elif kind == "tr_open":
+                if row is None:
+                    row = _OpenRow()
+            elif kind == "tr_close":
+                if row is not None:
+                    rows.append(row.close())
+                    row = None
+            elif kind == "td_open":
+                for open_row in (bb_row, row):
+                    if open_row is not None and open_row.cell is None:
+                        open_row.cell = MarkupCell()
+            elif kind == "td_close":
+                for open_row in (bb_row, row):
+                    if open_row is not None and open_row.cell is not None:
+                        open_row.cells.append(open_row.cell)
+                        open_row.cell = None
+        else:
+            return tree
+
+
+def referenced_item_ids(items: Sequence[ItemRef]) -> List[int]:
+    """IDs of the /tbc/item= links among ``items``, or of the [item=] tags when there are no links."""
+    links = [ref.item_id for ref in items if ref.link]
+    if links:
+        return links
+    return [ref.item_id for ref in items]
+
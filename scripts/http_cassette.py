@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+"""Record Wowhead responses into a cassette and replay them from a local server.
+
+Lets ``download_tbc_bis_guides.py`` be exercised and timed without touching
+wowhead.com. ``record`` builds a cassette from an existing download (every
+manifest page plus ``index.html``); ``serve`` answers the downloader's
+requests from it on localhost with configurable latency, jitter, bandwidth,
+injected 429s and injected soft-block pages (HTTP 200 interstitials), so
+concurrency, rate-limiting, caching, page-check and streaming changes can be
+benchmarked offline and repeatably.
+
+A cassette is a directory holding ``cassette.json`` (one entry per URL:
+status, headers and the body's path) and the gzip-compressed bodies under
+``blobs/``. The server behaves like a well-mannered origin: it honours
+If-None-Match with 304, sends the stored gzip body as-is to clients that
+accept gzip, and keeps connections alive. Requests are matched by URL and
+then by the downloader's fetch_key(), so any slug of an item=/spell= page
+finds the recorded copy. Anything not recorded is a 404 (including ``?xml``
+tooltips, which a corpus download does not contain).
+
+Usage:
+  python3 scripts/http_cassette.py record --cassette /tmp/wowhead-cassette
+  python3 scripts/http_cassette.py serve --cassette /tmp/wowhead-cassette --latency-ms 80 --jitter-ms 40 --throttle-rate 0.02
+  python3 scripts/download_tbc_bis_guides.py --replay http://127.0.0.1:8765 --output-dir /tmp/replay-run
+"""
+
+from __future__ import annotations
+
+import argparse
+import email.utils
+import gzip
+import http.server
+import json
+import pathlib
+import random
+import signal
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from corpus_store import XML_SUFFIX, base_page_suffix, content_digest, load_slim_record, read_page_text, write_blob
+from download_tbc_bis_guides import DEFAULT_INDEX_URL, WOWHEAD_ROOT, fetch_key, render_slim_page
+from manifest_store import load_manifest
+
+CASSETTE_FILE_NAME = "cassette.json"
+CASSETTE_FORMAT = "biscore-cassette/1"
+DEFAULT_PORT = 8765
+# What a soft block looks like: a 200 page with none of the guide/entity markup.
+INTERSTITIAL_PAGE = (
+    b"<!DOCTYPE html><html><head><title>Just a moment...</title></head>"
+    b"<body><h1>Checking your browser before accessing wowhead.com</h1></body></html>\n"
+)
+
+
+@dataclass
+class CassetteEntry:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    body: str
+
+
+@dataclass
+class Cassette:
+    root: pathlib.Path
+    origin: str = WOWHEAD_ROOT
+    entries: List[CassetteEntry] = field(default_factory=list)
+
+    def add(self, url: str, body: bytes, content_type: str, fetched_at_epoch: Optional[float] = None) -> None:
+        rel, _ = write_blob(self.root, body, "gzip", XML_SUFFIX if "xml" in content_type else ".html")
+        headers = {
+            "Content-Type": content_type,
+            "ETag": f'"{content_digest(body)[:32]}"',
+            "Last-Modified": email.utils.formatdate(fetched_at_epoch or time.time(), usegmt=True),
+        }
+        self.entries.append(CassetteEntry(url=url, status=200, headers=headers, body=rel))
+
+    def save(self) -> None:
+        payload = {
+            "format": CASSETTE_FORMAT,
+            "origin": self.origin,
+            "entries": [asdict(e) for e in sorted(self.entries, key=lambda e: e.url)],
+        }
+        (self.root / CASSETTE_FILE_NAME).write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+    @classmethod
+    def load(cls, root: pathlib.Path) -> "Cassette":
+        payload = json.loads((root / CASSETTE_FILE_NAME).read_text(encoding="utf-8"))
+        if payload.get("format") != CASSETTE_FORMAT:
+            raise ValueError(f"{root / CASSETTE_FILE_NAME} is not a {CASSETTE_FORMAT} cassette")
+        return cls(
+            root=root,
+            origin=payload.get("origin", WOWHEAD_ROOT),
+            entries=[CassetteEntry(**e) for e in payload["entries"]],
+        )
+
+
+def record_from_corpus(
+    manifest: Dict[str, Any],
+    downloads_root: pathlib.Path,
+    cassette_root: pathlib.Path,
+    index_url: str,
+) -> Tuple[Cassette, int]:
+    """Build a cassette from a download's manifest pages and index.html; return it and the missing count."""
+    cassette = Cassette(root=cassette_root)
+    seen: set = set()
+    missing = 0
+    index_path = downloads_root / "index.html"
+    if index_path.is_file():
+        cassette.add(index_url, index_path.read_bytes(), "text/html; charset=utf-8", index_path.stat().st_mtime)
+        seen.add(index_url)
+    for spec in manifest.get("specs", []):
+        for page in spec.get("downloaded_pages", []):
+            urls = [page.get("url")] + list(page.get("aliases") or [])
+            urls = [u for u in urls if u and u not in seen]
+            if not urls:
+                continue
+            path = downloads_root / page.get("local_path", "")
+            if not path.is_file():
+                missing += 1
+                continue
+            text = read_page_text(path)
+            record = load_slim_record(text)
+            if record is not None:
+                text = render_slim_page(record)
+            is_xml = base_page_suffix(path) == XML_SUFFIX
+            content_type = "text/xml; charset=utf-8" if is_xml else "text/html; charset=utf-8"
+            for url in urls:
+                cassette.add(url, text.encode("utf-8"), content_type, page.get("fetched_at_epoch"))
+                seen.add(url)
+    cassette.save()
+    return cassette, missing
+
+
+@dataclass
+class ReplayOptions:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    throttle_rate: float = 0.0
+    interstitial_rate: float = 0.0
+    bandwidth_kbps: float = 0.0
+    retry_after: int = 1
+    seed: Optional[int] = None
+
+
+class ReplayServer(http.server.ThreadingHTTPServer):
+    """Threaded HTTP/1.1 server answering requests from a loaded cassette."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], cassette: Cassette, options: ReplayOptions) -> None:
+        super().__init__(address, ReplayHandler)
+        self.cassette = cassette
+        self.options = options
+        self.by_url: Dict[str, CassetteEntry] = {}
+        self.by_key: Dict[str, CassetteEntry] = {}
+        for entry in cassette.entries:
+            self.by_url[entry.url] = entry
+            self.by_key.setdefault(fetch_key(entry.url), entry)
+        self.stats: Counter = Counter()
+        self.interstitials = 0
+        self.bytes_sent = 0
+        self.cut_short = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(options.seed)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def lookup(self, path: str) -> Optional[CassetteEntry]:
+        url = self.cassette.origin + path
+        return self.by_url.get(url) or self.by_key.get(fetch_key(url))
+
+    def draw(self) -> Tuple[float, bool, bool]:
+        """Latency (seconds) for the next response, whether to throttle it and whether to soft-block it."""
+        opts = self.options
+        with self._lock:
+            delay = opts.latency_ms + self._rng.uniform(-opts.jitter_ms, opts.jitter_ms)
+            throttle = self._rng.random() < opts.throttle_rate
+            interstitial = self._rng.random() < opts.interstitial_rate
+        return max(0.0, delay) / 1000.0, throttle, interstitial
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self.stats[status] += 1
+
+    def count_interstitial(self) -> None:
+        with self._lock:
+            self.interstitials += 1
+
+    def count_body(self, sent: int, complete: bool) -> None:
+        with self._lock:
+            self.bytes_sent += sent
+            self.cut_short += int(not complete)
+
+    def describe(self) -> str:
+        total = sum(self.stats.values())
+        detail = ", ".join(f"{code}: {n}" for code, n in sorted(self.stats.items()))
+        if self.interstitials:
+            detail += f"; {self.interstitials} of the 200s were soft-block pages"
+        if self.cut_short:
+            detail += f"; {self.cut_short} bodies closed early by the client"
+        if not total:
+            return "0 requests"
+        return f"{total} requests ({detail}), {self.bytes_sent / 1e6:.1f} MB of bodies sent"
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: ReplayServer
+
+    def log_message(self, format: str, *args: Any) -> None:  # noqa: A002
+        pass
+
+    def handle(self) -> None:
+        # Clients that stop reading mid-body (--stream-guides) reset the connection.
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send(self, status: int, headers: Dict[str, str], body: bytes = b"") -> None:
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.server.count(status)
+        if body and self.command != "HEAD":
+            self._write_body(body)
+
+    def _write_body(self, body: bytes) -> None:
+        """Send ``body``, paced to --bandwidth-kbps; a client may hang up once it has what it needs."""
+        kbps = self.server.options.bandwidth_kbps
+        chunk = max(1024, int(kbps * 1000 / 8 / 20)) if kbps else len(body)
+        sent = 0
+        try:
+            while sent < len(body):
+                self.wfile.write(body[sent:sent + chunk])
+                self.wfile.flush()
+                sent += min(chunk, len(body) - sent)
+                if kbps and sent < len(body):
+                    time.sleep(chunk * 8 / (kbps * 1000))
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        self.server.count_body(sent, sent == len(body))
+
+    def do_GET(self) -> None:  # noqa: N802
+        delay, throttle, interstitial = self.server.draw()
+        if delay:
+            time.sleep(delay)
+        if throttle:
+            self._send(429, {"Retry-After": str(self.server.options.retry_after)})
+            return
+        if interstitial:
+            self.server.count_interstitial()
+            self._send(200, {"Content-Type": "text/html; charset=utf-8"}, INTERSTITIAL_PAGE)
+            return
+        entry = self.server.lookup(self.path)
+        if entry is None:
+            self._send(404, {"Content-Type": "text/plain"}, b"not in cassette\n")
+            return
+        validators = {k: v for k, v in entry.headers.items() if k in {"ETag", "Last-Modified"}}
+        if self.headers.get("If-None-Match") == entry.headers.get("ETag"):
+            self._send(304, validators)
+            return
+        data = (self.server.cassette.root / entry.body).read_bytes()
+        accepts = (self.headers.get("Accept-Encoding") or "").lower()
+        if "gzip" in accepts:
+            self._send(entry.status, dict(entry.headers, **{"Content-Encoding": "gzip"}), data)
+        else:
+            self._send(entry.status, dict(entry.headers), gzip.decompress(data))
+
+    do_HEAD = do_GET
+
+
+def start_server(
+    cassette_root: pathlib.Path,
+    options: ReplayOptions,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> ReplayServer:
+    """Serve a cassette from a background thread (port 0 picks a free port); call shutdown() when done."""
+    server = ReplayServer((host, port), Cassette.load(cassette_root), options)
+    threading.Thread(target=server.serve_forever, name="cassette-server", daemon=True).start()
+    return server
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Record and replay Wowhead responses for offline downloader runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    record = sub.add_parser("record", help="Build a cassette from an existing download and its index.html.")
+    record.add_argument("--manifest", default="downloads/wowhead_tbc_bis/manifest.json")
+    record.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis")
+    record.add_argument("--index-url", default=DEFAULT_INDEX_URL, help="URL index.html is recorded under.")
+    record.add_argument("--cassette", required=True, help="Directory to write the cassette to.")
+    serve = sub.add_parser("serve", help="Serve a cassette on localhost for download_tbc_bis_guides.py --replay.")
+    serve.add_argument("--cassette", required=True, help="Cassette directory written by record.")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=DEFAULT_PORT)
+    serve.add_argument("--latency-ms", type=float, default=0.0, help="Base delay before each response.")
+    serve.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- variation added to --latency-ms.")
+    serve.add_argument(
+        "--throttle-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests (0-1) answered with 429 Too Many Requests.",
+    )
+    serve.add_argument(
+        "--interstitial-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of requests (0-1) answered with a 200 soft-block page instead of the recorded body.",
+    )
+    serve.add_argument(
+        "--bandwidth-kbps",
+        type=float,
+        default=0.0,
+        help="Pace each response body to this many kilobits per second (0 sends it at once).",
+    )
+    serve.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with injected 429s.")
+    serve.add_argument("--seed", type=int, default=None, help="Seed for jitter, 429 and soft-block injection, for repeatable runs.")
+    args = parser.parse_args()
+
+    cassette_root = pathlib.Path(args.cassette).resolve()
+    if args.command == "record":
+        manifest = load_manifest(pathlib.Path(args.manifest))
+        cassette_root.mkdir(parents=True, exist_ok=True)
+        cassette, missing = record_from_corpus(
+            manifest, pathlib.Path(args.downloads_root).resolve(), cassette_root, args.index_url
+        )
+        print(f"Recorded {len(cassette.entries)} responses to {cassette_root} (missing_sources={missing})")
+        return 0
+
+    if not 0.0 <= args.throttle_rate <= 1.0:
+        raise ValueError("--throttle-rate must be between 0 and 1")
+    if not 0.0 <= args.interstitial_rate <= 1.0:
+        raise ValueError("--interstitial-rate must be between 0 and 1")
+    if args.bandwidth_kbps < 0:
+        raise ValueError("--bandwidth-kbps must be >= 0")
+    options = ReplayOptions(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        throttle_rate=args.throttle_rate,
+        interstitial_rate=args.interstitial_rate,
+        bandwidth_kbps=args.bandwidth_kbps,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = ReplayServer((args.host, args.port), Cassette.load(cassette_root), options)
+    print(f"Serving {len(server.cassette.entries)} recorded responses; run the downloader with --replay {server.base_url}")
+    # Benchmark scripts stop the server with SIGTERM; still print the summary then.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Served {server.describe()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
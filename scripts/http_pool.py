@@ -0,0 +1,462 @@
+#!/usr/bin/env python3
+"""Small keep-alive HTTP(S) connection pool shared by the BiScore scripts.
+
+``urllib.request.urlopen`` opens a new TCP (and TLS) connection for every
+request, which dominates the cost of the thousands of small Wowhead and
+armory calls a full refresh makes. ``ConnectionPool`` keeps finished
+connections per host and hands them to the next request for that host:
+
+- at most ``max_idle_per_host`` idle connections are kept per host;
+- at most ``max_active_per_host`` connections per host are in use at once; a
+  request over the cap waits up to its timeout for one to come back;
+- connections idle for longer than ``idle_timeout`` seconds are closed;
+- a reused connection the server already dropped is retried once on a fresh one.
+
+``pooled_urlopen(request, timeout)`` is a drop-in for ``urllib.request.urlopen``
+as the scripts use it: it follows redirects, raises ``urllib.error.HTTPError``
+for non-2xx responses, and returns a context-manager response with
+``read()``, ``headers``, ``status`` and ``url``, plus ``connect_seconds``
+(0 on a reused connection) and ``ttfb_seconds`` (request sent to response
+headers received). The connection goes back to the pool once the body has
+been read to the end and the response is closed.
+When proxy environment variables are set it defers to urllib entirely.
+
+Callers send ``ACCEPT_ENCODING`` and read bodies with ``read_body()``, which
+undoes gzip/deflate (and brotli when the ``brotli`` or ``brotlicffi`` package
+is installed) and adds the on-the-wire and decoded sizes to ``TRANSFER_STATS``.
+``read_body_until()`` instead reads and decodes a body chunk by chunk and
+stops as soon as a caller-supplied check finds the part it needs; closing that
+response then drops the connection rather than pooling it. Send
+``STREAM_ACCEPT_ENCODING`` with it: only gzip and deflate decode incrementally.
+"""
+
+from __future__ import annotations
+
+import http.client
+import io
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import brotli
+except ModuleNotFoundError:
+    try:
+        import brotlicffi as brotli  # type: ignore[no-redef]
+    except ModuleNotFoundError:
+        brotli = None  # type: ignore[assignment]
+
+DEFAULT_MAX_IDLE_PER_HOST = 4
+DEFAULT_MAX_ACTIVE_PER_HOST = 8
+DEFAULT_IDLE_TIMEOUT_SECONDS = 30.0
+MAX_REDIRECTS = 5
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+ACCEPT_ENCODING = "gzip, deflate, br" if brotli is not None else "gzip, deflate"
+STREAM_ACCEPT_ENCODING = "gzip, deflate"
+STREAM_CHUNK_SIZE = 16 * 1024
+
+HostKey = Tuple[str, str, int]
+
+
+def format_bytes(count: int) -> str:
+    if count >= 1_000_000:
+        return f"{count / 1e6:.1f} MB"
+    return f"{count / 1e3:.1f} KB"
+
+
+class TransferStats:
+    """Thread-safe totals of response body bytes as received and after decoding."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.wire_bytes = 0
+        self.decoded_bytes = 0
+        self.closed_early = 0
+
+    def add(self, wire_bytes: int, decoded_bytes: int, closed_early: bool = False) -> None:
+        with self._lock:
+            self.responses += 1
+            self.wire_bytes += wire_bytes
+            self.decoded_bytes += decoded_bytes
+            self.closed_early += int(closed_early)
+
+    def describe(self) -> str:
+        text = f"{format_bytes(self.wire_bytes)} transferred, {format_bytes(self.decoded_bytes)} decoded"
+        if self.wire_bytes and self.decoded_bytes > self.wire_bytes:
+            text += f" ({self.decoded_bytes / self.wire_bytes:.1f}x smaller on the wire)"
+        if self.closed_early:
+            text += f"; {self.closed_early} responses read only up to the part needed"
+        return text
+
+
+TRANSFER_STATS = TransferStats()
+
+
+def decode_content(data: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo a Content-Encoding (possibly a comma-separated chain) on a response body.
+
+    A corrupt or truncated body raises ``urllib.error.URLError``, like any other
+    failed transfer, so callers retry it.
+    """
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",") if c.strip()]
+    # Encodings are listed in the order they were applied.
+    for coding in reversed(codings):
+        try:
+            if coding in {"gzip", "x-gzip"}:
+                data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            elif coding == "deflate":
+                try:
+                    data = zlib.decompress(data)
+                except zlib.error:
+                    # Some servers send raw deflate without the zlib header.
+                    data = zlib.decompress(data, -zlib.MAX_WBITS)
+            elif coding == "br":
+                if brotli is None:
+                    raise urllib.error.URLError("brotli-encoded response but no brotli decoder is installed")
+                data = brotli.decompress(data)
+            elif coding != "identity":
+                raise urllib.error.URLError(f"unsupported Content-Encoding: {coding}")
+        except zlib.error as exc:
+            raise urllib.error.URLError(f"corrupt {coding} response body: {exc}") from exc
+        except Exception as exc:
+            if brotli is not None and isinstance(exc, brotli.error):
+                raise urllib.error.URLError(f"corrupt br response body: {exc}") from exc
+            raise
+    return data
+
+
+def read_body_sized(response: Any) -> Tuple[bytes, int]:
+    """Read and decode a whole response body; return it with its on-the-wire size."""
+    raw = response.read()
+    body = decode_content(raw, response.headers.get("Content-Encoding"))
+    TRANSFER_STATS.add(len(raw), len(body))
+    return body, len(raw)
+
+
+def read_body(response: Any) -> bytes:
+    """Read a whole response body, decoding any Content-Encoding, and count its bytes."""
+    return read_body_sized(response)[0]
+
+
+class StreamDecoder:
+    """Incremental decode_content() for a body with at most one gzip or deflate coding.
+
+    Like decode_content(), a corrupt or truncated body raises ``urllib.error.URLError``.
+    """
+
+    def __init__(self, coding: str) -> None:
+        self.coding = coding
+        self._zlib: Any = zlib.decompressobj(16 + zlib.MAX_WBITS) if coding == "gzip" else None
+        self._head = b""
+
+    def decode(self, data: bytes) -> bytes:
+        if not self.coding:
+            return data
+        if self._zlib is None:
+            # deflate: the first two bytes tell a zlib header from raw deflate.
+            self._head += data
+            if len(self._head) < 2:
+                return b""
+            zlib_header = self._head[0] & 0x0F == 8 and int.from_bytes(self._head[:2], "big") % 31 == 0
+            self._zlib = zlib.decompressobj(zlib.MAX_WBITS if zlib_header else -zlib.MAX_WBITS)
+            data, self._head = self._head, b""
+        try:
+            return self._zlib.decompress(data)
+        except zlib.error as exc:
+            raise urllib.error.URLError(f"corrupt {self.coding} response body: {exc}") from exc
+
+    def flush(self) -> bytes:
+        if not self.coding:
+            return b""
+        if self._zlib is None or not self._zlib.eof:
+            raise urllib.error.URLError(f"truncated {self.coding} response body")
+        return self._zlib.flush()
+
+
+def stream_decoder(content_encoding: Optional[str]) -> Optional[StreamDecoder]:
+    """A StreamDecoder for ``content_encoding``, or None when it cannot be decoded incrementally."""
+    codings = [c.strip().lower() for c in (content_encoding or "").split(",") if c.strip() and c.strip() != "identity"]
+    if not codings:
+        return StreamDecoder("")
+    if len(codings) == 1 and codings[0] in {"gzip", "x-gzip", "deflate"}:
+        return StreamDecoder("deflate" if codings[0] == "deflate" else "gzip")
+    return None
+
+
+def read_body_until(
+    response: Any,
+    payload_end: Callable[[bytes], Optional[int]],
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Tuple[bytes, int, bool]:
+    """Read a body until ``payload_end`` says the wanted part has arrived.
+
+    ``payload_end`` gets the body decoded so far and returns the length of the
+    prefix to keep, or None to keep reading. It is called after every chunk
+    with the same growing buffer (not a copy), so it should remember how far it
+    has looked rather than rescan from the start. Returns the body (that prefix
+    when one was found), its on-the-wire size and whether a prefix was found.
+    Bodies whose encoding cannot be decoded incrementally are read whole first.
+    """
+    decoder = stream_decoder(response.headers.get("Content-Encoding"))
+    if decoder is None:
+        body, wire_bytes = read_body_sized(response)
+        end = payload_end(body)
+        return (body, wire_bytes, False) if end is None else (body[:end], wire_bytes, True)
+    read = getattr(response, "read1", None) or response.read
+    wire_bytes = 0
+    body = bytearray()
+    while True:
+        chunk = read(chunk_size)
+        if not chunk:
+            break
+        wire_bytes += len(chunk)
+        body += decoder.decode(chunk)
+        end = payload_end(body)
+        if end is not None:
+            TRANSFER_STATS.add(wire_bytes, len(body), closed_early=True)
+            return bytes(body[:end]), wire_bytes, True
+    body += decoder.flush()
+    TRANSFER_STATS.add(wire_bytes, len(body))
+    end = payload_end(body)
+    return (bytes(body), wire_bytes, False) if end is None else (bytes(body[:end]), wire_bytes, True)
+
+
+class PooledResponse:
+    """urllib-style response that returns its connection to the pool on close."""
+
+    def __init__(
+        self,
+        pool: "ConnectionPool",
+        key: HostKey,
+        conn: http.client.HTTPConnection,
+        response: http.client.HTTPResponse,
+        url: str,
+        connect_seconds: float = 0.0,
+        ttfb_seconds: float = 0.0,
+    ) -> None:
+        self._pool = pool
+        self._key = key
+        self._conn: Optional[http.client.HTTPConnection] = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.code = response.status
+        self.reason = response.reason
+        self.msg = response.reason
+        self.headers = response.headers
+        self.connect_seconds = connect_seconds
+        self.ttfb_seconds = ttfb_seconds
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        return self._response.read(amt)
+
+    def read1(self, amt: int = -1) -> bytes:
+        return self._response.read1(amt)
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self._response.getheader(name, default)
+
+    def info(self) -> Any:
+        return self.headers
+
+    def geturl(self) -> str:
+        return self.url
+
+    def getcode(self) -> int:
+        return self.status
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is None:
+            return
+        # Only a fully read keep-alive response leaves the connection reusable.
+        reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        if reusable:
+            self._pool.release(self._key, conn)
+        else:
+            self._pool.discard(self._key, conn)
+
+    def __enter__(self) -> "PooledResponse":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class ConnectionPool:
+    """Thread-safe per-host pool of idle keep-alive connections.
+
+    Every connection handed out by ``_acquire`` counts against its host's
+    ``max_active_per_host`` until it comes back through ``release`` or ``discard``.
+    """
+
+    def __init__(
+        self,
+        max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST,
+        idle_timeout: float = DEFAULT_IDLE_TIMEOUT_SECONDS,
+        max_active_per_host: int = DEFAULT_MAX_ACTIVE_PER_HOST,
+    ) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.max_active_per_host = max_active_per_host
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._idle: Dict[HostKey, List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._active: Dict[HostKey, int] = {}
+        self._ssl_context = ssl.create_default_context()
+        self.connections_opened = 0
+        self.connections_reused = 0
+
+    def _acquire(self, key: HostKey, timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if not self._slot_freed.wait_for(
+                lambda: self._active.get(key, 0) < self.max_active_per_host, timeout
+            ):
+                raise TimeoutError(f"no free connection to {key[1]} within {timeout:g}s")
+            self._active[key] = self._active.get(key, 0) + 1
+            now = time.monotonic()
+            idle = self._idle.get(key, [])
+            fresh = [(c, t) for c, t in idle if now - t <= self.idle_timeout]
+            stale = [c for c, t in idle if now - t > self.idle_timeout]
+            # Most recently released last: it is the least likely to have been dropped.
+            conn = fresh.pop()[0] if fresh else None
+            self._idle[key] = fresh
+            if conn is not None:
+                self.connections_reused += 1
+            else:
+                self.connections_opened += 1
+        for old in stale:
+            old.close()
+        if conn is not None:
+            conn.timeout = timeout
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout)
+            return conn, True
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    def _free_slot(self, key: HostKey) -> None:
+        # Callers hold self._lock.
+        self._active[key] -= 1
+        self._slot_freed.notify_all()
+
+    def release(self, key: HostKey, conn: http.client.HTTPConnection) -> None:
+        """Return a connection whose response was read to the end, keeping it idle for reuse."""
+        with self._lock:
+            self._free_slot(key)
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def discard(self, key: HostKey, conn: http.client.HTTPConnection) -> None:
+        """Close a connection that cannot be reused and free its slot."""
+        conn.close()
+        with self._lock:
+            self._free_slot(key)
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c, _ in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes],
+        timeout: float,
+    ) -> PooledResponse:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in {"http", "https"}:
+            raise urllib.error.URLError(f"unsupported URL scheme: {scheme}")
+        port = parts.port or (443 if scheme == "https" else 80)
+        key: HostKey = (scheme, parts.hostname or "", port)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        send_headers = {"Host": parts.netloc, "Connection": "keep-alive"}
+        send_headers.update(headers)
+        for attempt in range(2):
+            conn, reused = self._acquire(key, timeout)
+            try:
+                started = time.monotonic()
+                if not reused:
+                    conn.connect()
+                sent = time.monotonic()
+                conn.request(method, target, body=body, headers=send_headers)
+                response = conn.getresponse()
+                first_byte = time.monotonic()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as exc:
+                self.discard(key, conn)
+                # The server may close an idle keep-alive socket at any time;
+                # only a fresh connection failing is a real error.
+                if reused and attempt == 0:
+                    continue
+                raise urllib.error.URLError(exc) from exc
+            except OSError as exc:
+                self.discard(key, conn)
+                if isinstance(exc, TimeoutError):
+                    raise
+                raise urllib.error.URLError(exc) from exc
+            except BaseException:
+                self.discard(key, conn)
+                raise
+            return PooledResponse(
+                self, key, conn, response, url,
+                connect_seconds=sent - started,
+                ttfb_seconds=first_byte - sent,
+            )
+        raise AssertionError("unreachable")
+
+    def open(self, request: urllib.request.Request, timeout: float = 30.0) -> PooledResponse:
+        """Send ``request`` like ``urllib.request.urlopen`` but over a pooled connection."""
+        method = request.get_method()
+        url = request.full_url
+        body = request.data if isinstance(request.data, bytes) else None
+        headers = dict(request.header_items())
+        if body is not None and not any(k.lower() == "content-length" for k in headers):
+            headers["Content-Length"] = str(len(body))
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers, body, timeout)
+            status = response.status
+            if 200 <= status < 300:
+                return response
+            with response:
+                payload = response.read()
+            location = response.headers.get("Location")
+            if status in REDIRECT_CODES and location:
+                url = urllib.parse.urljoin(url, location)
+                if status == 303 or (status in {301, 302} and method == "POST"):
+                    method, body = "GET", None
+                    headers = {
+                        k: v for k, v in headers.items() if k.lower() not in {"content-type", "content-length"}
+                    }
+                continue
+            raise urllib.error.HTTPError(url, status, response.reason, response.headers, io.BytesIO(payload))
+        raise urllib.error.HTTPError(url, status, "too many redirects", response.headers, None)
+
+
+DEFAULT_POOL = ConnectionPool()
+
+
+def pooled_urlopen(request: urllib.request.Request, timeout: float = 30.0) -> Any:
+    """``urllib.request.urlopen`` replacement that reuses keep-alive connections."""
+    if urllib.request.getproxies():
+        return urllib.request.urlopen(request, timeout=timeout)
+    return DEFAULT_POOL.open(request, timeout=timeout)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""Parse guides while the downloader runs and write class Lua files as classes finish.
+
+Used by ``download_tbc_bis_guides.py --emit-lua DIR``. Every phase guide the
+downloader saves is queued and parsed by a background worker straight away,
+filling the same content-keyed cache that ``parse_wowhead_html.py`` uses.
+When the last spec of a class finishes, that class's spec entries (exactly as
+they will appear in the manifest) are turned into profiles and its Lua file is
+written, and the suspicious-data checks run on the already parsed guides. The
+result is the same as running the parser and checker after the download.
+"""
+
+from __future__ import annotations
+
+import pathlib
+import queue
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from check_suspicious_data import (
+    DEFAULT_MAX_RANK_DROP_PCT,
+    DEFAULT_MAX_SLOT_DROP,
+    DEFAULT_MIN_SLOT_COUNT,
+    check_spec,
+)
+from corpus_db import CorpusDB
+from parse_wowhead_html import (
+    CLASS_FILES,
+    CLASS_MAP,
+    GUIDE_CATEGORIES,
+    LUA_FINGERPRINTS_NAME,
+    build_class_profiles,
+    guide_slots,
+    write_class_file,
+    write_lua_fingerprints,
+)
+
+PARSED_CATEGORIES = GUIDE_CATEGORIES
+
+
+class LuaPipeline:
+    """Background parse worker plus per-class completion tracking.
+
+    ``class_of_seed`` maps every seed URL of the run to its class slug (e.g.
+    "druid"); a class is complete once spec_finished() was called for all of
+    its seeds, successful or not.
+    """
+
+    def __init__(
+        self,
+        downloads_root: pathlib.Path,
+        output_dir: pathlib.Path,
+        weights_raw: Dict[str, Dict[str, float]],
+        class_of_seed: Dict[str, str],
+        corpus: Optional[CorpusDB] = None,
+    ) -> None:
+        self.downloads_root = downloads_root
+        self.corpus = corpus
+        self.output_dir = output_dir
+        self.weights_raw = weights_raw
+        self.class_of_seed = dict(class_of_seed)
+        self.parsed_pages = 0
+        self.written_files: List[str] = []
+        self.findings: List[Dict] = []
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Optional[Tuple[str, Any]]]" = queue.Queue()
+        self._queued_paths: Set[str] = set()
+        self._pending: Dict[str, Set[str]] = {}
+        for seed_url, class_slug in self.class_of_seed.items():
+            self._pending.setdefault(class_slug, set()).add(seed_url)
+        self._spec_entries: Dict[str, List[Dict]] = {}
+        self._emitted: Set[str] = set()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        self._worker = threading.Thread(target=self._run, name="lua-pipeline", daemon=True)
+        self._worker.start()
+
+    def page_saved(self, category: str, local_path: str) -> None:
+        """Queue a freshly stored page for parsing if it is a phase guide."""
+        if category not in PARSED_CATEGORIES:
+            return
+        with self._lock:
+            if local_path in self._queued_paths:
+                return
+            self._queued_paths.add(local_path)
+        self._queue.put(("parse", local_path))
+
+    def spec_finished(self, seed_url: str, spec_entry: Optional[Dict]) -> None:
+        """Record a finished spec (``None`` if it failed); emit its class when it was the last one."""
+        if spec_entry is not None:
+            # Pages restored from a resume journal never went through page_saved().
+            for page in spec_entry.get("downloaded_pages", []):
+                self.page_saved(page.get("category", ""), page.get("local_path", ""))
+        class_slug = self.class_of_seed.get(seed_url, "")
+        with self._lock:
+            if spec_entry is not None:
+                self._spec_entries.setdefault(class_slug, []).append(spec_entry)
+            pending = self._pending.get(class_slug, set())
+            pending.discard(seed_url)
+            complete = not pending and class_slug not in self._emitted
+            if complete:
+                self._emitted.add(class_slug)
+        if complete:
+            self._queue.put(("emit", class_slug))
+
+    def close(self) -> None:
+        """Flush the queue, then write empty files for classes that produced nothing."""
+        with self._lock:
+            leftover = [c for c in self._pending if c not in self._emitted]
+            self._emitted.update(leftover)
+        for class_slug in leftover:
+            self._queue.put(("emit", class_slug))
+        self._queue.put(None)
+        self._worker.join()
+        for class_token, filename in CLASS_FILES.items():
+            if filename not in self.written_files:
+                write_class_file(self.output_dir / filename, class_token, {})
+                self.written_files.append(filename)
+        if self.errors:
+            # Some class files may be incomplete; leave no record that would let --changed-only skip them.
+            (self.output_dir / LUA_FINGERPRINTS_NAME).unlink(missing_ok=True)
+            return
+        with self._lock:
+            entries = sorted((e for es in self._spec_entries.values() for e in es), key=lambda e: e["spec_key"])
+        write_lua_fingerprints(self.output_dir, entries, self.weights_raw)
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            kind, payload = job
+            try:
+                if kind == "parse":
+                    guide_slots(self.downloads_root, payload, self.corpus)
+                    self.parsed_pages += 1
+                else:
+                    self._emit(payload)
+            except Exception as exc:  # noqa: BLE001
+                self.errors.append(f"{kind} {payload}: {exc}")
+
+    def _emit(self, class_slug: str) -> None:
+        class_token = CLASS_MAP.get(class_slug)
+        if not class_token:
+            return
+        with self._lock:
+            # Same order as the manifest, so overlapping profiles resolve identically.
+            entries = sorted(self._spec_entries.get(class_slug, []), key=lambda e: e["spec_key"])
+        profiles = build_class_profiles(entries, self.downloads_root, self.weights_raw, self.corpus)
+        filename = CLASS_FILES[class_token]
+        write_class_file(self.output_dir / filename, class_token, profiles.get(class_token, {}))
+        self.written_files.append(filename)
+        for entry in entries:
+            self.findings.extend(
+                check_spec(
+                    spec_blob=entry,
+                    downloads_root=self.downloads_root,
+                    min_slot_count=DEFAULT_MIN_SLOT_COUNT,
+                    max_slot_drop=DEFAULT_MAX_SLOT_DROP,
+                    max_rank_drop_pct=DEFAULT_MAX_RANK_DROP_PCT,
+                    corpus=self.corpus,
+                )
+            )
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Streaming download manifest and its indexed, compacted form.
+
+The downloader appends to ``manifest.jsonl`` while it runs: a header line,
+then for every finished spec one ``page`` record per downloaded page followed
+by a ``spec`` record, and a closing ``summary`` record. An interrupted run
+therefore still leaves every finished spec on disk.
+
+``compact`` turns the stream into ``manifest.json``: the same layout as
+before (top-level fields plus ``specs[].downloaded_pages``) with a per-spec
+``pages_by_category`` index of page positions, so consumers find the pages
+of a category without scanning the spec.
+
+Scripts read manifests with ``load_manifest()``, which accepts either form
+(and older manifests without the index), and look pages up with
+``category_pages()``.
+
+Guide pages carry a ``markup_fingerprint``: a hash of the guide content the
+parser reads, which stays the same when only ads, timestamps or scripts on the
+page change. When the downloader replaces ``manifest.json`` it keeps the old
+one as ``manifest.previous.json``; ``changed_since()`` compares the two and
+names the specs whose guide content actually changed.
+
+Usage:
+  python3 scripts/manifest_store.py compact --stream downloads/wowhead_tbc_bis/manifest.jsonl
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import pathlib
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_STREAM_NAME = "manifest.jsonl"
+PREVIOUS_MANIFEST_NAME = "manifest.previous.json"
+STREAM_FORMAT = "biscore-manifest-stream/1"
+COMPACT_FORMAT = "biscore-manifest/2"
+INDEX_KEY = "pages_by_category"
+FINGERPRINT_KEY = "markup_fingerprint"
+
+SPEC_FIELDS = ("spec_key", "seed_url", "layout", "covered_specs", "warnings")
+
+
+class ManifestStream:
+    """Append-only JSONL manifest, safe to share between threads."""
+
+    def __init__(self, path: pathlib.Path, index_url: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = path.open("w", encoding="utf-8")
+        self._write(
+            {"type": "header", "format": STREAM_FORMAT, "index_url": index_url, "started_at_epoch": int(time.time())}
+        )
+
+    def _write(self, *records: Dict[str, Any]) -> None:
+        with self._lock:
+            for record in records:
+                self._fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._fh.flush()
+
+    def add_spec(self, spec: Dict[str, Any]) -> None:
+        """Append one record per page of a finished spec, then the spec itself."""
+        pages = [
+            dict(page, type="page", spec_key=spec["spec_key"])
+            for page in spec.get("downloaded_pages", [])
+            if isinstance(page, dict)
+        ]
+        head = {"type": "spec", **{k: spec.get(k) for k in SPEC_FIELDS}}
+        self._write(*pages, head)
+
+    def finish(self, summary: Dict[str, Any]) -> None:
+        self._write({"type": "summary", **summary})
+
+    def close(self) -> None:
+        with self._lock:
+            self._fh.close()
+
+
+def read_stream(path: pathlib.Path) -> Dict[str, Any]:
+    """Rebuild a manifest dict from a manifest.jsonl stream (finished specs only)."""
+    top: Dict[str, Any] = {}
+    summary: Dict[str, Any] = {}
+    specs: List[Dict[str, Any]] = []
+    pending: Dict[str, List[Dict[str, Any]]] = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # A run killed mid-write leaves a truncated last line.
+            continue
+        kind = record.pop("type", None)
+        if kind == "header":
+            record.pop("format", None)
+            top.update(record)
+        elif kind == "page":
+            pending.setdefault(record.pop("spec_key"), []).append(record)
+        elif kind == "spec":
+            spec = {k: record.get(k) for k in SPEC_FIELDS}
+            spec["downloaded_pages"] = pending.pop(record["spec_key"], [])
+            spec["warnings"] = spec.pop("warnings") or []
+            specs.append(spec)
+        elif kind == "summary":
+            summary = record
+    top.update(summary)
+    top.setdefault("spec_count", len(specs))
+    top["specs"] = specs
+    return top
+
+
+def index_spec(spec: Dict[str, Any]) -> Dict[str, List[int]]:
+    """category -> positions of that category's pages in spec["downloaded_pages"]."""
+    index: Dict[str, List[int]] = {}
+    for position, page in enumerate(spec.get("downloaded_pages", [])):
+        if isinstance(page, dict):
+            index.setdefault(page.get("category"), []).append(position)
+    return index
+
+
+def category_pages(spec: Dict[str, Any], category: str) -> List[Dict[str, Any]]:
+    """Pages of ``category`` in a manifest spec entry, in manifest order."""
+    index = spec.get(INDEX_KEY)
+    if index is None:
+        index = spec[INDEX_KEY] = index_spec(spec)
+    pages = spec.get("downloaded_pages", [])
+    return [pages[i] for i in index.get(category, [])]
+
+
+def spec_fingerprints(
+    spec: Dict[str, Any], categories: Optional[Iterable[str]] = None
+) -> Dict[Tuple[str, str], Optional[str]]:
+    """(category, url) -> markup fingerprint for a spec's pages in ``categories`` (default: all)."""
+    wanted = set(categories) if categories is not None else None
+    return {
+        (page.get("category"), page.get("url")): page.get(FINGERPRINT_KEY)
+        for page in spec.get("downloaded_pages", [])
+        if isinstance(page, dict) and (wanted is None or page.get("category") in wanted)
+    }
+
+
+def spec_identity(spec: Dict[str, Any]) -> Tuple[Optional[str], Optional[str]]:
+    """(spec_key, seed_url) of a manifest spec entry; unique even where spec keys repeat."""
+    return spec.get("spec_key"), spec.get("seed_url")
+
+
+def changed_since(
+    manifest: Dict[str, Any],
+    previous_manifest: Dict[str, Any],
+    categories: Optional[Iterable[str]] = None,
+) -> List[str]:
+    """Spec keys whose guide content differs between ``previous_manifest`` and ``manifest``.
+
+    Only pages in ``categories`` (default: all) are compared. Specs are matched
+    by seed URL, since several seeds can share a spec key (the feral DPS and
+    tank guides are both ``druid-feral-combat``). A spec has changed if it was
+    added or removed, if its pages differ, or if any page has a different
+    fingerprint. A page without a fingerprint (an older manifest) also counts
+    as changed. Each changed spec key is listed once.
+    """
+    categories = list(categories) if categories is not None else None
+    before = {spec_identity(spec): spec for spec in previous_manifest.get("specs", [])}
+    after = {spec_identity(spec): spec for spec in manifest.get("specs", [])}
+    changed: Set[str] = set()
+    for identity in set(before) | set(after):
+        if identity not in before or identity not in after:
+            changed.add(identity[0])
+            continue
+        old = spec_fingerprints(before[identity], categories)
+        new = spec_fingerprints(after[identity], categories)
+        if old != new or any(fingerprint is None for fingerprint in new.values()):
+            changed.add(identity[0])
+    return sorted(changed, key=lambda k: k or "")
+
+
+def compact_manifest(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """Indexed manifest.json form: specs sorted by key, each with its pages_by_category index."""
+    out: Dict[str, Any] = {"format": COMPACT_FORMAT}
+    out.update((k, v) for k, v in manifest.items() if k not in {"format", "specs"})
+    specs = []
+    for spec in sorted(manifest.get("specs", []), key=lambda s: s.get("spec_key") or ""):
+        spec = {k: v for k, v in spec.items() if k != INDEX_KEY}
+        spec[INDEX_KEY] = index_spec(spec)
+        specs.append(spec)
+    out["specs"] = specs
+    return out
+
+
+def load_manifest(path: pathlib.Path) -> Dict[str, Any]:
+    """Load manifest.json (indexed or not) or a manifest.jsonl stream."""
+    if path.suffix == ".jsonl":
+        return read_stream(path)
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def save_manifest(path: pathlib.Path, manifest: Dict[str, Any]) -> None:
+    """Write ``manifest`` back in the form ``path`` names (stream for .jsonl, else indexed JSON)."""
+    if path.suffix != ".jsonl":
+        path.write_text(json.dumps(compact_manifest(manifest), indent=2) + "\n", encoding="utf-8")
+        return
+    stream = ManifestStream(path, manifest.get("index_url", ""))
+    try:
+        for spec in manifest.get("specs", []):
+            stream.add_spec(spec)
+        stream.finish({k: v for k, v in manifest.items() if k not in {"format", "index_url", "started_at_epoch", "specs"}})
+    finally:
+        stream.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manage the streaming download manifest.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    compact = sub.add_parser("compact", help="Build the indexed manifest.json from a manifest.jsonl stream.")
+    compact.add_argument("--stream", default=f"downloads/wowhead_tbc_bis/{MANIFEST_STREAM_NAME}")
+    compact.add_argument("--output", default=None, help=f"Defaults to {MANIFEST_FILE_NAME} next to the stream.")
+    args = parser.parse_args()
+
+    stream_path = pathlib.Path(args.stream)
+    output = pathlib.Path(args.output) if args.output else stream_path.with_name(MANIFEST_FILE_NAME)
+    manifest = read_stream(stream_path)
+    save_manifest(output, manifest)
+    pages = sum(len(s["downloaded_pages"]) for s in manifest["specs"])
+    print(f"Compacted {len(manifest['specs'])} specs ({pages} pages) into {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -4,12 +4,25 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import html
 import json
 import pathlib
 import re
 from collections import defaultdict
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
+
+from corpus_db import CorpusDB
+from corpus_store import load_slim_record, page_key, read_page_text
+from guide_markup import (
+    MarkupTable,
+    MarkupTree,
+    decode_js_string,
+    guide_body_call,
+    parse_markup,
+    referenced_item_ids,
+)
+from manifest_store import FINGERPRINT_KEY, category_pages, changed_since, load_manifest
 
 
 CLASS_MAP = {
@@ -95,6 +108,15 @@ PHASE_CATEGORY = {
     4: "phase_4",
     5: "phase_5",
 }
+# Categories whose pages feed the Lua data (pre-raid stands in for a missing phase 1).
+GUIDE_CATEGORIES = set(PHASE_CATEGORY.values()) | {"phase_pre_raid"}
+
+# Parsed slot maps keyed by page content, so guides shared by several specs
+# (or saved in several spec folders) are parsed once per run.
+_PARSED_GUIDES: Dict[str, Dict[int, List[int]]] = {}
+# Extraction-cache kind for slot maps in a corpus database; bump it whenever
+# parsing changes so stale cached results are not reused.
+SLOTS_CACHE_KIND = "guide_slots/1"
 
 
 def clean_text(value: str) -> str:
@@ -110,25 +132,10 @@ def extract_noscript(html_text: str) -> Optional[str]:
         return None
     return match.group(1)
 
-def unescape_js_string(value: str) -> str:
-    return (
-        value.replace("\\n", "\n")
-        .replace("\\r", "\r")
-        .replace("\\t", "\t")
-        .replace('\\"', '"')
-        .replace("\\/", "/")
-        .replace("\\\\", "\\")
-    )
 
 def extract_guide_markup(html_text: str) -> Optional[str]:
-    pattern = re.compile(
-        r'WH\.markup\.printHtml\(\s*"((?:[^"\\]|\\.)*)"\s*,\s*"guide-body"',
-        re.S,
-    )
-    match = pattern.search(html_text)
-    if not match:
-        return None
-    return unescape_js_string(match.group(1))
+    call = guide_body_call(html_text)
+    return call.markup if call is not None else None
 
 
 def section_slot_ids(heading_text: str, section_text: str = "") -> List[int]:
@@ -222,83 +229,82 @@ def section_slot_ids(heading_text: str, section_text: str = "") -> List[int]:
     return []
 
 
-def parse_ranked_items_from_table(table_html: str) -> List[int]:
+def parse_ranked_items_from_table(table: MarkupTable) -> List[int]:
     ranked: List[int] = []
-    rows = re.findall(r"<tr[^>]*>(.*?)</tr>", table_html, re.S | re.I)
-    if not rows:
-        rows = re.findall(r"\[tr\](.*?)\[/tr\]", table_html, re.S | re.I)
-    for row in rows:
-        cells = re.findall(r"<td[^>]*>(.*?)</td>", row, re.S | re.I)
-        if not cells:
-            cells = re.findall(r"\[td[^\]]*\](.*?)\[/td\]", row, re.S | re.I)
-        if len(cells) < 2:
+    for row in table.rows:
+        if len(row.cells) < 2:
             continue
-        item_cell = cells[1]
-        item_ids = [int(x) for x in re.findall(r"/tbc/item=(\d+)", item_cell, re.I)]
-        if not item_ids:
-            item_ids = [int(x) for x in re.findall(r"\[item=\s*(\d+)\s*\]", item_cell, re.I)]
-        for item_id in item_ids:
+        for item_id in referenced_item_ids(row.cells[1].items):
             if item_id not in ranked:
                 ranked.append(item_id)
     return ranked
 
 
-def parse_linked_item_ids(section_html: str) -> List[int]:
-    ranked: List[int] = []
-    item_ids = [int(x) for x in re.findall(r"/tbc/item=(\d+)", section_html, re.I)]
-    if not item_ids:
-        item_ids = [int(x) for x in re.findall(r"\[item=\s*(\d+)\s*\]", section_html, re.I)]
-    for item_id in item_ids:
-        if item_id not in ranked:
-            ranked.append(item_id)
-    return ranked
+def slim_guide_markup(record: Dict) -> Optional[str]:
+    """Guide-body markup from a --slim page record (same result as extract_guide_markup on the page)."""
+    for call in record.get("print_html") or []:
+        if call.get("target") == "guide-body":
+            return decode_js_string(call["markup_js"])
+    return None
+
+
+def markup_fingerprint(html_text: str) -> Optional[str]:
+    """SHA-256 of the guide content parse_guide_slots() reads from a page, or None if it has none.
+
+    That is the guide-body markup, else the <noscript> copy, so the hash
+    ignores the ads, timestamps and scripts that change on every fetch.
+    """
+    record = load_slim_record(html_text)
+    if record is not None:
+        source = slim_guide_markup(record) or record.get("noscript")
+    else:
+        source = extract_guide_markup(html_text) or extract_noscript(html_text)
+    if source is None:
+        return None
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
 
 
 def parse_guide_slots(guide_path: pathlib.Path) -> Dict[int, List[int]]:
-    html_text = guide_path.read_text(encoding="utf-8", errors="replace")
-    markup = extract_guide_markup(html_text)
+    return parse_guide_text(read_page_text(guide_path))
+
+
+def parse_guide_text(html_text: str) -> Dict[int, List[int]]:
+    """slot id -> ranked item ids from a stored page's text (full HTML or a --slim record)."""
+    record = load_slim_record(html_text)
+    markup = slim_guide_markup(record) if record is not None else extract_guide_markup(html_text)
     if markup:
-        sections = list(re.finditer(r"\[h[2-6][^\]]*\](.*?)\[/h[2-6]\]", markup, re.S | re.I))
-        source_text = markup
+        tree = parse_markup(markup)
     else:
-        noscript = extract_noscript(html_text)
+        noscript = record.get("noscript") if record is not None else extract_noscript(html_text)
         if not noscript:
             return {}
-        sections = list(re.finditer(r"<h[2-6][^>]*>(.*?)</h[2-6]>", noscript, re.S | re.I))
-        source_text = noscript
+        tree = parse_markup(noscript, html=True)
+    return parse_tree_slots(tree)
 
+
+def parse_tree_slots(tree: MarkupTree) -> Dict[int, List[int]]:
     slot_to_items: Dict[int, List[int]] = {}
 
-    for idx, match in enumerate(sections):
-        heading = clean_text(match.group(1))
-        start = match.end()
-        end = sections[idx + 1].start() if idx + 1 < len(sections) else len(source_text)
-        section_html = source_text[start:end]
-        target_slots = section_slot_ids(heading, section_html)
+    for section in tree.sections:
+        heading = clean_text(section.heading)
+        target_slots = section_slot_ids(heading, tree.section_text(section))
         if not target_slots:
             continue
 
         ranked: List[int] = []
-        if markup:
-            table_blocks = re.findall(r"\[table[^\]]*\](.*?)\[/table\]", section_html, re.S | re.I)
-            for table_inner in table_blocks:
-                table_markup = f"[table]{table_inner}[/table]"
-                parsed = parse_ranked_items_from_table(table_markup)
-                for item_id in parsed:
-                    if item_id not in ranked:
-                        ranked.append(item_id)
-                if not parsed:
-                    for item_id in [int(x) for x in re.findall(r"\[item=(\d+)\]", table_markup, re.I)]:
-                        if item_id not in ranked:
-                            ranked.append(item_id)
-        else:
-            table_blocks = re.findall(r"<table[^>]*>.*?</table>", section_html, re.S | re.I)
-            for table_html in table_blocks:
-                for item_id in parse_ranked_items_from_table(table_html):
+        for table in section.tables:
+            parsed = parse_ranked_items_from_table(table)
+            for item_id in parsed:
+                if item_id not in ranked:
+                    ranked.append(item_id)
+            if not parsed and not tree.html:
+                for item_id in [ref.item_id for ref in table.items if ref.exact]:
                     if item_id not in ranked:
                         ranked.append(item_id)
         if not ranked:
-            ranked = parse_linked_item_ids(section_html)
+            for item_id in referenced_item_ids(section.items):
+                if item_id not in ranked:
+                    ranked.append(item_id)
         if not ranked:
             continue
         for slot_id in target_slots:
@@ -306,6 +312,53 @@ def parse_guide_slots(guide_path: pathlib.Path) -> Dict[int, List[int]]:
     return slot_to_items
 
 
+def parse_guide_slots_cached(guide_path: pathlib.Path) -> Dict[int, List[int]]:
+    """parse_guide_slots memoised by page content; callers must not mutate the result."""
+    key = page_key(guide_path)
+    if key not in _PARSED_GUIDES:
+        _PARSED_GUIDES[key] = parse_guide_slots(guide_path)
+    return _PARSED_GUIDES[key]
+
+
+def corpus_guide_slots(corpus: CorpusDB, local_path: str) -> Optional[Dict[int, List[int]]]:
+    """parse_guide_slots_cached for a page in a corpus database (None if it is not stored).
+
+    Results are also kept in the database's extraction cache, so later runs
+    skip every page whose body has not changed.
+    """
+    key = corpus.page_digest(local_path)
+    if key is None:
+        return None
+    if key not in _PARSED_GUIDES:
+        cached = corpus.cached(key, SLOTS_CACHE_KIND)
+        if cached is None:
+            slots = parse_guide_text(corpus.read_page(local_path))
+            corpus.cache(key, SLOTS_CACHE_KIND, [[slot_id, ranked] for slot_id, ranked in slots.items()])
+        else:
+            slots = {slot_id: ranked for slot_id, ranked in cached}
+        _PARSED_GUIDES[key] = slots
+    return _PARSED_GUIDES[key]
+
+
+def guide_slots(
+    downloads_root: pathlib.Path,
+    relative_path: str,
+    corpus: Optional[CorpusDB] = None,
+) -> Optional[Dict[int, List[int]]]:
+    """Parsed slot map of a manifest page path, read from ``corpus`` or the download tree; None if missing.
+
+    ``relative_path`` is the manifest's local_path as written: corpus pages are
+    keyed by that exact string, which a round trip through pathlib.Path would
+    turn into backslashes on Windows.
+    """
+    if corpus is not None:
+        return corpus_guide_slots(corpus, relative_path)
+    full_path = downloads_root / relative_path
+    if not full_path.exists():
+        return None
+    return parse_guide_slots_cached(full_path)
+
+
 def merge_slot_maps(prev_slots: Dict[int, List[int]], curr_slots: Dict[int, List[int]]) -> Dict[int, List[int]]:
     """Keep prior-phase ranked items when entering a new phase."""
     merged: Dict[int, List[int]] = {}
@@ -335,20 +388,18 @@ def map_weights(raw_weights: Dict[str, float]) -> Dict[str, float]:
     return output
 
 
-def build_spec_phase_paths(spec_blob: Dict) -> Dict[int, pathlib.Path]:
-    by_category = {
-        item.get("category"): item.get("local_path")
-        for item in spec_blob.get("downloaded_pages", [])
-        if isinstance(item, dict)
-    }
-    phase_paths: Dict[int, pathlib.Path] = {}
+def build_spec_phase_paths(spec_blob: Dict) -> Dict[int, str]:
+    def last_local_path(category: str) -> Optional[str]:
+        pages = category_pages(spec_blob, category)
+        return pages[-1].get("local_path") if pages else None
+
+    phase_paths: Dict[int, str] = {}
     for phase in range(1, 6):
-        category = PHASE_CATEGORY[phase]
-        local_path = by_category.get(category)
+        local_path = last_local_path(PHASE_CATEGORY[phase])
         if not local_path and phase == 1:
-            local_path = by_category.get("phase_pre_raid")
+            local_path = last_local_path("phase_pre_raid")
         if local_path:
-            phase_paths[phase] = pathlib.Path(local_path)
+            phase_paths[phase] = local_path
     return phase_paths
 
 
@@ -356,6 +407,126 @@ def lua_quote(value: str) -> str:
     return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
 
 
+CLASS_FILES = {
+    "DRUID": "druid.lua",
+    "HUNTER": "hunter.lua",
+    "MAGE": "mage.lua",
+    "PALADIN": "paladin.lua",
+    "PRIEST": "priest.lua",
+    "ROGUE": "rogue.lua",
+    "SHAMAN": "shaman.lua",
+    "WARLOCK": "warlock.lua",
+    "WARRIOR": "warrior.lua",
+}
+
+
+def build_class_profiles(
+    specs: List[Dict],
+    downloads_root: pathlib.Path,
+    weights_raw: Dict[str, Dict[str, float]],
+    corpus: Optional[CorpusDB] = None,
+) -> Dict[str, Dict[str, Dict[int, Dict]]]:
+    """class token -> profile name -> phase -> {slots, weights} for manifest spec entries, in order."""
+    per_class_profiles: Dict[str, Dict[str, Dict[int, Dict]]] = defaultdict(lambda: defaultdict(dict))
+
+    for spec_blob in specs:
+        phase_paths = build_spec_phase_paths(spec_blob)
+        covered_specs = spec_blob.get("covered_specs", [])
+
+        for spec_key in covered_specs:
+            profile_name = PROFILE_LABELS.get(spec_key)
+            if not profile_name:
+                continue
+            class_slug = spec_key.split("_", 1)[0]
+            class_token = CLASS_MAP.get(class_slug)
+            if not class_token:
+                continue
+
+            weights = map_weights(weights_raw.get(spec_key, {}))
+            prev_slot_map: Dict[int, List[int]] = {}
+            for phase in range(1, 6):
+                slot_map: Dict[int, List[int]] = {}
+                relative_path = phase_paths.get(phase)
+                if relative_path:
+                    slot_map = guide_slots(downloads_root, relative_path, corpus) or {}
+
+                if phase > 1:
+                    slot_map = merge_slot_maps(prev_slot_map, slot_map)
+
+                if slot_map:
+                    per_class_profiles[class_token][profile_name][phase] = {
+                        "slots": slot_map,
+                        "weights": weights,
+                    }
+                    prev_slot_map = slot_map
+    return per_class_profiles
+
+
+def spec_class_tokens(spec_blob: Dict) -> Set[str]:
+    """Class tokens (e.g. "DRUID") whose Lua file a manifest spec entry contributes to."""
+    tokens = {CLASS_MAP.get(spec_key.split("_", 1)[0]) for spec_key in spec_blob.get("covered_specs", [])}
+    return {token for token in tokens if token}
+
+
+# Written next to the class files: what they were generated from (see --changed-only).
+LUA_FINGERPRINTS_NAME = ".guide_fingerprints.json"
+LUA_FINGERPRINTS_FORMAT = "biscore-lua-fingerprints/1"
+
+
+def weights_digest(weights_raw: Dict[str, Dict[str, float]]) -> str:
+    return hashlib.sha256(json.dumps(weights_raw, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def file_digest(path: pathlib.Path) -> Optional[str]:
+    return hashlib.sha256(path.read_bytes()).hexdigest() if path.is_file() else None
+
+
+def write_lua_fingerprints(output_dir: pathlib.Path, specs: List[Dict], weights_raw: Dict[str, Dict[str, float]]) -> None:
+    """Record the guide fingerprints, weights and class files the Lua in ``output_dir`` now reflects.
+
+    The record is shaped like a manifest (only guide pages, only the keys
+    changed_since() and spec_class_tokens() read), so --changed-only can
+    compare the current manifest against it.
+    """
+    record = {
+        "format": LUA_FINGERPRINTS_FORMAT,
+        "weights_sha256": weights_digest(weights_raw),
+        "class_files": {filename: file_digest(output_dir / filename) for filename in CLASS_FILES.values()},
+        "specs": [
+            {
+                "spec_key": spec_blob.get("spec_key"),
+                "seed_url": spec_blob.get("seed_url"),
+                "covered_specs": spec_blob.get("covered_specs", []),
+                "downloaded_pages": [
+                    {"category": page.get("category"), "url": page.get("url"), FINGERPRINT_KEY: page.get(FINGERPRINT_KEY)}
+                    for page in spec_blob.get("downloaded_pages", [])
+                    if page.get("category") in GUIDE_CATEGORIES
+                ],
+            }
+            for spec_blob in specs
+        ],
+    }
+    (output_dir / LUA_FINGERPRINTS_NAME).write_text(json.dumps(record, indent=2) + "\n", encoding="utf-8")
+
+
+def load_lua_fingerprints(
+    output_dir: pathlib.Path, weights_raw: Dict[str, Dict[str, float]]
+) -> Tuple[Optional[Dict], str]:
+    """The record write_lua_fingerprints() left in ``output_dir``, or None and why it cannot be used."""
+    path = output_dir / LUA_FINGERPRINTS_NAME
+    if not path.is_file():
+        return None, f"No {LUA_FINGERPRINTS_NAME} in {output_dir}"
+    try:
+        record = json.loads(path.read_text(encoding="utf-8"))
+    except json.JSONDecodeError:
+        return None, f"Unreadable {path}"
+    if record.get("format") != LUA_FINGERPRINTS_FORMAT:
+        return None, f"Unknown format in {path}"
+    if record.get("weights_sha256") != weights_digest(weights_raw):
+        return None, "Stat weights changed since the class files were generated"
+    return record, ""
+
+
 def write_class_file(path: pathlib.Path, class_token: str, profiles: Dict[str, Dict[int, Dict]]) -> None:
     lines: List[str] = []
     lines.append("BiScoreData = BiScoreData or {}")
@@ -390,67 +561,66 @@ def main() -> int:
     parser.add_argument("--downloads-root", default="downloads/wowhead_tbc_bis", help="Root directory containing downloaded wowhead html files")
     parser.add_argument("--weights", default="state_weights_per_spec.json", help="Path to stat weight json")
     parser.add_argument("--output-dir", default="BiScore/data", help="Directory for generated class lua files")
+    parser.add_argument(
+        "--previous-manifest",
+        default=None,
+        help="Manifest the existing Lua files were generated from (e.g. downloads/wowhead_tbc_bis/manifest.previous.json). Only classes with a spec whose guide markup changed since then are re-parsed and rewritten. Rerun without it after changing --weights.",
+    )
+    parser.add_argument(
+        "--changed-only",
+        action="store_true",
+        help=f"Like --previous-manifest with what the Lua files in --output-dir were last generated from, as recorded in its {LUA_FINGERPRINTS_NAME}; class files edited since are rewritten too, and a change of --weights rewrites all of them.",
+    )
+    parser.add_argument(
+        "--corpus-db",
+        default=None,
+        help="Read the manifest and pages from this SQLite corpus (scripts/corpus_db.py) instead of --manifest/--downloads-root.",
+    )
     args = parser.parse_args()
 
-    manifest = json.loads(pathlib.Path(args.manifest).read_text(encoding="utf-8"))
+    corpus = CorpusDB(pathlib.Path(args.corpus_db)) if args.corpus_db else None
+    manifest = corpus.manifest() if corpus is not None else load_manifest(pathlib.Path(args.manifest))
     weights_raw = json.loads(pathlib.Path(args.weights).read_text(encoding="utf-8"))
     downloads_root = pathlib.Path(args.downloads_root)
     output_dir = pathlib.Path(args.output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    per_class_profiles: Dict[str, Dict[str, Dict[int, Dict]]] = defaultdict(lambda: defaultdict(dict))
+    previous: Optional[Dict] = None
+    if args.previous_manifest:
+        previous = load_manifest(pathlib.Path(args.previous_manifest))
+    elif args.changed_only:
+        previous, reason = load_lua_fingerprints(output_dir, weights_raw)
+        if previous is None:
+            print(f"{reason}; regenerating every class file")
 
     specs = manifest.get("specs", [])
-    for spec_blob in specs:
-        phase_paths = build_spec_phase_paths(spec_blob)
-        covered_specs = spec_blob.get("covered_specs", [])
-
-        for spec_key in covered_specs:
-            profile_name = PROFILE_LABELS.get(spec_key)
-            if not profile_name:
-                continue
-            class_slug = spec_key.split("_", 1)[0]
-            class_token = CLASS_MAP.get(class_slug)
-            if not class_token:
-                continue
-
-            weights = map_weights(weights_raw.get(spec_key, {}))
-            prev_slot_map: Dict[int, List[int]] = {}
-            for phase in range(1, 6):
-                slot_map: Dict[int, List[int]] = {}
-                relative_path = phase_paths.get(phase)
-                if relative_path:
-                    full_path = downloads_root / relative_path
-                    if full_path.exists():
-                        slot_map = parse_guide_slots(full_path)
-
-                if phase > 1:
-                    slot_map = merge_slot_maps(prev_slot_map, slot_map)
-
-                if slot_map:
-                    per_class_profiles[class_token][profile_name][phase] = {
-                        "slots": slot_map,
-                        "weights": weights,
-                    }
-                    prev_slot_map = slot_map
-
-    class_files = {
-        "DRUID": "druid.lua",
-        "HUNTER": "hunter.lua",
-        "MAGE": "mage.lua",
-        "PALADIN": "paladin.lua",
-        "PRIEST": "priest.lua",
-        "ROGUE": "rogue.lua",
-        "SHAMAN": "shaman.lua",
-        "WARLOCK": "warlock.lua",
-        "WARRIOR": "warrior.lua",
-    }
-
-    for class_token, filename in class_files.items():
-        profiles = per_class_profiles.get(class_token, {})
-        if not profiles:
-            profiles = {}
-        write_class_file(output_dir / filename, class_token, profiles)
+    classes = set(CLASS_FILES)
+    if previous is not None:
+        changed = set(changed_since(manifest, previous, GUIDE_CATEGORIES))
+        classes = {
+            class_token
+            for spec_blob in specs + previous.get("specs", [])
+            if spec_blob.get("spec_key") in changed
+            for class_token in spec_class_tokens(spec_blob)
+        }
+        recorded = previous.get("class_files")
+        classes |= {
+            class_token
+            for class_token, filename in CLASS_FILES.items()
+            if not (output_dir / filename).exists()
+            or (recorded is not None and file_digest(output_dir / filename) != recorded.get(filename))
+        }
+        specs = [spec_blob for spec_blob in specs if spec_class_tokens(spec_blob) & classes]
+        print(f"Guide markup changed for {len(changed)} specs; regenerating {len(classes)} of {len(CLASS_FILES)} class files")
+
+    per_class_profiles = build_class_profiles(specs, downloads_root, weights_raw, corpus)
+    for class_token, filename in CLASS_FILES.items():
+        if class_token in classes:
+            write_class_file(output_dir / filename, class_token, per_class_profiles.get(class_token, {}))
+    # Classes left alone have the same guides as before, so every class file now reflects this manifest.
+    write_lua_fingerprints(output_dir, manifest.get("specs", []), weights_raw)
+    if corpus is not None:
+        corpus.close()
 
     print(f"Generated Lua data files in: {output_dir.resolve()}")
     return 0
@@ -4,12 +4,14 @@
 from __future__ import annotations
 
 import argparse
-import json
 import pathlib
 import re
 import urllib.parse
 from typing import Dict, Iterable, List, Tuple
 
+from corpus_store import BLOB_SUFFIX, base_page_suffix, compression_suffix, is_blob_path
+from manifest_store import load_manifest, save_manifest
+
 
 WINDOWS_INVALID_FILENAME_CHARS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
 WINDOWS_RESERVED_NAMES = {
@@ -80,13 +82,16 @@ def migrate_manifest(manifest: Dict, downloads_root: pathlib.Path, dry_run: bool
     for spec in manifest.get("specs", []):
         for page in iter_pages(spec):
             url = page.get("url")
-            local_path = page.get("local_path")
+            # Blob-store names are already Windows-safe; only their per-spec links need renaming.
+            path_key = "spec_path" if is_blob_path(page.get("local_path") or "") else "local_path"
+            local_path = page.get(path_key)
             if not url or not local_path:
                 continue
             old_rel = pathlib.Path(local_path)
-            new_rel = old_rel.parent / safe_filename_for_url(url)
+            stem = safe_filename_for_url(url)[: -len(BLOB_SUFFIX)]
+            new_rel = old_rel.parent / (stem + base_page_suffix(old_rel) + compression_suffix(old_rel))
             if new_rel != old_rel:
-                page["local_path"] = str(new_rel)
+                page[path_key] = str(new_rel)
                 updated_paths += 1
             old_abs = downloads_root / old_rel
             new_abs = downloads_root / new_rel
@@ -128,11 +133,11 @@ def main() -> int:
 
     manifest_path = pathlib.Path(args.manifest).resolve()
     downloads_root = pathlib.Path(args.downloads_root).resolve()
-    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest = load_manifest(manifest_path)
 
     renamed, updated_paths, missing = migrate_manifest(manifest, downloads_root, args.dry_run)
     if not args.dry_run:
-        manifest_path.write_text(json.dumps(manifest, indent=2) + "\n", encoding="utf-8")
+        save_manifest(manifest_path, manifest)
 
     mode = "DRY RUN" if args.dry_run else "APPLIED"
     print(f"[{mode}] renamed_files={renamed} updated_manifest_paths={updated_paths} missing_sources={missing}")
@@ -15,6 +15,7 @@ import xml.etree.ElementTree as ET
 from dataclasses import dataclass
 from typing import Any, Dict, List, Tuple
 
+from http_pool import ACCEPT_ENCODING, TRANSFER_STATS, pooled_urlopen, read_body
 from parse_wowhead_html import PROFILE_LABELS
 
 try:
@@ -191,20 +192,21 @@ class HttpClient:
         self.headers = {
             "User-Agent": "BiScoreAddon/1.0 (+https://classic-armory.org)",
             "Accept": "application/json, text/plain, */*",
+            "Accept-Encoding": ACCEPT_ENCODING,
         }
 
     def get_text(self, url: str) -> str:
         req = urllib.request.Request(url, headers=self.headers)
-        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
-            return resp.read().decode("utf-8", errors="replace")
+        with pooled_urlopen(req, timeout=self.timeout) as resp:
+            return read_body(resp).decode("utf-8", errors="replace")
 
     def post_json(self, url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
         data = json.dumps(payload).encode("utf-8")
         headers = dict(self.headers)
         headers["Content-Type"] = "application/json"
         req = urllib.request.Request(url, data=data, headers=headers, method="POST")
-        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
-            return json.loads(resp.read().decode("utf-8", errors="replace"))
+        with pooled_urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(read_body(resp).decode("utf-8", errors="replace"))
 
 
 class WowheadCache:
@@ -213,6 +215,17 @@ class WowheadCache:
         self.stats_cache: Dict[int, Dict[str, float]] = {}
         self.equip_cache: Dict[int, Dict[str, Any]] = {}
 
+    def load_item_db(self, path: pathlib.Path) -> int:
+        """Seed jsonEquip data from the downloader's item_reference.json; return items loaded."""
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        loaded = 0
+        for item_id, item in (payload.get("items") or {}).items():
+            equip = item.get("jsonEquip")
+            if isinstance(equip, dict) and equip:
+                self.equip_cache[int(item_id)] = equip
+                loaded += 1
+        return loaded
+
     def get_equip(self, item_id: int) -> Dict[str, Any]:
         if item_id in self.equip_cache:
             return self.equip_cache[item_id]
@@ -608,6 +621,11 @@ def main() -> int:
     parser.add_argument("--phase", type=int, default=1, choices=[1, 2, 3, 4, 5])
     parser.add_argument("--data-dir", default="BiScore/data")
     parser.add_argument("--json-out", default=None, help="Optional path to write JSON output")
+    parser.add_argument(
+        "--item-db",
+        default="downloads/wowhead_tbc_bis/item_reference.json",
+        help="item_reference.json written by download_tbc_bis_guides.py --item-xml; items found there skip the Wowhead request. Ignored if missing.",
+    )
     args = parser.parse_args()
 
     entries: List[Tuple[str, str]]
@@ -625,6 +643,9 @@ def main() -> int:
 
     client = HttpClient()
     wowhead = WowheadCache(client)
+    item_db = pathlib.Path(args.item_db)
+    if item_db.is_file():
+        wowhead.load_item_db(item_db)
 
     repo_root = pathlib.Path(__file__).resolve().parent.parent
     data_dir = pathlib.Path(args.data_dir)
@@ -685,6 +706,8 @@ def main() -> int:
         out_path.write_text(json.dumps(all_results, indent=2), encoding="utf-8")
         print(f"Wrote JSON output to {out_path.resolve()}")
 
+    if TRANSFER_STATS.responses:
+        print(f"HTTP transfer: {TRANSFER_STATS.describe()}", file=sys.stderr)
     return 0
 
 
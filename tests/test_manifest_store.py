@@ -0,0 +1,30 @@
+import pathlib
+import sys
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / "scripts"))
+
+from manifest_store import FINGERPRINT_KEY, changed_since  # noqa: E402
+
+FERAL_DPS = "https://www.wowhead.com/tbc/guide/classes/druid/feral/dps-bis-gear-pve-pre-raid"
+FERAL_TANK = "https://www.wowhead.com/tbc/guide/classes/druid/feral/tank-bis-gear-pve-pre-raid"
+
+
+def spec(seed_url: str, fingerprint: str) -> dict:
+    return {
+        "spec_key": "druid-feral-combat",
+        "seed_url": seed_url,
+        "downloaded_pages": [{"category": "phase_pre_raid", "url": seed_url, FINGERPRINT_KEY: fingerprint}],
+    }
+
+
+def test_changed_since_compares_every_seed_of_a_shared_spec_key():
+    previous = {"specs": [spec(FERAL_DPS, "a"), spec(FERAL_TANK, "b")]}
+    current = {"specs": [spec(FERAL_DPS, "changed"), spec(FERAL_TANK, "b")]}
+    assert changed_since(current, previous) == ["druid-feral-combat"]
+    assert changed_since(previous, previous) == []
+
+
+def test_changed_since_lists_a_shared_spec_key_once():
+    previous = {"specs": [spec(FERAL_DPS, "a"), spec(FERAL_TANK, "b")]}
+    current = {"specs": [spec(FERAL_DPS, "changed"), spec(FERAL_TANK, "changed")]}
+    assert changed_since(current, previous) == ["druid-feral-combat"]